@@ -2,6 +2,7 @@
 
 import { useState, useEffect, useRef } from 'react';
 import { motion, AnimatePresence } from 'framer-motion';
+import { fetchStorySegments } from './lib/storySegments';
 
 export default function BedtimeSlideshow() {
   // State for story management
@@ -246,12 +247,7 @@ export default function BedtimeSlideshow() {
       const segmentsUrl = `${baseUrl}/${storyId}/story_segments.json`;
       console.log(`Fetching story segments from: ${segmentsUrl}`);
       
-      const response = await fetch(segmentsUrl);
-      if (!response.ok) {
-        throw new Error(`Failed to load story segments: ${response.status} ${response.statusText}`);
-      }
-      
-      const data = await response.json();
+      const data = await fetchStorySegments(segmentsUrl);
       
       // Set story title from JSON or fallback to folder name
       if (data.title) {
@@ -261,7 +257,7 @@ export default function BedtimeSlideshow() {
       }
       
       // Set segments
-      setStorySegments(data.segments || data);
+      setStorySegments(data.segments);
       
       // Set audio directly through our API
       const audioUrl = `${baseUrl}/${storyId}/story_audio.mp3`;
@@ -276,7 +272,7 @@ export default function BedtimeSlideshow() {
       }
       
       // Add specific error handling for segments that reference missing images
-      setStorySegments(data.segments || data);
+      setStorySegments(data.segments);
       
       // Pre-check for images to provide better user experience
       const checkImages = async () => {
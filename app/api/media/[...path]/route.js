@@ -2,6 +2,22 @@ import { NextResponse } from 'next/server';
 import fs from 'fs';
 import path from 'path';
 
+// Pre-compressed copies written by `story_segments.py migrate --compress`
+const PRECOMPRESSED = [
+  { encoding: 'br', suffix: '.br' },
+  { encoding: 'gzip', suffix: '.gz' },
+];
+
+function precompressedCopy(request, fullPath) {
+  const accepted = (request.headers.get('accept-encoding') || '').toLowerCase();
+  for (const { encoding, suffix } of PRECOMPRESSED) {
+    if (accepted.includes(encoding) && fs.existsSync(fullPath + suffix)) {
+      return { encoding, path: fullPath + suffix };
+    }
+  }
+  return null;
+}
+
 /**
  * API route to serve media files (audio, images) from the server
  * This bypasses potential issues with static file serving on Vercel
@@ -78,18 +94,29 @@ export async function GET(request, { params }) {
       contentType = 'application/json';
     }
     
+    // JSON compresses well; serve a stored .br/.gz copy when the client accepts it
+    const compressed = ext === '.json' ? precompressedCopy(request, fullPath) : null;
+    const headers = {
+      'Content-Type': contentType,
+      'Cache-Control': 'public, max-age=86400',
+      'Access-Control-Allow-Origin': '*'
+    };
+    if (ext === '.json') {
+      headers['Vary'] = 'Accept-Encoding';
+    }
+    if (compressed) {
+      headers['Content-Encoding'] = compressed.encoding;
+      fullPath = compressed.path;
+    }
+    
     // Read file
     const fileBuffer = fs.readFileSync(fullPath);
+    headers['Content-Length'] = fileBuffer.length;
     
     // Return file with appropriate content type
     return new NextResponse(fileBuffer, {
       status: 200,
-      headers: {
-        'Content-Type': contentType,
-        'Content-Length': fileBuffer.length,
-        'Cache-Control': 'public, max-age=86400',
-        'Access-Control-Allow-Origin': '*'
-      }
+      headers
     });
     
   } catch (error) {
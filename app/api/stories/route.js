@@ -1,14 +1,21 @@
 import { NextResponse } from 'next/server';
 import fs from 'fs';
 import path from 'path';
+import { storyPageResponse } from '../../../lib/storyPages';
 
 // Base directories for stories
 const publicStoriesDir = path.join(process.cwd(), 'public', 'output');
 const storiesJsonPath = path.join(publicStoriesDir, 'stories.json');
 
-export async function GET() {
+export async function GET(request) {
   try {
-    // First try to read from stories.json
+    // Serve the precomputed listing page if story_pages.py has exported one
+    const pageResponse = storyPageResponse(request);
+    if (pageResponse) {
+      return pageResponse;
+    }
+    
+    // Otherwise read from stories.json
     if (fs.existsSync(storiesJsonPath)) {
       try {
         const storiesData = JSON.parse(fs.readFileSync(storiesJsonPath, 'utf8'));
@@ -0,0 +1,46 @@
+import { NextResponse } from 'next/server';
+
+// Local story_daemon.py job API (see bedtime_story_generator_README.md)
+const daemonUrl = process.env.STORY_DAEMON_URL || 'http://127.0.0.1:8770';
+
+async function forward(path, options = {}) {
+  try {
+    const response = await fetch(`${daemonUrl}${path}`, { cache: 'no-store', ...options });
+    const payload = await response.json();
+    return NextResponse.json(payload, { status: response.status });
+  } catch (error) {
+    console.error('Error reaching story daemon:', error);
+    return NextResponse.json({ error: 'Story daemon is not running' }, { status: 503 });
+  }
+}
+
+// GET /api/story-jobs?id=7 polls one job; without id it lists recent jobs
+export async function GET(request) {
+  const { searchParams } = new URL(request.url);
+  const id = searchParams.get('id');
+  if (id) {
+    if (!/^\d+$/.test(id)) {
+      return NextResponse.json({ error: 'Invalid job id' }, { status: 400 });
+    }
+    return forward(`/jobs/${id}`);
+  }
+  const status = searchParams.get('status');
+  return forward(status ? `/jobs?status=${encodeURIComponent(status)}` : '/jobs');
+}
+
+// POST /api/story-jobs {title, premise, segments, voice} submits an on-demand story
+export async function POST(request) {
+  let body;
+  try {
+    body = await request.json();
+  } catch (error) {
+    return NextResponse.json({ error: 'Request body must be JSON' }, { status: 400 });
+  }
+  const { title, premise, segments, voice } = body || {};
+  return forward('/jobs', {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    // Web requests are interactive, so they go ahead of batch submissions
+    body: JSON.stringify({ title, premise, segments, voice, priority: 10 }),
+  });
+}
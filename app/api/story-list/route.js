@@ -1,12 +1,19 @@
 import { NextResponse } from 'next/server';
 import fs from 'fs';
 import path from 'path';
+import { storyPageResponse } from '../../../lib/storyPages';
 
 // Path to stories.json file
 const storiesJsonPath = path.join(process.cwd(), 'public', 'output', 'stories.json');
 
-export async function GET() {
+export async function GET(request) {
   try {
+    // Serve the precomputed listing page if story_pages.py has exported one
+    const pageResponse = storyPageResponse(request);
+    if (pageResponse) {
+      return pageResponse;
+    }
+    
     // Check if stories.json exists
     if (fs.existsSync(storiesJsonPath)) {
       try {
@@ -2,9 +2,10 @@ import { NextResponse } from 'next/server';
 import fs from 'fs';
 import path from 'path';
 import { promises as fsPromises } from 'fs';
+import { expandStorySegments } from '../../../lib/storySegments';
 
-// Base directory for story files - Using absolute path for macOS
-const storyDir = '/Users/ashifsheriff/Documents/AI projects/Multi modal/output';
+// Base directory for story files: STORY_DIR, or the library the generators write to
+const storyDir = process.env.STORY_DIR || path.join(process.cwd(), 'public', 'output');
 
 // Ensure the directory exists
 try {
@@ -32,7 +33,7 @@ export async function GET(request) {
     // For JSON files, return the parsed JSON
     if (sanitizedFile === 'story_segments.json') {
       const data = await fsPromises.readFile(filePath, 'utf8');
-      return NextResponse.json(JSON.parse(data));
+      return NextResponse.json(expandStorySegments(JSON.parse(data)));
     }
     
     // For images and audio, stream the binary data
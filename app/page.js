@@ -1,6 +1,7 @@
 "use client";
 
 import { useEffect, useState } from "react";
+import { fetchStorySegments } from "../lib/storySegments";
 
 export default function Home() {
   const [stories, setStories] = useState([]);
@@ -20,10 +21,9 @@ export default function Home() {
   useEffect(() => {
     if (stories.length === 0) return;
     const story = stories[currentStoryIndex];
-    fetch(`/output/${story}/story_segments.json`)
-      .then((res) => res.json())
+    fetchStorySegments(`/output/${story}/story_segments.json`)
       .then((data) => {
-        setSegments(data);
+        setSegments(data.segments);
         setCurrentSegmentIndex(0);
       });
   }, [stories, currentStoryIndex]);
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Atomic Writes and Story Locks
+
+Shared file-writing helpers for every script that touches the story library.
+Writes go to a temp file in the target's directory, are flushed and fsynced,
+then renamed over the target. A crash therefore leaves either the old file
+or the new one, never a truncated one:
+
+    write_json_atomic(story_dir / "story_segments.json", data)
+    save_image_atomic(image, story_dir / "image_1.png")
+    with atomic_path(story_dir / "story_audio.mp3") as tmp:
+        response.stream_to_file(tmp)
+
+Read-modify-write cycles on a story folder hold its lock, an advisory
+flock on <story>/.lock. This keeps two tools, or two workers, from
+interleaving updates to the same story:
+
+    with story_lock(story_dir):
+        data = json.load(...)
+        ...
+        write_json_atomic(...)
+
+Locks are re-entrant within a thread, so helpers that take the lock can call
+each other. Pass timeout= to give up with StoryLocked instead of waiting.
+
+The SQLite databases (jobs, catalog, idea pool, regeneration queue) use WAL,
+whose index lives in shared memory on one host. When several hosts work on
+one library over a network filesystem, set STORY_SHARED_FS=1, and every
+connect() uses a rollback journal instead (see sqlite_journal_mode()).
+"""
+
+import os
+import json
+import time
+import threading
+import contextlib
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: locks only serialize threads of this process
+    fcntl = None
+
+# Constants
+LOCK_NAME = ".lock"
+LOCK_POLL_INTERVAL = 0.1  # seconds between attempts while waiting for a lock
+SHARED_FS_ENV = "STORY_SHARED_FS"
+
+
+class StoryLocked(TimeoutError):
+    """Raised when a story lock could not be taken within the timeout."""
+
+
+def _temp_path(path: Path) -> Path:
+    # Dot-prefixed so library scanners and the web app never pick it up
+    return path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+
+
+def sqlite_journal_mode() -> str:
+    """The journal mode for the library's SQLite databases: WAL, unless they are shared between hosts."""
+    return "DELETE" if os.environ.get(SHARED_FS_ENV, "") not in ("", "0") else "WAL"
+
+
+def _fsync_dir(directory: Path) -> None:
+    """Persist a rename by syncing its directory (a no-op where unsupported)."""
+    try:
+        fd = os.open(str(directory), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+@contextlib.contextmanager
+def atomic_path(path: Path) -> Iterator[Path]:
+    """Yield a temp path to write; it replaces path only if the block succeeds.
+
+    For APIs that insist on writing to a filename themselves, such as
+    response.stream_to_file().
+    """
+    path = Path(path)
+    tmp_path = _temp_path(path)
+    try:
+        yield tmp_path
+        with open(tmp_path, "rb+") as f:
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        _fsync_dir(path.parent)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+
+@contextlib.contextmanager
+def atomic_write(path: Path, mode: str = "w", **open_kwargs):
+    """Open a temp file for writing; it replaces path when the block exits cleanly."""
+    with atomic_path(path) as tmp_path:
+        with open(tmp_path, mode, **open_kwargs) as f:
+            yield f
+            f.flush()
+
+
+def write_text_atomic(path: Path, text: str) -> None:
+    with atomic_write(path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+def write_bytes_atomic(path: Path, data: bytes) -> None:
+    with atomic_write(path, "wb") as f:
+        f.write(data)
+
+
+def write_json_atomic(path: Path, data, indent: Optional[int] = 2) -> None:
+    with atomic_write(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=indent)
+
+
+def save_image_atomic(image, path: Path, format: Optional[str] = None, **params) -> None:
+    """Save a PIL image without ever exposing a half-written file."""
+    path = Path(path)
+    format = format or {".jpg": "JPEG", ".jpeg": "JPEG"}.get(path.suffix.lower(), "PNG")
+    with atomic_write(path, "wb") as f:
+        image.save(f, format, **params)
+
+
+# Held locks per thread: resolved lock path -> (file object, depth)
+_held = threading.local()
+# Serializes threads of this process, since flock is advisory between file descriptions
+_thread_locks: Dict[str, threading.Lock] = {}
+_thread_locks_guard = threading.Lock()
+
+
+def _thread_lock(key: str) -> threading.Lock:
+    with _thread_locks_guard:
+        return _thread_locks.setdefault(key, threading.Lock())
+
+
+@contextlib.contextmanager
+def file_lock(lock_path: Path, timeout: Optional[float] = None) -> Iterator[None]:
+    """Hold an exclusive advisory lock on lock_path, across threads and processes."""
+    lock_path = Path(lock_path)
+    key = str(lock_path.resolve())
+    held: Dict[str, Tuple[object, int]] = getattr(_held, "locks", None)
+    if held is None:
+        held = _held.locks = {}
+    if key in held:
+        handle, depth = held[key]
+        held[key] = (handle, depth + 1)
+        try:
+            yield
+        finally:
+            handle, depth = held[key]
+            held[key] = (handle, depth - 1)
+        return
+
+    deadline = None if timeout is None else time.monotonic() + timeout
+    thread_lock = _thread_lock(key)
+    if not thread_lock.acquire(timeout=-1 if timeout is None else max(0.0, timeout)):
+        raise StoryLocked(f"{lock_path} is locked by another worker")
+    handle = None
+    try:
+        lock_path.parent.mkdir(parents=True, exist_ok=True)
+        handle = open(lock_path, "a+")
+        if fcntl is not None:
+            while True:
+                try:
+                    fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    if deadline is not None and time.monotonic() >= deadline:
+                        raise StoryLocked(f"{lock_path} is locked by another process")
+                    time.sleep(LOCK_POLL_INTERVAL)
+        held[key] = (handle, 1)
+        yield
+    finally:
+        held.pop(key, None)
+        if handle is not None:
+            handle.close()  # closing the descriptor releases the flock
+        thread_lock.release()
+
+
+def story_lock(story_dir: Path, timeout: Optional[float] = None):
+    """Lock one story folder for a read-modify-write cycle."""
+    return file_lock(Path(story_dir) / LOCK_NAME, timeout)
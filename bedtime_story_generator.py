@@ -6,12 +6,25 @@ import argparse
 from pathlib import Path
 from dotenv import load_dotenv
 from openai import OpenAI
-import requests
 from PIL import Image
-import io
 import re
 import sys
 
+from atomic_io import atomic_path, save_image_atomic, story_lock, write_bytes_atomic, write_text_atomic
+import idea_pool
+from capability_probe import PROBE_TTL, require_capabilities
+from instrumentation import PRICES, recorder, usage_fields
+from memory_budget import CHUNK_SIZE, DEFAULT_LIMIT_MB, budget, download_to_file
+from regen_queue import record_failure
+from request_hedging import DEFAULT_SPEND_CAP, hedger
+from run_budget import RunScheduler, StoryEstimate, parse_call_caps, parse_deadline, plan
+from story_catalog import record_story, start_run, finish_run
+from story_pages import export_listing
+from story_preflight import preflight_story
+from story_publish import publish_story, refresh_manifest
+from story_segments import write_segments
+from story_slugs import allocate_story_dir
+
 # Load environment variables
 load_dotenv()
 
@@ -32,28 +45,16 @@ NUM_SEGMENTS = 10
 SEGMENT_DURATION = 5  # seconds per segment
 MAX_RETRIES = 3
 RETRY_DELAY = 2  # seconds
-
-def slugify(text):
-    """Convert text to a URL and filesystem-friendly format."""
-    # Remove special characters and convert to lowercase
-    slug = re.sub(r'[^\w\s-]', '', text.lower())
-    # Replace spaces with hyphens
-    slug = re.sub(r'[\s]+', '-', slug)
-    # Remove consecutive hyphens
-    slug = re.sub(r'[-]+', '-', slug)
-    # Remove leading and trailing hyphens
-    slug = slug.strip('-')
-    return slug
+IMAGE_DELAY = 1  # seconds between image requests
+STORY_DELAY_RANGE = (5, 15)  # randomized seconds between stories
+VOICE = "nova"  # A soothing voice good for bedtime stories
+IDEA_BATCH_SIZE = 10  # ideas requested per chat call, so large batches never load every idea up front
+IMAGE_MEMORY_BYTES = 1024 * 1024 * 4  # one decoded 1024x1024 RGBA image
 
 def create_output_directory(story_title):
-    """Create output directory for a story with a safe name."""
-    # Create safe folder name
-    safe_title = slugify(story_title)
-    
-    # Create directory
-    story_dir = OUTPUT_DIR / safe_title
-    story_dir.mkdir(parents=True, exist_ok=True)
-    return story_dir
+    """Reserve a new output directory for a story with a safe, unique name."""
+    # Atomic: concurrent stories with similar titles never share a folder
+    return allocate_story_dir(story_title, OUTPUT_DIR)
 
 def generate_story_ideas(num_ideas=10):
     """Generate unique bedtime story ideas using GPT-4."""
@@ -61,15 +62,17 @@ def generate_story_ideas(num_ideas=10):
     
     for attempt in range(MAX_RETRIES):
         try:
-            response = client.chat.completions.create(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": "You are a creative children's book author."},
-                    {"role": "user", "content": f"Generate {num_ideas} unique, creative, and wholesome bedtime story ideas for children ages 4-8. Each idea should be exactly 1 sentence with a title in quotes followed by a brief premise. Make them varied in themes (adventure, friendship, animals, fantasy, etc.) and suitable for bedtime reading. Format as a numbered list."}
-                ],
-                temperature=0.9,
-                max_tokens=500
-            )
+            with recorder.stage("chat.ideas", model="gpt-4") as stage:
+                response = client.chat.completions.create(
+                    model="gpt-4",
+                    messages=[
+                        {"role": "system", "content": "You are a creative children's book author."},
+                        {"role": "user", "content": f"Generate {num_ideas} unique, creative, and wholesome bedtime story ideas for children ages 4-8. Each idea should be exactly 1 sentence with a title in quotes followed by a brief premise. Make them varied in themes (adventure, friendship, animals, fantasy, etc.) and suitable for bedtime reading. Format as a numbered list."}
+                    ],
+                    temperature=0.9,
+                    max_tokens=500
+                )
+                stage.update(usage_fields(response))
             
             # Parse the ideas from the response
             ideas_text = response.choices[0].message.content
@@ -97,49 +100,65 @@ def generate_story_ideas(num_ideas=10):
         except Exception as e:
             print(f"Error generating story ideas (attempt {attempt+1}/{MAX_RETRIES}): {e}")
             if attempt < MAX_RETRIES - 1:
+                recorder.count("retries", stage="chat.ideas")
                 print(f"Retrying in {RETRY_DELAY} seconds...")
                 time.sleep(RETRY_DELAY)
             else:
                 print("Failed to generate story ideas after multiple attempts.")
+                recorder.count("fallbacks", stage="chat.ideas")
                 # Return some default ideas if API calls fail
                 return [
                     (f"The Adventure of Sammy {i}", f"A simple story about adventure {i}") 
                     for i in range(1, num_ideas + 1)
                 ]
 
+def iter_story_ideas(num_ideas, batch_size=IDEA_BATCH_SIZE):
+    """Yield (title, premise) pairs, asking for a small batch of ideas at a time."""
+    remaining = num_ideas
+    while remaining > 0:
+        batch = generate_story_ideas(min(batch_size, remaining))
+        if not batch:
+            print("No story ideas returned; stopping early.")
+            return
+        for idea in batch[:remaining]:
+            yield idea
+        remaining -= len(batch[:remaining])
+
 def generate_story_with_segments(title, premise, num_segments=10):
     """Generate a complete story divided into segments using GPT-4."""
     print(f"Generating story: '{title}'...")
     
     for attempt in range(MAX_RETRIES):
         try:
-            response = client.chat.completions.create(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": "You are a talented children's story writer."},
-                    {"role": "user", "content": f"""Write a bedtime story titled "{title}" based on this premise: {premise}. 
+            with recorder.stage("chat.story", model="gpt-4") as stage:
+                response = client.chat.completions.create(
+                    model="gpt-4",
+                    messages=[
+                        {"role": "system", "content": "You are a talented children's story writer."},
+                        {"role": "user", "content": f"""Write a bedtime story titled "{title}" based on this premise: {premise}. 
                     
-                    The story should be 300-400 words total, divided into exactly {num_segments} segments of roughly equal length.
+                        The story should be 300-400 words total, divided into exactly {num_segments} segments of roughly equal length.
                     
-                    Format your response as a JSON object with the following structure:
-                    {{
-                      "title": "The story title",
-                      "segments": [
-                        {{ "text": "First segment text..." }},
-                        {{ "text": "Second segment text..." }},
-                        ...
-                      ]
-                    }}
+                        Format your response as a JSON object with the following structure:
+                        {{
+                          "title": "The story title",
+                          "segments": [
+                            {{ "text": "First segment text..." }},
+                            {{ "text": "Second segment text..." }},
+                            ...
+                          ]
+                        }}
                     
-                    Make sure each segment logically flows into the next and together they form a complete, engaging bedtime story with a beginning, middle, and end.
-                    The story should be child-friendly, warm, and end on a positive, peaceful note suitable for bedtime.
-                    Each segment should be 30-40 words.
-                    """}
-                ],
-                temperature=0.7,
-                max_tokens=1200,
-                response_format={"type": "json_object"}
-            )
+                        Make sure each segment logically flows into the next and together they form a complete, engaging bedtime story with a beginning, middle, and end.
+                        The story should be child-friendly, warm, and end on a positive, peaceful note suitable for bedtime.
+                        Each segment should be 30-40 words.
+                        """}
+                    ],
+                    temperature=0.7,
+                    max_tokens=1200,
+                    response_format={"type": "json_object"}
+                )
+                stage.update(usage_fields(response))
             
             story_data = json.loads(response.choices[0].message.content)
             return story_data
@@ -147,10 +166,12 @@ def generate_story_with_segments(title, premise, num_segments=10):
         except Exception as e:
             print(f"Error generating story for '{title}' (attempt {attempt+1}/{MAX_RETRIES}): {e}")
             if attempt < MAX_RETRIES - 1:
+                recorder.count("retries", stage="chat.story")
                 print(f"Retrying in {RETRY_DELAY} seconds...")
                 time.sleep(RETRY_DELAY)
             else:
                 print(f"Failed to generate story after {MAX_RETRIES} attempts.")
+                recorder.count("fallbacks", stage="chat.story")
                 # Create a simple fallback story
                 segments = [{"text": f"Segment {i} for the story about {title}."} for i in range(1, num_segments + 1)]
                 return {"title": title, "segments": segments}
@@ -161,30 +182,42 @@ def generate_image_for_segment(story_title, segment_text, index, output_path):
     
     for attempt in range(MAX_RETRIES):
         try:
-            print(f"Generating image {index}/{NUM_SEGMENTS} for '{story_title}'...")
-            response = client.images.generate(
-                model="dall-e-3",
-                prompt=prompt,
-                size="1024x1024",
-                quality="standard",
-                n=1
-            )
+            print(f"Generating image {index} for '{story_title}'...")
+            with recorder.stage("images.generate", model="dall-e-3") as stage:
+                # A slow request gets a duplicate when hedging is on; the first image back wins
+                response = hedger.call("images.generate", lambda attempt: client.images.generate(
+                    model="dall-e-3",
+                    prompt=prompt,
+                    size="1024x1024",
+                    quality="standard",
+                    n=1
+                ), cost=PRICES["dall-e-3"]["images"])
+                stage["images"] = 1
             
             image_url = response.data[0].url
             
-            # Download and save the image
-            image_response = requests.get(image_url)
-            image = Image.open(io.BytesIO(image_response.content))
-            image.save(output_path)
+            # Stream the download to disk; decoding counts against the shared memory budget
+            with budget.reserve(IMAGE_MEMORY_BYTES, stage="image"), atomic_path(output_path) as tmp_path:
+                with recorder.stage("image.download") as stage:
+                    stage["bytes"] = download_to_file(image_url, tmp_path)
+                with recorder.stage("image.encode") as stage:
+                    with Image.open(tmp_path) as image:
+                        if image.format == "PNG":
+                            image.verify()  # already PNG: keep the downloaded bytes
+                        else:
+                            image.load()
+                            image.save(tmp_path, "PNG")
+                    stage["bytes"] = os.path.getsize(tmp_path)
             
             print(f"✓ Saved image {index} to {output_path}")
             # Sleep briefly to avoid rate limits
-            time.sleep(1)
+            time.sleep(IMAGE_DELAY)
             return True
             
         except Exception as e:
             print(f"Error generating image {index} (attempt {attempt+1}/{MAX_RETRIES}): {e}")
             if attempt < MAX_RETRIES - 1:
+                recorder.count("retries", stage="images.generate")
                 print(f"Retrying in {RETRY_DELAY} seconds...")
                 time.sleep(RETRY_DELAY)
             else:
@@ -192,40 +225,57 @@ def generate_image_for_segment(story_title, segment_text, index, output_path):
                 # Create an empty placeholder image
                 try:
                     placeholder = Image.new('RGB', (1024, 1024), color='lightgray')
-                    placeholder.save(output_path)
+                    save_image_atomic(placeholder, output_path)
                     print(f"Created placeholder image at {output_path}")
+                    recorder.count("placeholders", asset="image")
+                    record_failure(Path(output_path).parent, Path(output_path).name, f"image generation failed: {e}")
                     return True
                 except Exception as e:
                     print(f"Error creating placeholder image: {e}")
                     return False
 
-def generate_audio(story_text, output_path):
+def generate_audio(story_text, output_path, voice=VOICE):
     """Generate audio narration using OpenAI's Text-to-Speech API."""
     for attempt in range(MAX_RETRIES):
         try:
             print("Generating audio narration...")
-            response = client.audio.speech.create(
-                model="tts-1",
-                voice="nova",  # A soothing voice good for bedtime stories
-                input=story_text
-            )
-            
-            response.stream_to_file(output_path)
+            with recorder.stage("tts", model="tts-1", characters=len(story_text)) as stage:
+                with atomic_path(output_path) as tmp_path:
+                    # Each attempt streams to its own file, so a hedged duplicate never mixes bytes with it
+                    def synthesize(attempt):
+                        attempt_path = tmp_path.with_name(f"{tmp_path.stem}.{attempt}.tmp")
+                        try:
+                            # Streamed in chunks, so the narration is never held in memory whole
+                            with client.audio.speech.with_streaming_response.create(
+                                model="tts-1",
+                                voice=voice,
+                                input=story_text
+                            ) as response:
+                                response.stream_to_file(attempt_path, chunk_size=CHUNK_SIZE)
+                        except BaseException:
+                            attempt_path.unlink(missing_ok=True)
+                            raise
+                        return attempt_path
+                    cost = len(story_text) / 1000 * PRICES["tts-1"]["characters"]
+                    os.replace(hedger.call("tts", synthesize, cost=cost, discard=os.remove), tmp_path)
+                stage["bytes"] = os.path.getsize(output_path)
             print(f"✓ Saved audio narration to {output_path}")
             return True
             
         except Exception as e:
             print(f"Error generating audio (attempt {attempt+1}/{MAX_RETRIES}): {e}")
             if attempt < MAX_RETRIES - 1:
+                recorder.count("retries", stage="tts")
                 print(f"Retrying in {RETRY_DELAY} seconds...")
                 time.sleep(RETRY_DELAY)
             else:
                 print(f"Failed to generate audio after {MAX_RETRIES} attempts.")
                 # Create an empty audio file as placeholder
                 try:
-                    with open(output_path, 'wb') as f:
-                        f.write(b'')  # Empty file
+                    write_bytes_atomic(output_path, b'')  # Empty file
                     print(f"Created placeholder audio file at {output_path}")
+                    recorder.count("placeholders", asset="audio")
+                    record_failure(Path(output_path).parent, Path(output_path).name, f"audio generation failed: {e}")
                     return True
                 except Exception as e:
                     print(f"Error creating placeholder audio file: {e}")
@@ -243,48 +293,66 @@ def prepare_story_segments_json(story_data):
     
     return story_data
 
-def process_story(title, premise, index, total):
-    """Process a single story from idea to finished files."""
+def process_story(title, premise, index, total, num_segments=NUM_SEGMENTS, voice=VOICE, progressive=False):
+    """Process a single story from idea to finished files.
+    
+    With progressive=True the story is published as soon as its text and first
+    image exist, and its manifest is updated as each remaining asset lands.
+    Returns None, without creating anything, if the story text fails the
+    pre-flight checks.
+    """
     print(f"\n[{index}/{total}] Processing story: '{title}'")
     
-    # 1. Generate the story with segments
-    story_data = generate_story_with_segments(title, premise, NUM_SEGMENTS)
+    # 1. Generate the story with segments and check it before any image or audio spend
+    story_data = preflight_story(generate_story_with_segments, title, premise, num_segments)
+    if story_data is None:
+        return None
     
     # 2. Create output directory
     story_dir = create_output_directory(story_data["title"])
     print(f"Created directory: {story_dir}")
     
-    # 3. Create the full story text
-    full_story = story_data["title"] + "\n\n"
-    full_story += "\n\n".join([segment["text"] for segment in story_data["segments"]])
+    # Hold the story lock while writing so other tools never see a half-built story
+    with story_lock(story_dir):
+        # 3. Create the full story text
+        full_story = story_data["title"] + "\n\n"
+        full_story += "\n\n".join([segment["text"] for segment in story_data["segments"]])
     
-    # 4. Save the full story as text
-    with open(story_dir / "story.txt", "w") as f:
-        f.write(full_story)
-    print(f"✓ Saved story text to {story_dir / 'story.txt'}")
+        # 4. Save the full story as text
+        write_text_atomic(story_dir / "story.txt", full_story)
+        print(f"✓ Saved story text to {story_dir / 'story.txt'}")
     
-    # 5. Prepare and save story_segments.json
-    segments_data = prepare_story_segments_json(story_data)
-    with open(story_dir / "story_segments.json", "w") as f:
-        json.dump(segments_data, f, indent=2)
-    print(f"✓ Saved story segments to {story_dir / 'story_segments.json'}")
+        # 5. Prepare and save story_segments.json
+        segments_data = prepare_story_segments_json(story_data)
+        write_segments(story_dir / "story_segments.json", segments_data)
+        print(f"✓ Saved story segments to {story_dir / 'story_segments.json'}")
     
-    # 6. Generate images for each segment
-    for j, segment in enumerate(story_data["segments"]):
-        image_path = story_dir / f"image_{j+1}.png"
-        success = generate_image_for_segment(
-            story_data["title"], 
-            segment["text"], 
-            j+1, 
-            image_path
-        )
+        # 6. Generate images for each segment
+        for j, segment in enumerate(story_data["segments"]):
+            image_path = story_dir / f"image_{j+1}.png"
+            success = generate_image_for_segment(
+                story_data["title"], 
+                segment["text"], 
+                j+1, 
+                image_path
+            )
         
-        if not success:
-            print(f"Warning: Failed to generate image {j+1}")
+            if not success:
+                print(f"Warning: Failed to generate image {j+1}")
+        
+            if progressive and j == 0:
+                publish_story(story_dir)
+                print(f"✓ Published '{story_data['title']}' early; remaining assets are marked pending")
+            elif progressive:
+                refresh_manifest(story_dir)
+    
+        # 7. Generate audio for the full story
+        audio_path = story_dir / "story_audio.mp3"
+        generate_audio(full_story, audio_path, voice)
     
-    # 7. Generate audio for the full story
-    audio_path = story_dir / "story_audio.mp3"
-    generate_audio(full_story, audio_path)
+        # 8. Update the story catalog and publish the finished story
+        record_story(story_dir)
+        publish_story(story_dir, refresh_listing=progressive)
     
     print(f"✓ Completed story {index}/{total}: '{story_data['title']}'")
     print(f"  Saved to: {story_dir}")
@@ -295,8 +363,38 @@ def main():
     parser = argparse.ArgumentParser(description='Generate bedtime stories with images and audio')
     parser.add_argument('--stories', type=int, default=NUM_STORIES, help=f'Number of stories to generate (default: {NUM_STORIES})')
     parser.add_argument('--segments', type=int, default=NUM_SEGMENTS, help=f'Number of segments per story (default: {NUM_SEGMENTS})')
+    parser.add_argument('--events', help='JSON-lines file for timing and cost events (default: run_logs/run-<timestamp>.jsonl)')
+    parser.add_argument('--progressive', action='store_true', help='Publish each story as soon as its text and first image are ready')
+    parser.add_argument('--metrics-port', type=int, help='Serve Prometheus metrics on this port while generating')
+    parser.add_argument('--no-idea-pool', action='store_true', help='Ask GPT-4 for fresh ideas instead of drawing de-duplicated ones from idea_pool.db')
+    parser.add_argument('--memory-budget', type=int, default=DEFAULT_LIMIT_MB, help=f'MB of payloads held in memory at once (default: {DEFAULT_LIMIT_MB})')
+    parser.add_argument('--hedge-percentile', type=float, help='Duplicate image and TTS requests still running past this percentile of recent latencies (e.g. 95)')
+    parser.add_argument('--hedge-spend', type=float, default=DEFAULT_SPEND_CAP, help=f'USD cap on duplicate requests per run (default: {DEFAULT_SPEND_CAP})')
+    parser.add_argument('--budget', type=float, help='Run budget in USD; stories start only while their estimated cost fits')
+    parser.add_argument('--max-calls', default='', help='Per-model call caps for the run, e.g. dall-e-3=200,tts-1=20')
+    parser.add_argument('--deadline', help='Start only stories that can finish by a clock time (06:30) or within a duration (90m, 2h)')
+    parser.add_argument('--skip-probe', action='store_true', help=f'Start without the API capability probe (otherwise cached for {PROBE_TTL}s)')
     args = parser.parse_args()
     
+    # Fail in seconds, not after the first story's spend, when the key or a model is unusable
+    if not args.skip_probe and not require_capabilities():
+        return 1
+    
+    try:
+        call_caps = parse_call_caps(args.max_calls)
+        deadline = parse_deadline(args.deadline) if args.deadline else None
+    except ValueError as e:
+        print(f"Error: {e}")
+        return 1
+    
+    budget.configure(args.memory_budget * 1024 * 1024)
+    hedger.configure(args.hedge_percentile, args.hedge_spend)
+    scheduler = RunScheduler(args.budget, call_caps, deadline) if args.budget is not None or call_caps or deadline else None
+    
+    if args.metrics_port:
+        from metrics import start_metrics_server
+        start_metrics_server(args.metrics_port)
+    
     num_stories = args.stories
     num_segments = args.segments
     
@@ -308,23 +406,62 @@ def main():
     print(f"Generating {num_stories} stories with {num_segments} segments each.")
     print(f"Output directory: {OUTPUT_DIR.absolute()}")
     print(f"This will make multiple calls to OpenAI's API and may take some time.")
+    if scheduler is not None:
+        fit = plan(StoryEstimate.from_events(scheduler.history), num_segments, num_stories, args.budget, call_caps, deadline)
+        print(f"Run limits: about {fit['admitted']} of {num_stories} stories fit (limited by {fit['limited_by']}, ~${fit['cost']:.2f} each)")
     print(f"======================\n")
     
-    # Generate story ideas
-    story_ideas = generate_story_ideas(num_stories)
+    run_id = start_run("bedtime_story_generator", num_stories)
+    recorder.start_run("bedtime_story_generator", args.events, stories=num_stories, segments=num_segments)
+    completed = 0
     
-    # Process each story
-    for i, (title, premise) in enumerate(story_ideas):
-        story_dir = process_story(title, premise, i+1, num_stories)
-        
+    # Draw ideas from the de-duplicated pool, which is refilled a batch at a time
+    if args.no_idea_pool:
+        pool = None
+        ideas = ((None, title, premise) for title, premise in iter_story_ideas(num_stories))
+    else:
+        pool = idea_pool.connect()
+        ideas = idea_pool.draw_ideas(pool, num_stories, generate_story_ideas, IDEA_BATCH_SIZE, OUTPUT_DIR)
+    
+    for i, (idea_id, title, premise) in enumerate(ideas):
         # Add a delay between stories to manage API rate limits
-        if i < len(story_ideas) - 1:
-            delay = random.randint(5, 15)  # Randomized delay
+        delay = random.randint(*STORY_DELAY_RANGE) if i > 0 else 0  # Randomized delay
+        ticket = None
+        if scheduler is not None:
+            # Admission control: only start a story whose estimated cost, calls and time still fit
+            ticket, reason = scheduler.admit(num_segments, lead_seconds=delay)
+            if ticket is None:
+                print(f"\nNot starting more stories: {reason}")
+                if idea_id is not None:
+                    idea_pool.release_idea(pool, idea_id)
+                break
+        if i > 0:
             print(f"Waiting {delay} seconds before starting the next story...")
             time.sleep(delay)
+        
+        try:
+            with recorder.stage("story", title=title, segments=num_segments):
+                story_dir = process_story(title, premise, i+1, num_stories, num_segments, progressive=args.progressive)
+        finally:
+            if scheduler is not None:
+                scheduler.release(ticket)
+        if story_dir is None:
+            # Rejected before any media spend. A pool idea stays claimed and
+            # returns to the pool once its claim expires, not later in this run
+            continue
+        if idea_id is not None:
+            idea_pool.mark_used(pool, idea_id, story_dir)
+        completed += 1
+    
+    memory = budget.stats()
+    summary = recorder.finish_run(stories_completed=completed, memory=memory, hedging=hedger.stats(),
+                                  run_budget=scheduler.stats() if scheduler is not None else None)
+    print(f"Memory budget: peak {memory['peak_in_flight_bytes'] / 1024 / 1024:.0f} of {memory['limit_bytes'] / 1024 / 1024:.0f} MB in flight, {memory['waits']} waits")
+    finish_run(run_id, completed, f"estimated cost ${summary['cost']:.2f}, events: {recorder.events_path}")
+    export_listing()
     
     print("\nAll stories generated successfully!")
     print(f"Stories are saved in the '{OUTPUT_DIR}' directory.")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    sys.exit(main())
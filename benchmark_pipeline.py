@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+Generation Pipeline Benchmark
+
+Runs bedtime_story_generator end to end against the local mock OpenAI server
+(mock_openai_server.py) and reports:
+1. Stories per minute and total wall time
+2. Count, p50, p95 and max duration for each pipeline stage
+3. API calls per endpoint, including injected 429s and 500s
+4. How many generated stories passed content validation
+5. Hedged requests sent, won and paid for, when --hedge-percentile is set
+
+The run happens in a temporary working directory, so the real library,
+catalog and queue are never touched and no API money is spent. Save a
+report with --json and compare later runs against it with --baseline to
+catch throughput or latency regressions.
+
+Usage:
+    python benchmark_pipeline.py --stories 3 --latency chat=0.5,images=1,speech=1
+    python benchmark_pipeline.py --stories 3 --json baseline.json
+    python benchmark_pipeline.py --stories 3 --baseline baseline.json --tolerance 0.15
+    python benchmark_pipeline.py --stories 3 --latency images=1,speech=1 --slow-rate 0.1 --hedge-percentile 90
+"""
+
+import os
+import sys
+import json
+import time
+import tempfile
+import argparse
+import threading
+import contextlib
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from instrumentation import percentile
+from mock_openai_server import MockConfig, MockOpenAIServer, parse_endpoint_values
+from story_validator import find_story_dirs, validate_story_dir
+
+# Pipeline functions timed as stages
+STAGES = [
+    "generate_story_ideas",
+    "generate_story_with_segments",
+    "generate_image_for_segment",
+    "generate_audio",
+    "process_story",
+]
+
+
+class StageTimer:
+    """Collects wall-clock durations of wrapped pipeline functions."""
+
+    def __init__(self):
+        self.durations: Dict[str, List[float]] = {stage: [] for stage in STAGES}
+        self.lock = threading.Lock()
+
+    def wrap(self, name, func):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                with self.lock:
+                    self.durations[name].append(time.perf_counter() - start)
+        return timed
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        return {
+            stage: {
+                "count": len(values),
+                "p50": round(percentile(values, 0.50), 4),
+                "p95": round(percentile(values, 0.95), 4),
+                "max": round(max(values), 4) if values else 0.0,
+                "total": round(sum(values), 4),
+            }
+            for stage, values in self.durations.items()
+        }
+
+
+def run_benchmark(num_stories: int, base_url: str, keep_pacing: bool = False, verbose: bool = False,
+                  generator_args: Optional[List[str]] = None) -> Dict:
+    """Run the generator against base_url in a scratch directory and time it."""
+    os.environ["OPENAI_API_KEY"] = os.environ.get("BENCHMARK_API_KEY", "mock")
+    os.environ["OPENAI_BASE_URL"] = base_url
+
+    # Imported here: the generator builds its OpenAI client at import time
+    import bedtime_story_generator as generator
+
+    if not keep_pacing:
+        generator.IMAGE_DELAY = 0
+        generator.STORY_DELAY_RANGE = (0, 0)
+        generator.RETRY_DELAY = 0
+
+    timer = StageTimer()
+    for stage in STAGES:
+        setattr(generator, stage, timer.wrap(stage, getattr(generator, stage)))
+
+    argv = sys.argv
+    # The mock's ideas all look alike, so the de-duplicating idea pool would reject them;
+    # the capability probe is skipped so only pipeline calls reach the mock
+    sys.argv = ["bedtime_story_generator.py", "--stories", str(num_stories), "--no-idea-pool", "--skip-probe"]
+    sys.argv += generator_args or []
+    start = time.perf_counter()
+    try:
+        with open(os.devnull, "w") as devnull:
+            with contextlib.redirect_stdout(sys.stdout if verbose else devnull):
+                generator.main()
+    finally:
+        sys.argv = argv
+    elapsed = time.perf_counter() - start
+
+    reports = [validate_story_dir(d) for d in find_story_dirs(generator.OUTPUT_DIR)]
+    run_summary = generator.recorder.summary()
+    return {
+        "stories": len(reports),
+        "estimated_cost": run_summary["cost"],
+        "peak_rss_mb": run_summary["peak_rss_mb"],
+        "healthy_stories": sum(1 for r in reports if r["ok"]),
+        "elapsed": round(elapsed, 3),
+        "stories_per_minute": round(len(reports) / elapsed * 60, 3) if elapsed else 0.0,
+        "stages": timer.summary(),
+        "hedging": generator.hedger.stats(),
+    }
+
+
+def fetch_server_stats(base_url: str) -> Dict[str, Dict[str, int]]:
+    """Read the mock server's per-endpoint request counters."""
+    import requests
+
+    stats_url = base_url.rstrip("/").rsplit("/v1", 1)[0] + "/stats"
+    try:
+        return requests.get(stats_url, timeout=5).json()
+    except (requests.RequestException, ValueError):
+        return {}
+
+
+def compare_to_baseline(result: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """Return human-readable regressions of result against a saved baseline."""
+    regressions = []
+    if result["stories_per_minute"] < baseline["stories_per_minute"] * (1 - tolerance):
+        regressions.append(
+            f"throughput {result['stories_per_minute']:.2f} < baseline {baseline['stories_per_minute']:.2f} stories/min"
+        )
+    for stage, stats in result["stages"].items():
+        previous = baseline.get("stages", {}).get(stage)
+        if previous and previous["p95"] > 0 and stats["p95"] > previous["p95"] * (1 + tolerance):
+            regressions.append(f"{stage} p95 {stats['p95']:.3f}s > baseline {previous['p95']:.3f}s")
+    return regressions
+
+
+def print_report(result: Dict) -> None:
+    print(f"\nPipeline Benchmark")
+    print(f"==================")
+    print(f"Stories: {result['stories']} ({result['healthy_stories']} passed validation)")
+    print(f"Wall time: {result['elapsed']:.2f}s  Throughput: {result['stories_per_minute']:.2f} stories/min")
+    print(f"Estimated cost at real prices: ${result['estimated_cost']:.2f}  Peak RSS: {result['peak_rss_mb']:.0f} MB\n")
+    print(f"{'stage':<30} {'count':>6} {'p50':>8} {'p95':>8} {'max':>8}")
+    for stage, stats in result["stages"].items():
+        print(f"{stage:<30} {stats['count']:>6} {stats['p50']:>8.3f} {stats['p95']:>8.3f} {stats['max']:>8.3f}")
+    print(f"\n{'endpoint':<30} calls by HTTP status")
+    for endpoint, by_status in sorted(result["api_calls"].items()):
+        calls = ", ".join(f"{status}: {count}" for status, count in sorted(by_status.items()))
+        print(f"{endpoint:<30} {calls}")
+    hedging = result.get("hedging")
+    if hedging and hedging["percentile"] is not None:
+        print(f"\nHedged at p{hedging['percentile']:g}: {hedging['hedges']} sent, {hedging['wins']} won, "
+              f"${hedging['spent']:.2f} of ${hedging['spend_cap']:.2f} spent")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the story generation pipeline against a mock OpenAI server")
+    parser.add_argument("--stories", type=int, default=3, help="Stories to generate (default: 3)")
+    parser.add_argument("--latency", help="Mock latency per endpoint, e.g. 'chat=0.5,images=1,speech=1'")
+    parser.add_argument("--jitter", type=float, default=0.3, help="Latency jitter as a fraction of the mean")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Probability of mock 500 responses")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="Probability of mock 429 responses")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="Probability of a slow mock response (a latency tail)")
+    parser.add_argument("--slow-factor", type=float, default=10.0, help="Latency multiplier for slow responses (default: 10)")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed for the mock server")
+    parser.add_argument("--hedge-percentile", type=float, help="Pass --hedge-percentile to the generator")
+    parser.add_argument("--hedge-spend", type=float, help="Pass --hedge-spend to the generator")
+    parser.add_argument("--base-url", help="Use an already running mock server instead of starting one")
+    parser.add_argument("--keep-pacing", action="store_true", help="Keep the generator's rate-limit sleeps")
+    parser.add_argument("--json", help="Write the report to this JSON file")
+    parser.add_argument("--baseline", help="Compare against a previous --json report")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed regression fraction (default: 0.15)")
+    parser.add_argument("--verbose", action="store_true", help="Show the generator's output")
+    args = parser.parse_args()
+
+    server = None
+    if args.base_url:
+        base_url = args.base_url
+    else:
+        config = MockConfig(
+            latency=parse_endpoint_values(args.latency),
+            jitter=args.jitter,
+            error_rate=args.error_rate,
+            rate_limit=args.rate_limit,
+            seed=args.seed,
+            slow_rate=args.slow_rate,
+            slow_factor=args.slow_factor,
+        )
+        server = MockOpenAIServer(port=0, config=config).start()
+        base_url = server.base_url
+
+    generator_args = []
+    if args.hedge_percentile is not None:
+        generator_args += ["--hedge-percentile", str(args.hedge_percentile)]
+    if args.hedge_spend is not None:
+        generator_args += ["--hedge-spend", str(args.hedge_spend)]
+
+    json_path = Path(args.json).resolve() if args.json else None
+    baseline_path = Path(args.baseline).resolve() if args.baseline else None
+    repo_dir = Path(__file__).resolve().parent
+    if str(repo_dir) not in sys.path:
+        sys.path.insert(0, str(repo_dir))
+
+    original_cwd = os.getcwd()
+    try:
+        with tempfile.TemporaryDirectory(prefix="story-benchmark-") as workdir:
+            os.chdir(workdir)
+            result = run_benchmark(args.stories, base_url, args.keep_pacing, args.verbose, generator_args)
+        result["api_calls"] = fetch_server_stats(base_url)
+    finally:
+        os.chdir(original_cwd)
+        if server is not None:
+            server.stop()
+
+    print_report(result)
+
+    if json_path:
+        json_path.write_text(json.dumps(result, indent=2))
+        print(f"\nSaved report to {json_path}")
+
+    if baseline_path:
+        regressions = compare_to_baseline(result, json.loads(baseline_path.read_text()), args.tolerance)
+        if regressions:
+            print("\n❌ Regressions against baseline:")
+            for regression in regressions:
+                print(f"   {regression}")
+            return 1
+        print("\n✅ No regressions against baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
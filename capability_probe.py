@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+OpenAI Capability Probe
+
+A fast pre-flight check that the API key works and the models the
+generators use are available. It replaces verify_api_key.py's sequential
+checks and its real DALL-E image. The checks run concurrently, each with a
+short timeout and no retries, and each uses the cheapest call that proves
+the point:
+
+    models   GET /models; the key is valid and gpt-4, dall-e-3 and tts-1 are listed
+    chat     a one-token gpt-4 completion
+    speech   tts-1 narration of a two-letter input
+
+No image is generated. Having dall-e-3 listed is the check for images.
+Each check's latency is measured. The result is cached in
+.capability_probe.json for the TTL, keyed by a fingerprint of the API key
+and base URL (the key itself is never written). Repeated batch runs
+therefore pay for the probe at most once per TTL. Failures are cached for
+FAILURE_TTL only, so a fixed key is noticed quickly.
+
+    from capability_probe import require_capabilities
+    if not require_capabilities():
+        sys.exit(1)
+
+Usage:
+    python capability_probe.py                 # cached result if fresh, else probe
+    python capability_probe.py --force --json  # always probe, print JSON
+    python capability_probe.py --ttl 60 --timeout 5
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import logging
+import argparse
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+from dotenv import load_dotenv
+from openai import OpenAI
+
+from atomic_io import write_json_atomic
+
+logger = logging.getLogger(__name__)
+
+# Constants
+PROBE_CACHE = Path(".capability_probe.json")
+PROBE_TTL = 600  # seconds a successful probe is trusted
+FAILURE_TTL = 30  # seconds a failed probe is trusted
+PROBE_TIMEOUT = 10  # seconds per check
+REQUIRED_MODELS = ("gpt-4", "dall-e-3", "tts-1")
+SPEECH_INPUT = "Hi"
+
+
+def _check_models(client: OpenAI) -> Optional[str]:
+    available = {model.id for model in client.models.list()}
+    missing = [model for model in REQUIRED_MODELS if model not in available]
+    return f"models not available: {', '.join(missing)}" if missing else None
+
+
+def _check_chat(client: OpenAI) -> Optional[str]:
+    response = client.chat.completions.create(
+        model="gpt-4",
+        messages=[{"role": "user", "content": "Reply with OK."}],
+        max_tokens=1
+    )
+    return None if response.choices else "empty chat response"
+
+
+def _check_speech(client: OpenAI) -> Optional[str]:
+    response = client.audio.speech.create(model="tts-1", voice="nova", input=SPEECH_INPUT)
+    return None if response.content else "empty speech response"
+
+
+# name -> check; a check returns None when the capability works, else a problem
+CHECKS: Dict[str, Callable[[OpenAI], Optional[str]]] = {
+    "models": _check_models,
+    "chat": _check_chat,
+    "speech": _check_speech,
+}
+
+
+def fingerprint(api_key: str, base_url: str) -> str:
+    return hashlib.sha256(f"{base_url}\0{api_key}".encode("utf-8")).hexdigest()[:16]
+
+
+def _run_check(client: OpenAI, name: str) -> Dict:
+    started = time.perf_counter()
+    try:
+        problem = CHECKS[name](client)
+    except Exception as e:
+        problem = f"{type(e).__name__}: {e}"
+    result = {"ok": problem is None, "latency_ms": round((time.perf_counter() - started) * 1000, 1)}
+    if problem:
+        result["error"] = problem
+    return result
+
+
+def run_probe(client: OpenAI, timeout: float = PROBE_TIMEOUT) -> Dict:
+    """Run every check concurrently and return {"ok", "checked_at", "checks"}."""
+    client = client.with_options(timeout=timeout, max_retries=0)
+    with ThreadPoolExecutor(max_workers=len(CHECKS)) as pool:
+        futures = {name: pool.submit(_run_check, client, name) for name in CHECKS}
+        checks = {name: future.result() for name, future in futures.items()}
+    return {"ok": all(check["ok"] for check in checks.values()), "checked_at": round(time.time(), 3), "checks": checks}
+
+
+def _load_cache(path: Path) -> Dict:
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def probe(ttl: float = PROBE_TTL, timeout: float = PROBE_TIMEOUT, force: bool = False,
+          cache_path: Path = PROBE_CACHE) -> Dict:
+    """Return the capability report, from the cache while it is fresh.
+
+    The report has "ok", "checked_at", "checks" ({name: {"ok", "latency_ms",
+    "error"}}) and "cached". A missing API key is reported as a failure.
+    """
+    load_dotenv()
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        return {"ok": False, "cached": False, "checked_at": round(time.time(), 3),
+                "checks": {"api_key": {"ok": False, "latency_ms": 0.0, "error": "OPENAI_API_KEY is not set"}}}
+
+    client = OpenAI(api_key=api_key)
+    key = fingerprint(api_key, str(client.base_url))
+    cache = _load_cache(cache_path)
+    entry = cache.get(key)
+    if entry and not force:
+        age = time.time() - entry["checked_at"]
+        if age < (ttl if entry["ok"] else min(ttl, FAILURE_TTL)):
+            return {**entry, "cached": True}
+
+    report = run_probe(client, timeout)
+    cache[key] = report
+    try:
+        write_json_atomic(cache_path, cache)
+    except OSError as e:
+        logger.warning(f"Could not cache the capability probe in {cache_path}: {e}")
+    return {**report, "cached": False}
+
+
+def format_report(report: Dict) -> str:
+    lines = []
+    for name, check in report["checks"].items():
+        mark = "✓" if check["ok"] else "×"
+        detail = f" ({check['error']})" if not check["ok"] else ""
+        lines.append(f"{mark} {name:<8} {check['latency_ms']:>8.1f} ms{detail}")
+    age = time.time() - report["checked_at"]
+    lines.append(f"{'OK' if report['ok'] else 'FAILED'}" + (f" (cached, {age:.0f}s old)" if report.get("cached") else ""))
+    return "\n".join(lines)
+
+
+def require_capabilities(ttl: float = PROBE_TTL, timeout: float = PROBE_TIMEOUT) -> bool:
+    """Pre-flight for batch runners: probe (or reuse a fresh result) and print any failures."""
+    report = probe(ttl, timeout)
+    if not report["ok"]:
+        print("OpenAI capability probe failed; not starting:")
+        print(format_report(report))
+    return report["ok"]
+
+
+def main():
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+    parser = argparse.ArgumentParser(description="Check OpenAI API access for the story generators, quickly and cheaply")
+    parser.add_argument("--ttl", type=float, default=PROBE_TTL, help=f"Seconds a cached result stays valid (default: {PROBE_TTL})")
+    parser.add_argument("--timeout", type=float, default=PROBE_TIMEOUT, help=f"Seconds per check (default: {PROBE_TIMEOUT})")
+    parser.add_argument("--force", action="store_true", help="Ignore the cached result")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    report = probe(args.ttl, args.timeout, args.force)
+    print(json.dumps(report, indent=2) if args.json else format_report(report))
+    return 0 if report["ok"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -28,6 +28,14 @@ if [ ! -d "public/output" ]; then
   error_exit "Directory 'public/output' not found. Please run this script from the root of your project."
 fi
 
+# With a deploy target, upload only the changed files instead of pushing media through git
+if [ -n "$PUBLISH_TARGET" ]; then
+  echo -e "${YELLOW}Publishing changed story files to ${PUBLISH_TARGET}...${NC}"
+  python3 story_deploy.py "$PUBLISH_TARGET" || error_exit "Publishing to ${PUBLISH_TARGET} failed."
+  echo -e "${GREEN}Success! Changed stories have been published to ${PUBLISH_TARGET}.${NC}"
+  exit 0
+fi
+
 # Get current branch
 CURRENT_BRANCH=$(git symbolic-ref --short HEAD 2>/dev/null)
 if [ $? -ne 0 ]; then
@@ -1,4 +1,5 @@
 import React, { useCallback } from 'react';
+import { fetchStorySegments } from '../lib/storySegments';
 
 const BedtimeSlideshow = () => {
   const [loading, setLoading] = React.useState(false);
@@ -16,6 +17,48 @@ const BedtimeSlideshow = () => {
   const [isLoadingStory, setIsLoadingStory] = React.useState(false);
   const [isPlaying, setIsPlaying] = React.useState(false);
   const [progress, setProgress] = React.useState(0);
+  // Asset statuses from story_manifest.json while a story is still being generated
+  const [assetStatus, setAssetStatus] = React.useState({});
+  const [storyStatus, setStoryStatus] = React.useState(null);
+
+  const MANIFEST_POLL_MS = 5000;
+
+  const fetchManifest = async (baseUrl, storyId) => {
+    try {
+      const response = await fetch(`${baseUrl}/${storyId}/story_manifest.json`, { cache: 'no-store' });
+      if (!response.ok) return null;
+      return await response.json();
+    } catch (error) {
+      return null;
+    }
+  };
+
+  const applyManifest = (manifest, baseUrl, storyId) => {
+    if (!manifest) {
+      // Stories published before progressive publishing have no manifest and are complete
+      setAssetStatus({});
+      setStoryStatus('complete');
+      return;
+    }
+    setAssetStatus(manifest.assets || {});
+    setStoryStatus(manifest.status);
+    const audioReady = (manifest.assets || {})['story_audio.mp3'] !== 'pending';
+    if (audioReady && audioRef.current && !audioRef.current.src) {
+      audioRef.current.src = `${baseUrl}/${storyId}/story_audio.mp3`;
+    }
+  };
+
+  // Poll the manifest until the remaining assets of a partially published story land
+  React.useEffect(() => {
+    if (storyStatus !== 'partial' || !currentStoryId || !currentStoryBaseUrl) return undefined;
+    const timer = setInterval(async () => {
+      const manifest = await fetchManifest(currentStoryBaseUrl, currentStoryId);
+      if (manifest) {
+        applyManifest(manifest, currentStoryBaseUrl, currentStoryId);
+      }
+    }, MANIFEST_POLL_MS);
+    return () => clearInterval(timer);
+  }, [storyStatus, currentStoryId, currentStoryBaseUrl]);
 
   const loadStory = async (storyId) => {
     setIsLoadingStory(true);
@@ -25,11 +68,14 @@ const BedtimeSlideshow = () => {
     setCurrentSlide(0);
     setProgress(0);
     setAudioLoaded(false);
+    setAssetStatus({});
+    setStoryStatus(null);
     
     // Stop audio if playing
     if (audioRef.current) {
       audioRef.current.pause();
       audioRef.current.currentTime = 0;
+      audioRef.current.removeAttribute('src');
     }
     setIsPlaying(false);
     
@@ -39,6 +85,7 @@ const BedtimeSlideshow = () => {
       // Use our new API endpoint instead of direct file access
       const baseUrl = '/api/media';
       setCurrentStoryBaseUrl(baseUrl);
+      setCurrentStoryId(storyId);
       
       console.log(`Loading story: ${storyId} from API endpoint: ${baseUrl}`);
       
@@ -46,12 +93,7 @@ const BedtimeSlideshow = () => {
       const segmentsUrl = `${baseUrl}/${storyId}/story_segments.json`;
       console.log(`Fetching story segments from: ${segmentsUrl}`);
       
-      const response = await fetch(segmentsUrl);
-      if (!response.ok) {
-        throw new Error(`Failed to load story segments: ${response.status} ${response.statusText}`);
-      }
-      
-      const data = await response.json();
+      const data = await fetchStorySegments(segmentsUrl);
       
       // Set story title from JSON or fallback to folder name
       if (data.title) {
@@ -61,14 +103,12 @@ const BedtimeSlideshow = () => {
       }
       
       // Set segments
-      setStorySegments(data.segments || data);
-      
-      // Set audio directly through our API
-      const audioUrl = `${baseUrl}/${storyId}/story_audio.mp3`;
-      console.log(`Setting audio URL: ${audioUrl}`);
+      setStorySegments(data.segments);
       
+      // Set audio directly through our API once the narration exists
       if (audioRef.current) {
-        audioRef.current.src = audioUrl;
+        const manifest = await fetchManifest(baseUrl, storyId);
+        applyManifest(manifest, baseUrl, storyId);
         // We'll wait for the audio's onloadedmetadata event to set audioLoaded to true
       } else {
         console.error('Audio ref is null');
@@ -104,7 +144,11 @@ const BedtimeSlideshow = () => {
       {/* Update the image src if it exists in the JSX */}
       {currentSlide !== null && slides.length > 0 && (
         <div className="slide-container">
-          {!imageErrors[currentSlide] ? (
+          {assetStatus[storySegments[currentSlide]?.image] === 'pending' ? (
+            <div className="pending-message">
+              This picture is still being painted...
+            </div>
+          ) : !imageErrors[currentSlide] ? (
             <img
               src={`${currentStoryBaseUrl}/${currentStoryId}/${storySegments[currentSlide]?.image}`}
               alt={`Illustration for slide ${currentSlide + 1}`}
@@ -2,6 +2,8 @@
 from PIL import Image, ImageDraw, ImageFont
 import os
 
+from atomic_io import save_image_atomic
+
 def create_placeholder(output_path):
     """Create a standard placeholder image."""
     # Create a placeholder image with text
@@ -48,7 +50,7 @@ def create_placeholder(output_path):
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
     
     # Save the image
-    image.save(output_path)
+    save_image_atomic(image, output_path)
     print(f"Created placeholder image at {output_path}")
 
 if __name__ == "__main__":
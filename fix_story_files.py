@@ -1,6 +1,5 @@
 #!/usr/bin/env python3
 import os
-import json
 import logging
 import subprocess
 import time
@@ -10,6 +9,13 @@ from dotenv import load_dotenv
 import requests
 from openai import OpenAI
 
+from atomic_io import atomic_path, save_image_atomic, story_lock, write_text_atomic
+from regen_queue import record_failure
+from story_catalog import record_story
+from story_deploy import DeployError, deploy_library, open_target
+from story_segments import SegmentsError, load_segments, write_segments
+from story_validator import validate_story_dir
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -35,22 +41,37 @@ tts_model = os.getenv("TTS_MODEL", "tts-1")
 # Define the base directory
 base_dir = Path("public/output")
 
+# Deploy target for fixed stories (see story_deploy.py); without one, changes go through git
+publish_target = os.getenv("PUBLISH_TARGET")
+
 def check_required_files(story_dir: Path) -> Dict[str, bool]:
-    """Check for required files in the story directory."""
+    """Check that the required files in the story directory have real content.
+
+    Zero-byte audio (the TTS failure placeholder), unparseable JSON and empty
+    text count as absent, so they get recreated. Images that exist but are
+    placeholders are listed separately in "placeholder_images".
+    """
+    report = validate_story_dir(story_dir)
+    assets = report["assets"]
     status = {
-        "story_segments.json": os.path.exists(story_dir / "story_segments.json"),
-        "story.txt": os.path.exists(story_dir / "story.txt"),
-        "story_audio.mp3": os.path.exists(story_dir / "story_audio.mp3"),
+        "story_segments.json": assets["story_segments.json"]["parsed"],
+        "story.txt": assets["story.txt"]["ok"],
+        "story_audio.mp3": assets["story_audio.mp3"]["ok"],
     }
     
     # Check for images
     missing_images = []
+    placeholder_images = []
     for i in range(1, 11):
-        image_path = story_dir / f"image_{i}.png"
-        if not image_path.exists():
-            missing_images.append(f"image_{i}.png")
+        image_name = f"image_{i}.png"
+        image_report = assets[image_name]
+        if "missing" in image_report["problems"]:
+            missing_images.append(image_name)
+        elif not image_report["ok"]:
+            placeholder_images.append(image_name)
     
     status["missing_images"] = missing_images
+    status["placeholder_images"] = placeholder_images
     
     return status
 
@@ -58,11 +79,10 @@ def fix_segment_timings(story_dir: Path) -> bool:
     """Fix segment timings in story_segments.json if needed."""
     try:
         json_path = story_dir / "story_segments.json"
-        with open(json_path, "r") as f:
-            data = json.load(f)
-        
-        if "segments" not in data:
-            logger.error(f"Invalid story_segments.json format in {story_dir.name}: missing 'segments' key")
+        try:
+            data = load_segments(json_path)
+        except SegmentsError as e:
+            logger.error(f"Invalid story_segments.json format in {story_dir.name}: {e}")
             return False
         
         segments = data["segments"]
@@ -102,8 +122,7 @@ def fix_segment_timings(story_dir: Path) -> bool:
                 segment["end"] = (i + 1) * segment_duration
             
             # Save updated JSON
-            with open(json_path, "w") as f:
-                json.dump(data, f, indent=2)
+            write_segments(json_path, data)
             
             logger.info(f"Updated segment timings for {story_dir.name}")
             return True
@@ -148,7 +167,8 @@ def create_placeholder_image(story_dir: Path, image_name: str) -> bool:
         
         # Save the image
         image_path = story_dir / image_name
-        image.save(image_path)
+        save_image_atomic(image, image_path)
+        record_failure(story_dir, image_name, "image missing, placeholder created")
         
         logger.info(f"Created placeholder image: {image_path}")
         return True
@@ -159,19 +179,12 @@ def create_placeholder_image(story_dir: Path, image_name: str) -> bool:
 def create_story_txt(story_dir: Path) -> bool:
     """Create story.txt from story_segments.json."""
     try:
-        with open(story_dir / "story_segments.json", "r") as f:
-            data = json.load(f)
-        
-        if "segments" in data:
-            segments = data["segments"]
-        else:
-            # Handle case where the JSON might be just an array
-            segments = data
+        # load_segments also accepts the legacy bare-array shape
+        segments = load_segments(story_dir / "story_segments.json")["segments"]
         
         full_story = "\n\n".join(segment["text"] for segment in segments if "text" in segment)
         
-        with open(story_dir / "story.txt", "w") as f:
-            f.write(full_story)
+        write_text_atomic(story_dir / "story.txt", full_story)
         
         logger.info(f"Created story.txt for {story_dir.name}")
         return True
@@ -205,7 +218,8 @@ def generate_story_audio(story_dir: Path) -> bool:
         
         # Save the audio file
         audio_path = story_dir / "story_audio.mp3"
-        audio_file.stream_to_file(str(audio_path))
+        with atomic_path(audio_path) as tmp_path:
+            audio_file.stream_to_file(str(tmp_path))
         
         logger.info(f"Created story_audio.mp3 for {story_dir.name}")
         
@@ -258,6 +272,65 @@ def commit_changes() -> bool:
     logger.info("Successfully committed and pushed changes")
     return True
 
+def publish_changes() -> bool:
+    """Upload only the changed files of the library to PUBLISH_TARGET."""
+    try:
+        stats = deploy_library(base_dir, open_target(publish_target))
+    except (DeployError, OSError) as e:
+        logger.error(f"Error publishing to {publish_target}: {e}")
+        return False
+    logger.info(f"Published {stats['uploaded']} changed files ({stats['uploaded_bytes'] / 1e6:.1f} MB) "
+                f"to {publish_target}, {stats['deleted']} deleted")
+    return True
+
+def fix_story(story_dir: Path) -> bool:
+    """Repair one story folder. Returns True if any file was changed.
+
+    Callers hold the story lock, so a generator or another fixer never sees
+    (or overwrites) a half-repaired story.
+    """
+    changes = False
+    
+    # Check required files
+    status = check_required_files(story_dir)
+    
+    # Fix segment timings if needed
+    if status["story_segments.json"]:
+        if fix_segment_timings(story_dir):
+            changes = True
+    
+    # Create missing placeholder images
+    if status["missing_images"]:
+        logger.warning(f"Missing images in {story_dir.name}: {', '.join(status['missing_images'])}")
+        for image_name in status["missing_images"]:
+            if create_placeholder_image(story_dir, image_name):
+                changes = True
+    
+    if status["placeholder_images"]:
+        logger.warning(f"Placeholder or invalid images in {story_dir.name}: {', '.join(status['placeholder_images'])}")
+        for image_name in status["placeholder_images"]:
+            record_failure(story_dir, image_name, "placeholder or invalid image")
+    
+    # Check and create story.txt if needed
+    if not status["story.txt"] and status["story_segments.json"]:
+        if create_story_txt(story_dir):
+            changes = True
+    
+    # Check and create story_audio.mp3 if needed
+    if not status["story_audio.mp3"]:
+        # Ensure story.txt exists first
+        if not status["story.txt"]:
+            if not create_story_txt(story_dir):
+                logger.error(f"Cannot proceed with audio generation: Failed to create story.txt for {story_dir.name}")
+                return changes
+        
+        # Now try to generate audio
+        if generate_story_audio(story_dir):
+            changes = True
+    
+    record_story(story_dir)
+    return changes
+
 def main():
     """Main function to process all story folders."""
     if not base_dir.exists():
@@ -280,41 +353,16 @@ def main():
     for i, story_dir in enumerate(story_folders, 1):
         logger.info(f"Processing folder {i}/{total_folders}: {story_dir.name}")
         
-        # Check required files
-        status = check_required_files(story_dir)
-        
-        # Fix segment timings if needed
-        if status["story_segments.json"]:
-            if fix_segment_timings(story_dir):
-                changes_made = True
-        
-        # Create missing placeholder images
-        if status["missing_images"]:
-            logger.warning(f"Missing images in {story_dir.name}: {', '.join(status['missing_images'])}")
-            for image_name in status["missing_images"]:
-                if create_placeholder_image(story_dir, image_name):
-                    changes_made = True
-        
-        # Check and create story.txt if needed
-        if not status["story.txt"] and status["story_segments.json"]:
-            if create_story_txt(story_dir):
-                changes_made = True
-        
-        # Check and create story_audio.mp3 if needed
-        if not status["story_audio.mp3"]:
-            # Ensure story.txt exists first
-            if not status["story.txt"]:
-                if not create_story_txt(story_dir):
-                    logger.error(f"Cannot proceed with audio generation: Failed to create story.txt for {story_dir.name}")
-                    continue
-            
-            # Now try to generate audio
-            if generate_story_audio(story_dir):
+        with story_lock(story_dir):
+            if fix_story(story_dir):
                 changes_made = True
     
-    # Commit changes if any were made
-    if changes_made:
-        logger.info("Attempting to commit and push changes...")
+    # Publish changes if any were made
+    if changes_made and publish_target:
+        logger.info(f"Publishing changed files to {publish_target}...")
+        publish_changes()
+    elif changes_made:
+        logger.info("PUBLISH_TARGET is not set; attempting to commit and push changes...")
         commit_changes()
     else:
         logger.info("No changes were made, skipping git operations")
@@ -0,0 +1,403 @@
+#!/usr/bin/env python3
+"""
+Story Idea Pool
+
+A persistent SQLite pool (idea_pool.db) of story ideas that generation runs
+draw from instead of asking GPT-4 for fresh ideas every time. Ideas are
+generated in bulk and checked against everything the pool has seen before
+being accepted: pending and used ideas, plus the titles of the stories
+already in the library. A fourth "sleepy dragon" story is therefore
+rejected before it can cost ten images and a narration.
+
+Similarity is estimated locally with MinHash signatures over character
+3-grams of the normalized title and, if there is one, the premise. Banded
+LSH keys, stored in the same database, limit each check to a few likely
+candidates. An idea is a duplicate when its title, or its premise,
+resembles an earlier one at least as closely as TITLE_THRESHOLD or
+PREMISE_THRESHOLD.
+
+Usage:
+    python idea_pool.py seed [public/output]     # index the library's existing titles
+    python idea_pool.py fill --target 50         # generate ideas until 50 are pending
+    python idea_pool.py check "The Sleepy Dragon" "A dragon who cannot fall asleep"
+    python idea_pool.py status
+"""
+
+import re
+import sys
+import json
+import time
+import random
+import sqlite3
+import hashlib
+import logging
+import argparse
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from atomic_io import sqlite_journal_mode
+
+logger = logging.getLogger(__name__)
+
+# Constants
+POOL_DB = Path("idea_pool.db")
+OUTPUT_DIR = Path("public/output")
+SHINGLE_SIZE = 3
+NUM_PERMUTATIONS = 64
+BANDS = 32  # 32 bands of 2 rows: pairs at 0.5 similarity almost always share a band
+ROWS_PER_BAND = NUM_PERMUTATIONS // BANDS
+TITLE_THRESHOLD = 0.5
+PREMISE_THRESHOLD = 0.5
+CLAIM_TIMEOUT = 3600  # seconds before an unfinished claim returns to the pool
+MAX_FILL_CALLS = 10  # idea requests per refill before giving up on finding new ideas
+STOPWORDS = {"a", "an", "the", "of", "and", "to", "in", "on", "who", "that", "with", "for", "his", "her", "their"}
+
+# Fixed seed so signatures stay comparable across runs and machines
+_MERSENNE_PRIME = (1 << 61) - 1
+_rng = random.Random(20240601)
+_PERMUTATIONS = [(_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME)) for _ in range(NUM_PERMUTATIONS)]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS ideas (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    title TEXT NOT NULL,
+    premise TEXT,
+    source TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    title_signature TEXT NOT NULL,
+    premise_signature TEXT,
+    story_dir TEXT UNIQUE,
+    created_at REAL NOT NULL,
+    claimed_at REAL
+);
+CREATE INDEX IF NOT EXISTS ideas_status ON ideas (status, id);
+CREATE TABLE IF NOT EXISTS idea_bands (
+    kind TEXT NOT NULL,
+    band INTEGER NOT NULL,
+    key TEXT NOT NULL,
+    idea_id INTEGER NOT NULL REFERENCES ideas (id) ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS idea_bands_key ON idea_bands (kind, band, key);
+CREATE TABLE IF NOT EXISTS pool_stats (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+
+def normalize(text: str) -> str:
+    """Lowercase, drop punctuation and filler words."""
+    words = re.sub(r"[^\w\s]", "", (text or "").lower()).split()
+    return " ".join(word for word in words if word not in STOPWORDS)
+
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> set:
+    text = normalize(text)
+    if len(text) <= size:
+        return {text} if text else set()
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+def minhash(text: str) -> List[int]:
+    """MinHash signature of the text's character shingles."""
+    hashes = [int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "big") for s in shingles(text)]
+    if not hashes:
+        return [_MERSENNE_PRIME] * NUM_PERMUTATIONS
+    return [min((a * h + b) % _MERSENNE_PRIME for h in hashes) for a, b in _PERMUTATIONS]
+
+
+def similarity(signature_a: List[int], signature_b: List[int]) -> float:
+    """Estimated Jaccard similarity of the shingle sets behind two signatures."""
+    return sum(1 for a, b in zip(signature_a, signature_b) if a == b) / NUM_PERMUTATIONS
+
+
+def band_keys(signature: List[int]) -> List[str]:
+    return [
+        hashlib.blake2b(repr(signature[i:i + ROWS_PER_BAND]).encode(), digest_size=8).hexdigest()
+        for i in range(0, NUM_PERMUTATIONS, ROWS_PER_BAND)
+    ]
+
+
+def connect(db_path: Path = POOL_DB) -> sqlite3.Connection:
+    """Open the pool database, creating the schema if needed."""
+    conn = sqlite3.connect(str(db_path), timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute(f"PRAGMA journal_mode={sqlite_journal_mode()}")
+    conn.execute("PRAGMA foreign_keys=ON")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def _bump(conn: sqlite3.Connection, name: str, amount: int = 1) -> None:
+    conn.execute(
+        "INSERT INTO pool_stats (name, value) VALUES (?, ?) ON CONFLICT (name) DO UPDATE SET value = value + excluded.value",
+        (name, amount),
+    )
+
+
+def _candidates(conn: sqlite3.Connection, kind: str, signature: List[int]) -> List[int]:
+    keys = band_keys(signature)
+    clauses = " OR ".join("(band = ? AND key = ?)" for _ in keys)
+    params = [value for band, key in enumerate(keys) for value in (band, key)]
+    rows = conn.execute(f"SELECT DISTINCT idea_id FROM idea_bands WHERE kind = ? AND ({clauses})", [kind] + params)
+    return [row["idea_id"] for row in rows]
+
+
+def find_similar(conn: sqlite3.Connection, title: str, premise: Optional[str] = None) -> Optional[Dict]:
+    """Return the most similar known idea above the thresholds, or None."""
+    best = None
+    checks = [("title", minhash(title), TITLE_THRESHOLD)]
+    if premise and normalize(premise):
+        checks.append(("premise", minhash(premise), PREMISE_THRESHOLD))
+    for kind, signature, threshold in checks:
+        for idea_id in _candidates(conn, kind, signature):
+            row = conn.execute("SELECT * FROM ideas WHERE id = ?", (idea_id,)).fetchone()
+            score = similarity(signature, json.loads(row[f"{kind}_signature"]))
+            if score >= threshold and (best is None or score > best["similarity"]):
+                best = {"id": row["id"], "title": row["title"], "status": row["status"], "match": kind, "similarity": round(score, 3)}
+    return best
+
+
+def add_idea(conn: sqlite3.Connection, title: str, premise: Optional[str] = None, source: str = "generated",
+             status: str = "pending", story_dir: Optional[Path] = None) -> Optional[int]:
+    """Add an idea unless it duplicates a known one. Returns its id, or None if rejected."""
+    title = (title or "").strip()
+    if not normalize(title):
+        return None
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        duplicate = find_similar(conn, title, premise)
+        if duplicate is not None:
+            _bump(conn, "duplicates_rejected")
+            conn.execute("COMMIT")
+            logger.info(f"Rejected '{title}': {duplicate['similarity']:.0%} {duplicate['match']} match with '{duplicate['title']}'")
+            return None
+        title_signature = minhash(title)
+        premise_signature = minhash(premise) if premise and normalize(premise) else None
+        cursor = conn.execute(
+            "INSERT INTO ideas (title, premise, source, status, title_signature, premise_signature, story_dir, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (title, premise, source, status, json.dumps(title_signature),
+             json.dumps(premise_signature) if premise_signature else None,
+             str(Path(story_dir).resolve()) if story_dir else None, time.time()),
+        )
+        idea_id = cursor.lastrowid
+        bands = [("title", band, key) for band, key in enumerate(band_keys(title_signature))]
+        if premise_signature:
+            bands += [("premise", band, key) for band, key in enumerate(band_keys(premise_signature))]
+        conn.executemany("INSERT INTO idea_bands (kind, band, key, idea_id) VALUES (?, ?, ?, ?)",
+                         [(kind, band, key, idea_id) for kind, band, key in bands])
+        conn.execute("COMMIT")
+        return idea_id
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def seed_from_library(conn: sqlite3.Connection, root: Path = OUTPUT_DIR) -> int:
+    """Index the titles of stories already in the library. Returns how many were new.
+
+    Folders of stories still being generated are indexed too; mark_used
+    later replaces their library row with the idea that produced them.
+    """
+    # Imported lazily: only needed when a library exists
+    from story_segments import load_segments
+    from story_validator import find_story_dirs
+
+    known = {row["story_dir"] for row in conn.execute("SELECT story_dir FROM ideas WHERE story_dir IS NOT NULL")}
+    added = 0
+    for story_dir in find_story_dirs(Path(root)):
+        if str(story_dir.resolve()) in known:
+            continue
+        try:
+            title = load_segments(story_dir / "story_segments.json").get("title")
+        except (OSError, ValueError):
+            title = None
+        title = title or story_dir.name.replace("-", " ")
+        # Library stories are indexed even when two of them are alike
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            signature = minhash(title)
+            # Another run may have recorded this folder since known was read
+            cursor = conn.execute(
+                "INSERT INTO ideas (title, source, status, title_signature, story_dir, created_at) "
+                "VALUES (?, 'library', 'used', ?, ?, ?) ON CONFLICT (story_dir) DO NOTHING",
+                (title, json.dumps(signature), str(story_dir.resolve()), time.time()),
+            )
+            if cursor.rowcount:
+                conn.executemany("INSERT INTO idea_bands (kind, band, key, idea_id) VALUES ('title', ?, ?, ?)",
+                                 [(band, key, cursor.lastrowid) for band, key in enumerate(band_keys(signature))])
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        added += cursor.rowcount
+    return added
+
+
+def fill_pool(conn: sqlite3.Connection, generate_ideas: Callable[[int], List[Tuple[str, str]]],
+              target: int, batch_size: int = 10, max_calls: int = MAX_FILL_CALLS) -> Dict[str, int]:
+    """Request ideas in batches until target ideas are pending (or max_calls is reached)."""
+    counts = {"requested": 0, "added": 0, "rejected": 0}
+    for _ in range(max_calls):
+        pending = pool_status(conn).get("pending", 0)
+        if pending >= target:
+            break
+        ideas = generate_ideas(max(1, min(batch_size, target - pending)))
+        for title, premise in ideas:
+            counts["requested"] += 1
+            if add_idea(conn, title, premise) is None:
+                counts["rejected"] += 1
+            else:
+                counts["added"] += 1
+        if not ideas:
+            break
+    return counts
+
+
+def claim_idea(conn: sqlite3.Connection) -> Optional[sqlite3.Row]:
+    """Atomically take the oldest pending idea."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # Claims abandoned by a crashed run go back to the pool
+        conn.execute("UPDATE ideas SET status = 'pending', claimed_at = NULL WHERE status = 'claimed' AND claimed_at < ?",
+                     (time.time() - CLAIM_TIMEOUT,))
+        idea = conn.execute("SELECT * FROM ideas WHERE status = 'pending' ORDER BY id LIMIT 1").fetchone()
+        if idea is not None:
+            conn.execute("UPDATE ideas SET status = 'claimed', claimed_at = ? WHERE id = ?", (time.time(), idea["id"]))
+        conn.execute("COMMIT")
+        return idea
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def mark_used(conn: sqlite3.Connection, idea_id: int, story_dir: Optional[Path] = None) -> None:
+    """Record that idea_id became the story in story_dir.
+
+    Seeding may already have indexed the new folder as a library story; that
+    row is replaced by the idea, which carries the same title.
+    """
+    story_dir = str(Path(story_dir).resolve()) if story_dir else None
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if story_dir is not None:
+            conn.execute("DELETE FROM ideas WHERE story_dir = ? AND source = 'library' AND id != ?", (story_dir, idea_id))
+        conn.execute("UPDATE ideas SET status = 'used', story_dir = ? WHERE id = ?", (story_dir, idea_id))
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def release_idea(conn: sqlite3.Connection, idea_id: int) -> None:
+    """Return a claimed idea to the pool (e.g. its story failed before any spend)."""
+    conn.execute("UPDATE ideas SET status = 'pending', claimed_at = NULL WHERE id = ? AND status = 'claimed'", (idea_id,))
+
+
+def draw_ideas(conn: sqlite3.Connection, count: int, generate_ideas: Callable[[int], List[Tuple[str, str]]],
+               batch_size: int = 10, root: Optional[Path] = OUTPUT_DIR) -> Iterator[Tuple[int, str, str]]:
+    """Yield up to count (idea_id, title, premise) claims, refilling the pool in batches as it runs dry.
+
+    The caller marks each idea used (or releases it) when its story is done.
+    """
+    if root is not None and Path(root).exists():
+        seed_from_library(conn, root)
+    for drawn in range(count):
+        idea = claim_idea(conn)
+        if idea is None:
+            fill_pool(conn, generate_ideas, min(batch_size, count - drawn), batch_size)
+            idea = claim_idea(conn)
+        if idea is None:
+            logger.warning(f"Idea pool is exhausted: no new ideas after {MAX_FILL_CALLS} requests")
+            return
+        yield idea["id"], idea["title"], idea["premise"] or ""
+
+
+def take_idea(generate_ideas: Callable[[int], List[Tuple[str, str]]], db_path: Path = POOL_DB,
+              root: Optional[Path] = None) -> Optional[Tuple[int, str, str]]:
+    """Claim a single idea with a short-lived connection (for workers that make one story at a time).
+
+    The library is not re-indexed on every claim; call seed_pool once when the worker starts.
+    """
+    conn = connect(db_path)
+    try:
+        return next(draw_ideas(conn, 1, generate_ideas, root=root), None)
+    finally:
+        conn.close()
+
+
+def seed_pool(root: Path = OUTPUT_DIR, db_path: Path = POOL_DB) -> int:
+    """Index the library's titles with a short-lived connection. Returns how many were new."""
+    if not Path(root).exists():
+        return 0
+    conn = connect(db_path)
+    try:
+        return seed_from_library(conn, root)
+    finally:
+        conn.close()
+
+
+def finish_idea(idea_id: int, story_dir: Optional[Path], db_path: Path = POOL_DB) -> None:
+    """Mark an idea used with a short-lived connection."""
+    conn = connect(db_path)
+    try:
+        mark_used(conn, idea_id, story_dir)
+    finally:
+        conn.close()
+
+
+def pool_status(conn: sqlite3.Connection) -> Dict[str, int]:
+    rows = conn.execute("SELECT status, COUNT(*) AS n FROM ideas GROUP BY status")
+    return {row["status"]: row["n"] for row in rows}
+
+
+def main():
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+    parser = argparse.ArgumentParser(description="Maintain a de-duplicated pool of story ideas")
+    parser.add_argument("--db", default=str(POOL_DB), help=f"Pool database (default: {POOL_DB})")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    seed_parser = subparsers.add_parser("seed", help="Index the titles of existing library stories")
+    seed_parser.add_argument("root", nargs="?", default=str(OUTPUT_DIR), help=f"Story library (default: {OUTPUT_DIR})")
+
+    fill_parser = subparsers.add_parser("fill", help="Generate ideas until enough are pending")
+    fill_parser.add_argument("--target", type=int, default=50, help="Pending ideas to aim for (default: 50)")
+    fill_parser.add_argument("--batch", type=int, default=10, help="Ideas per GPT-4 request (default: 10)")
+    fill_parser.add_argument("--max-calls", type=int, default=MAX_FILL_CALLS, help=f"Request limit (default: {MAX_FILL_CALLS})")
+
+    check_parser = subparsers.add_parser("check", help="Show whether an idea duplicates a known one")
+    check_parser.add_argument("title")
+    check_parser.add_argument("premise", nargs="?")
+
+    subparsers.add_parser("status", help="Show pool counts")
+    args = parser.parse_args()
+    conn = connect(Path(args.db))
+
+    if args.command == "seed":
+        print(f"Indexed {seed_from_library(conn, Path(args.root))} library stories")
+    elif args.command == "fill":
+        # Imported lazily: the generator needs OPENAI_API_KEY
+        from bedtime_story_generator import generate_story_ideas
+
+        seed_from_library(conn, OUTPUT_DIR)
+        counts = fill_pool(conn, generate_story_ideas, args.target, args.batch, args.max_calls)
+        print(f"Requested {counts['requested']} ideas: added {counts['added']}, rejected {counts['rejected']} duplicates")
+        print(f"Pool status: {json.dumps(pool_status(conn))}")
+    elif args.command == "check":
+        match = find_similar(conn, args.title, args.premise)
+        print(json.dumps(match) if match else "No similar idea found")
+    else:
+        status = pool_status(conn)
+        rejected = conn.execute("SELECT value FROM pool_stats WHERE name = 'duplicates_rejected'").fetchone()
+        print(f"Pool status: {json.dumps(status)}; {rejected['value'] if rejected else 0} duplicates rejected so far")
+    conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
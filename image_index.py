@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+"""
+Story Image Index
+
+Fingerprints every image_N.png in the story libraries (output/ and
+public/output/), and finds duplicates and placeholders without anyone
+eyeballing folders:
+
+    python image_index.py build            # index new and changed images
+    python image_index.py dupes            # near-duplicate images and duplicated story folders
+    python image_index.py placeholders --enqueue
+    python image_index.py similar some/image.png
+
+Fingerprints. Each image is shrunk to 32x32. A worker process turns a batch
+of these thumbnails into NumPy arrays and fingerprints the whole batch at
+once:
+- the perceptual hash (pHash): a 2-D DCT of the grayscale thumbnail, whose
+  8x8 lowest frequencies are compared to their median to give 64 bits;
+- the mean colour;
+- the brightness spread.
+Images that look alike have hashes a few bits apart, even after resizing or
+re-encoding. The hashes are compared by Hamming distance.
+
+Index. The fingerprints are kept in SQLite (image_index.db). An image is
+hashed again only when its size or mtime changes, and images that no longer
+exist are dropped. A query loads the 64-bit hashes into one NumPy array and
+compares them all at once, which takes milliseconds for tens of thousands
+of images.
+
+Placeholder-like images are flat: the gray fallback the generator writes,
+the midnight-blue "Image Not Available" card from fix_story_files.py, and
+any other near-solid picture. With --enqueue they go on the regeneration
+queue (regen_queue.py). Near-duplicates are only reported; a pair of story
+folders that share most of their images is usually one story generated
+twice, and choosing which copy to delete is left to a person.
+
+Usage:
+    python image_index.py build --workers 4
+    python image_index.py build output --db /tmp/images.db
+    python image_index.py dupes --distance 4 --json
+    python image_index.py placeholders
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import sqlite3
+import logging
+import argparse
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from atomic_io import sqlite_journal_mode
+from story_validator import find_story_dirs
+
+logger = logging.getLogger(__name__)
+
+# Constants
+INDEX_DB = Path("image_index.db")
+LIBRARY_ROOTS = (Path("output"), Path("public/output"))
+IMAGE_NAME = re.compile(r"^image_\d+\.png$")
+THUMBNAIL_SIZE = 32  # pHash works on a 32x32 grayscale thumbnail
+HASH_SIZE = 8  # the 8x8 lowest DCT frequencies give a 64-bit hash
+BATCH_SIZE = 32  # images fingerprinted per worker task
+DEFAULT_DISTANCE = 6  # Hamming distance (of 64 bits) that counts as a near-duplicate
+FLAT_STD = 10.0  # grayscale spread below which an image is flat, i.e. placeholder-like
+COLOR_TOLERANCE = 20.0  # distance in RGB to a known placeholder colour
+PLACEHOLDER_COLORS = {
+    "gray placeholder": (211, 211, 211),  # bedtime_story_generator.py's 'lightgray' fallback
+    "midnight-blue placeholder": (25, 25, 112),  # fix_story_files.py and create_placeholder.py
+}
+DUPLICATE_STORY_SHARE = 0.5  # stories sharing this share of their images are duplicates
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    path TEXT PRIMARY KEY,
+    story TEXT NOT NULL,
+    name TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    width INTEGER,
+    height INTEGER,
+    phash INTEGER,
+    mean_r REAL,
+    mean_g REAL,
+    mean_b REAL,
+    std REAL,
+    error TEXT,
+    indexed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS images_story ON images (story);
+"""
+
+# Set bits in every byte value, for a vectorized popcount
+POPCOUNT = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint8)
+
+
+def connect(db_path: Path = INDEX_DB) -> sqlite3.Connection:
+    """Open the index database, creating the schema if needed."""
+    conn = sqlite3.connect(str(db_path), timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute(f"PRAGMA journal_mode={sqlite_journal_mode()}")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def _dct_matrix(size: int) -> np.ndarray:
+    """Orthonormal DCT-II basis: dct(x) = D @ x, and a 2-D DCT is D @ X @ D.T."""
+    k = np.arange(size)[:, None]
+    n = np.arange(size)[None, :]
+    matrix = np.sqrt(2 / size) * np.cos(np.pi * (2 * n + 1) * k / (2 * size))
+    matrix[0] /= np.sqrt(2)
+    return matrix
+
+
+DCT = _dct_matrix(THUMBNAIL_SIZE)
+
+
+def phash_batch(gray: np.ndarray) -> np.ndarray:
+    """Perceptual hashes of a (n, 32, 32) stack of grayscale thumbnails, as uint64."""
+    coefficients = (DCT @ gray @ DCT.T)[:, :HASH_SIZE, :HASH_SIZE].reshape(len(gray), -1)
+    # The DC term is just the mean brightness, so it is left out of the median
+    median = np.median(coefficients[:, 1:], axis=1)
+    bits = coefficients > median[:, None]
+    return np.packbits(bits, axis=1).view(">u8").ravel().astype(np.uint64)
+
+
+def hamming(hashes: np.ndarray, other) -> np.ndarray:
+    """Bits that differ between each of hashes and other (one hash, or an array of the same shape)."""
+    differing = np.bitwise_xor(hashes, np.uint64(other) if np.isscalar(other) else other)
+    return POPCOUNT[np.ascontiguousarray(differing).view(np.uint8)].reshape(*differing.shape, 8).sum(axis=-1)
+
+
+def fingerprint_batch(paths: List[str]) -> List[Dict]:
+    """Fingerprint images in one worker process: load thumbnails, then hash them as a batch."""
+    records, thumbnails = [], []
+    for path in paths:
+        record = {"path": path}
+        try:
+            with Image.open(path) as image:
+                record["width"], record["height"] = image.size
+                image.draft("RGB", (THUMBNAIL_SIZE * 4, THUMBNAIL_SIZE * 4))  # JPEGs decode at a fraction of full size
+                thumbnail = image.convert("RGB").resize((THUMBNAIL_SIZE, THUMBNAIL_SIZE), Image.BOX)
+            thumbnails.append(np.asarray(thumbnail, dtype=np.float64))
+        except (OSError, ValueError) as e:
+            record["error"] = f"{type(e).__name__}: {e}"
+        records.append(record)
+
+    if thumbnails:
+        rgb = np.stack(thumbnails)
+        gray = rgb @ np.array([0.299, 0.587, 0.114])
+        hashes = phash_batch(gray)
+        means = rgb.mean(axis=(1, 2))
+        spreads = gray.std(axis=(1, 2))
+        decoded = (record for record in records if "error" not in record)
+        for record, phash, mean, spread in zip(decoded, hashes, means, spreads):
+            record.update(phash=int(phash), mean=[round(float(c), 2) for c in mean], std=round(float(spread), 3))
+    return records
+
+
+def find_images(roots: Iterable[Path]) -> List[Path]:
+    """Every image_N.png in the story folders under roots."""
+    images = []
+    for root in roots:
+        for story_dir in find_story_dirs(Path(root)):
+            images.extend(sorted(p for p in story_dir.iterdir() if IMAGE_NAME.match(p.name)))
+    return images
+
+
+def _to_signed(value: int) -> int:
+    # SQLite integers are signed 64-bit
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def build_index(conn: sqlite3.Connection, roots: Iterable[Path] = LIBRARY_ROOTS,
+                workers: Optional[int] = None) -> Dict[str, int]:
+    """Fingerprint new and changed images under roots and drop vanished ones. Returns counts."""
+    roots = [Path(root) for root in roots]
+    known = {row["path"]: (row["size"], row["mtime_ns"]) for row in conn.execute("SELECT path, size, mtime_ns FROM images")}
+    seen, stale = set(), []
+    for image in find_images(roots):
+        path = str(image)
+        stat = image.stat()
+        seen.add(path)
+        if known.get(path) != (stat.st_size, stat.st_mtime_ns):
+            stale.append((path, stat))
+
+    path_batches = [[path for path, _ in stale[i:i + BATCH_SIZE]] for i in range(0, len(stale), BATCH_SIZE)]
+    if len(path_batches) <= 1 or workers == 1:
+        results = [fingerprint_batch(paths) for paths in path_batches]
+    else:
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+            results = list(pool.map(fingerprint_batch, path_batches))
+
+    rows = []
+    for (path, stat), record in zip(stale, (record for records in results for record in records)):
+        image = Path(path)
+        mean = record.get("mean") or [None] * 3
+        rows.append((path, image.parent.name, image.name, stat.st_size, stat.st_mtime_ns,
+                     record.get("width"), record.get("height"),
+                     _to_signed(record["phash"]) if "phash" in record else None,
+                     *mean, record.get("std"), record.get("error"), time.time()))
+    conn.executemany("INSERT OR REPLACE INTO images VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+    errors = sum(1 for row in rows if row[12] is not None)
+
+    # Only forget images under the roots just scanned
+    prefixes = tuple(str(root) + os.sep for root in roots)
+    removed = [path for path in known if path not in seen and path.startswith(prefixes)]
+    conn.executemany("DELETE FROM images WHERE path = ?", [(path,) for path in removed])
+    return {"images": len(seen), "hashed": len(rows), "unchanged": len(seen) - len(stale),
+            "removed": len(removed), "errors": errors}
+
+
+def load_fingerprints(conn: sqlite3.Connection) -> Tuple[List[sqlite3.Row], np.ndarray]:
+    """The indexed images that could be decoded, and their hashes as one uint64 array."""
+    rows = conn.execute("SELECT * FROM images WHERE phash IS NOT NULL ORDER BY path").fetchall()
+    hashes = np.array([row["phash"] for row in rows], dtype=np.int64).view(np.uint64)
+    return rows, hashes
+
+
+def placeholder_reason(row) -> Optional[str]:
+    """Why an indexed image looks like a placeholder, or None."""
+    if row["std"] is None or row["std"] >= FLAT_STD:
+        return None
+    color = np.array([row["mean_r"], row["mean_g"], row["mean_b"]])
+    for name, reference in PLACEHOLDER_COLORS.items():
+        if np.linalg.norm(color - reference) <= COLOR_TOLERANCE:
+            return name
+    return f"flat image (brightness spread {row['std']:.1f})"
+
+
+def placeholder_like(conn: sqlite3.Connection) -> List[Dict]:
+    """Flat images, named after the known placeholder they match, plus images that could not be decoded."""
+    found = []
+    for row in conn.execute("SELECT * FROM images WHERE std < ? OR error IS NOT NULL ORDER BY path", (FLAT_STD,)):
+        found.append({"path": row["path"], "story": row["story"], "image": row["name"],
+                      "reason": row["error"] or placeholder_reason(row)})
+    return found
+
+
+def near_duplicates(conn: sqlite3.Connection, max_distance: int = DEFAULT_DISTANCE) -> List[Dict]:
+    """Pairs of images whose hashes differ in at most max_distance bits.
+
+    Flat images are left out: every solid placeholder hashes alike, and
+    placeholder_like() reports them already.
+    """
+    rows, hashes = load_fingerprints(conn)
+    keep = np.array([placeholder_reason(row) is None for row in rows], dtype=bool)
+    rows = [row for row, kept in zip(rows, keep) if kept]
+    hashes = hashes[keep]
+    pairs = []
+    for i in range(len(rows) - 1):
+        distances = hamming(hashes[i + 1:], hashes[i])
+        for offset in np.flatnonzero(distances <= max_distance):
+            j = i + 1 + int(offset)
+            pairs.append({"a": rows[i]["path"], "b": rows[j]["path"], "distance": int(distances[offset])})
+    return pairs
+
+
+def duplicate_stories(conn: sqlite3.Connection, pairs: List[Dict]) -> List[Dict]:
+    """Story folders that share at least DUPLICATE_STORY_SHARE of their images with another."""
+    counts: Dict[str, int] = {}
+    for row in conn.execute("SELECT path FROM images"):
+        story_dir = str(Path(row["path"]).parent)
+        counts[story_dir] = counts.get(story_dir, 0) + 1
+    shared: Dict[Tuple[str, str], set] = {}
+    for pair in pairs:
+        a, b = str(Path(pair["a"]).parent), str(Path(pair["b"]).parent)
+        if a != b:
+            # Count each image of the first story once, however many copies it has
+            shared.setdefault(tuple(sorted((a, b))), set()).add(pair["a"] if a < b else pair["b"])
+    stories = []
+    for (a, b), images in sorted(shared.items()):
+        smaller = min(counts.get(a, 0), counts.get(b, 0)) or 1
+        if len(images) / smaller >= DUPLICATE_STORY_SHARE:
+            stories.append({"a": a, "b": b, "shared_images": len(images), "of": smaller})
+    return stories
+
+
+def similar_to(conn: sqlite3.Connection, image_path: Path, max_distance: int = DEFAULT_DISTANCE) -> List[Dict]:
+    """Indexed images within max_distance of any image file, indexed or not, closest first."""
+    record = fingerprint_batch([str(image_path)])[0]
+    if "error" in record:
+        raise ValueError(f"{image_path}: {record['error']}")
+    rows, hashes = load_fingerprints(conn)
+    distances = hamming(hashes, record["phash"])
+    order = np.argsort(distances, kind="stable")
+    return [{"path": rows[i]["path"], "distance": int(distances[i])} for i in order if distances[i] <= max_distance]
+
+
+def enqueue_placeholders(found: List[Dict]) -> int:
+    """Queue placeholder-like images for regeneration. Returns how many were queued."""
+    from regen_queue import record_failure
+
+    for item in found:
+        record_failure(Path(item["path"]).parent, item["image"], f"placeholder-like image: {item['reason']}")
+    return len(found)
+
+
+def main():
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+    parser = argparse.ArgumentParser(description="Find duplicate and placeholder story images by perceptual hash")
+    parser.add_argument("--db", default=str(INDEX_DB), help=f"Index database (default: {INDEX_DB})")
+    parser.add_argument("--json", action="store_true", help="Print JSON")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = commands.add_parser("build", help="Fingerprint new and changed images")
+    build_parser.add_argument("roots", nargs="*", default=[str(root) for root in LIBRARY_ROOTS],
+                              help=f"Story libraries (default: {' '.join(str(root) for root in LIBRARY_ROOTS)})")
+    build_parser.add_argument("--workers", type=int, help="Worker processes (default: one per CPU core)")
+
+    dupes_parser = commands.add_parser("dupes", help="Near-duplicate images and duplicated story folders")
+    dupes_parser.add_argument("--distance", type=int, default=DEFAULT_DISTANCE,
+                              help=f"Most differing hash bits for a near-duplicate (default: {DEFAULT_DISTANCE})")
+
+    placeholders_parser = commands.add_parser("placeholders", help="Flat, placeholder-like and unreadable images")
+    placeholders_parser.add_argument("--enqueue", action="store_true", help="Queue them for regeneration (regen_queue.py)")
+
+    similar_parser = commands.add_parser("similar", help="Indexed images that look like an image file")
+    similar_parser.add_argument("image", help="Image file to compare")
+    similar_parser.add_argument("--distance", type=int, default=DEFAULT_DISTANCE,
+                                help=f"Most differing hash bits (default: {DEFAULT_DISTANCE})")
+    args = parser.parse_args()
+
+    conn = connect(Path(args.db))
+    started = time.perf_counter()
+    if args.command == "build":
+        result = build_index(conn, [Path(root) for root in args.roots], args.workers)
+        if not args.json:
+            print(f"Indexed {result['images']} images: {result['hashed']} hashed, {result['unchanged']} unchanged, "
+                  f"{result['removed']} removed, {result['errors']} unreadable "
+                  f"({time.perf_counter() - started:.2f}s)")
+    elif args.command == "dupes":
+        pairs = near_duplicates(conn, args.distance)
+        result = {"images": pairs, "stories": duplicate_stories(conn, pairs)}
+        if not args.json:
+            for story in result["stories"]:
+                print(f"Duplicated story: {story['a']} and {story['b']} share {story['shared_images']}/{story['of']} images")
+            for pair in pairs:
+                print(f"{pair['distance']:>2} bits  {pair['a']}  {pair['b']}")
+            print(f"{len(pairs)} near-duplicate pairs, {len(result['stories'])} duplicated stories "
+                  f"({(time.perf_counter() - started) * 1000:.0f} ms)")
+    elif args.command == "placeholders":
+        result = placeholder_like(conn)
+        if not args.json:
+            for item in result:
+                print(f"{item['path']}: {item['reason']}")
+            print(f"{len(result)} placeholder-like images ({(time.perf_counter() - started) * 1000:.0f} ms)")
+        if args.enqueue and result:
+            queued = enqueue_placeholders(result)
+            if not args.json:
+                print(f"Queued {queued} images for regeneration; run python regen_queue.py work")
+    else:
+        try:
+            result = similar_to(conn, Path(args.image), args.distance)
+        except ValueError as e:
+            logger.error(str(e))
+            return 1
+        if not args.json:
+            for match in result:
+                print(f"{match['distance']:>2} bits  {match['path']}")
+            print(f"{len(result)} similar images ({(time.perf_counter() - started) * 1000:.0f} ms)")
+    conn.close()
+    if args.json:
+        print(json.dumps(result, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+Run Instrumentation
+
+Structured timing and cost records for the generation pipeline. Every stage
+and API call runs inside `recorder.stage(...)`, which records its duration,
+outcome and any fields the caller adds (bytes, tokens, images, characters).
+Events are appended as JSON lines to run_logs/run-<timestamp>.jsonl, and at
+the end of a run a summary table is printed and written as the final event:
+
+    with recorder.stage("images.generate", model="dall-e-3") as stage:
+        response = client.images.generate(...)
+        stage["images"] = 1
+
+Costs are estimates from PRICES (USD). Update the table when pricing changes.
+Call `summarize_events(path)` on an existing events file to rebuild its summary.
+
+Usage:
+    python instrumentation.py run_logs/run-20250101-120000.jsonl
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import resource
+import threading
+import contextlib
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+# Constants
+LOG_DIR = Path("run_logs")
+
+# USD estimates: per 1K prompt/completion tokens, per image, per 1K TTS characters
+PRICES = {
+    "gpt-4": {"prompt_tokens": 0.03, "completion_tokens": 0.06},
+    "dall-e-3": {"images": 0.04},
+    "tts-1": {"characters": 0.015},
+}
+
+
+def estimate_cost(fields: Dict) -> float:
+    """Estimate the USD cost of one stage from its model and usage fields."""
+    prices = PRICES.get(fields.get("model"), {})
+    cost = 0.0
+    for key in ("prompt_tokens", "completion_tokens", "characters"):
+        if key in prices:
+            cost += fields.get(key, 0) / 1000 * prices[key]
+    if "images" in prices:
+        cost += fields.get("images", 0) * prices["images"]
+    return cost
+
+
+def usage_fields(response) -> Dict[str, int]:
+    """Extract token usage from an OpenAI chat completion response."""
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return {}
+    return {
+        "prompt_tokens": getattr(usage, "prompt_tokens", 0) or 0,
+        "completion_tokens": getattr(usage, "completion_tokens", 0) or 0,
+    }
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KB on Linux and bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of a list of durations."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(fraction * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+class RunRecorder:
+    """Thread-safe collector of stage events and per-stage aggregates."""
+
+    COUNTED_FIELDS = ("bytes", "prompt_tokens", "completion_tokens", "images", "characters")
+    SPEND_COUNTERS = ("hedges",)  # counters whose events carry real spend outside any stage (duplicate requests)
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.listeners = []
+        self.in_flight: Dict[str, int] = {}
+        self._reset(None)
+
+    def _reset(self, events_path: Optional[Path]) -> None:
+        self.run_id = uuid.uuid4().hex[:12]
+        self.started = time.time()
+        self.events_path = events_path
+        self.durations: Dict[str, List[float]] = {}
+        self.totals: Dict[str, Dict[str, float]] = {}
+        self.counters: Dict[str, int] = {}
+        self.counter_costs: Dict[str, float] = {}
+
+    def start_run(self, name: str, events_path: Optional[Path] = None, **fields) -> Path:
+        """Begin a new run, writing events to events_path (default: run_logs/run-<timestamp>.jsonl)."""
+        if events_path is None:
+            events_path = LOG_DIR / f"run-{time.strftime('%Y%m%d-%H%M%S')}.jsonl"
+        events_path = Path(events_path)
+        events_path.parent.mkdir(parents=True, exist_ok=True)
+        with self.lock:
+            self._reset(events_path)
+        self.event("run_start", name=name, pid=os.getpid(), **fields)
+        return events_path
+
+    def add_listener(self, callback) -> None:
+        """Call callback(event_dict) for every recorded event (e.g. a metrics exporter)."""
+        self.listeners.append(callback)
+
+    def event(self, kind: str, **fields) -> None:
+        """Append one event to the events file and notify listeners."""
+        record = {"ts": round(time.time(), 3), "run": self.run_id, "event": kind}
+        record.update(fields)
+        if self.events_path is not None:
+            line = json.dumps(record, default=str)
+            with self.lock:
+                with open(self.events_path, "a") as f:
+                    f.write(line + "\n")
+        for listener in self.listeners:
+            try:
+                listener(record)
+            except Exception:
+                pass
+
+    def count(self, name: str, amount: int = 1, **fields) -> None:
+        """Increment a named counter (retries, placeholders, ...) and record the event."""
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+            if name in self.SPEND_COUNTERS and fields.get("cost"):
+                self.counter_costs[name] = self.counter_costs.get(name, 0.0) + fields["cost"]
+        self.event("count", name=name, amount=amount, **fields)
+
+    @contextlib.contextmanager
+    def stage(self, name: str, **fields) -> Iterator[Dict]:
+        """Time a stage. The yielded dict collects fields to record with it."""
+        info = dict(fields)
+        with self.lock:
+            self.in_flight[name] = self.in_flight.get(name, 0) + 1
+        start = time.perf_counter()
+        error = None
+        try:
+            yield info
+        except BaseException as e:
+            error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            cost = estimate_cost(info) if error is None else 0.0
+            with self.lock:
+                self.in_flight[name] -= 1
+                self.durations.setdefault(name, []).append(duration)
+                totals = self.totals.setdefault(name, {"errors": 0, "cost": 0.0})
+                if error is not None:
+                    totals["errors"] += 1
+                totals["cost"] += cost
+                for key in self.COUNTED_FIELDS:
+                    if isinstance(info.get(key), (int, float)):
+                        totals[key] = totals.get(key, 0) + info[key]
+            record = dict(info, stage=name, duration=round(duration, 4), ok=error is None)
+            if cost:
+                record["cost"] = round(cost, 6)
+            if error is not None:
+                record["error"] = error
+            self.event("stage", **record)
+
+    def summary(self) -> Dict:
+        """Aggregate the run so far: per-stage timings and totals, counters and cost.
+
+        cost includes what counters such as hedges spent; extra_cost breaks that part down.
+        """
+        with self.lock:
+            stages = {}
+            for name, values in self.durations.items():
+                totals = self.totals.get(name, {})
+                stages[name] = {
+                    "count": len(values),
+                    "total": round(sum(values), 3),
+                    "p50": round(percentile(values, 0.50), 3),
+                    "p95": round(percentile(values, 0.95), 3),
+                    "max": round(max(values), 3),
+                    **{key: round(value, 6) if isinstance(value, float) else value for key, value in totals.items()},
+                }
+            counters = dict(self.counters)
+            extra_cost = {name: round(cost, 4) for name, cost in self.counter_costs.items()}
+        return {
+            "run": self.run_id,
+            "elapsed": round(time.time() - self.started, 3),
+            "cost": round(sum(stage.get("cost", 0.0) for stage in stages.values()) + sum(extra_cost.values()), 4),
+            "extra_cost": extra_cost,
+            "peak_rss_mb": round(peak_rss_mb(), 1),
+            "stages": stages,
+            "counters": counters,
+        }
+
+    def finish_run(self, **fields) -> Dict:
+        """Record and print the end-of-run summary."""
+        summary = self.summary()
+        self.event("run_summary", **summary, **fields)
+        print_summary(summary)
+        if self.events_path is not None:
+            print(f"Run events written to {self.events_path}")
+        return summary
+
+
+def print_summary(summary: Dict) -> None:
+    """Print a run summary as a table."""
+    print(f"\nRun Summary ({summary['run']})")
+    print(f"==========================")
+    print(f"{'stage':<22} {'count':>6} {'total s':>9} {'p50':>7} {'p95':>7} {'errors':>6} {'MB':>8} {'tokens':>8} {'cost $':>8}")
+    for name, stage in sorted(summary["stages"].items()):
+        tokens = stage.get("prompt_tokens", 0) + stage.get("completion_tokens", 0)
+        megabytes = stage.get("bytes", 0) / (1024 * 1024)
+        print(f"{name:<22} {stage['count']:>6} {stage['total']:>9.2f} {stage['p50']:>7.2f} {stage['p95']:>7.2f} "
+              f"{stage.get('errors', 0):>6} {megabytes:>8.1f} {tokens:>8} {stage.get('cost', 0):>8.3f}")
+    if summary["counters"]:
+        print("Counters: " + ", ".join(f"{name}={value}" for name, value in sorted(summary["counters"].items())))
+    extra = "".join(f" (${cost:.2f} {name})" for name, cost in sorted(summary.get("extra_cost", {}).items()) if cost)
+    print(f"Wall time: {summary['elapsed']:.1f}s  Estimated cost: ${summary['cost']:.2f}{extra}  Peak RSS: {summary['peak_rss_mb']:.0f} MB")
+
+
+def summarize_events(path: Path) -> Dict:
+    """Rebuild a run summary from an events file (e.g. for capacity planning)."""
+    rebuilt = RunRecorder()
+    last_ts = rebuilt.started
+    with open(path, "r") as f:
+        for line in f:
+            record = json.loads(line)
+            if record["event"] == "run_start":
+                rebuilt.run_id = record["run"]
+                rebuilt.started = record["ts"]
+            elif record["event"] == "stage":
+                name = record["stage"]
+                rebuilt.durations.setdefault(name, []).append(record["duration"])
+                totals = rebuilt.totals.setdefault(name, {"errors": 0, "cost": 0.0})
+                totals["errors"] += 0 if record.get("ok", True) else 1
+                totals["cost"] += record.get("cost", 0.0)
+                for key in RunRecorder.COUNTED_FIELDS:
+                    if isinstance(record.get(key), (int, float)):
+                        totals[key] = totals.get(key, 0) + record[key]
+            elif record["event"] == "count":
+                name = record["name"]
+                rebuilt.counters[name] = rebuilt.counters.get(name, 0) + record["amount"]
+                if name in RunRecorder.SPEND_COUNTERS and record.get("cost"):
+                    rebuilt.counter_costs[name] = rebuilt.counter_costs.get(name, 0.0) + record["cost"]
+            elif record["event"] == "run_summary":
+                return {key: record[key] for key in ("run", "elapsed", "cost", "extra_cost", "peak_rss_mb", "stages", "counters")}
+            last_ts = record["ts"]
+    # The run never finished: report what was recorded up to the last event
+    summary = rebuilt.summary()
+    summary["elapsed"] = round(last_ts - rebuilt.started, 3)
+    summary["peak_rss_mb"] = 0.0
+    return summary
+
+
+# Shared recorder used by the generator scripts
+recorder = RunRecorder()
+
+
+def main():
+    if len(sys.argv) != 2:
+        print("Usage: python instrumentation.py run_logs/run-<timestamp>.jsonl")
+        return 1
+    print_summary(summarize_events(Path(sys.argv[1])))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,68 @@
+// Browser reader for the single-file story bundles written by story_bundle.py.
+// Layout: 20-byte prelude (magic "BSTB", version, flags, header length,
+// payload offset), a JSON header with segments and the entry table, then
+// page-aligned image/audio payloads addressable with HTTP Range requests.
+
+const PRELUDE_SIZE = 20;
+// One request normally covers the prelude and the whole JSON header
+const INITIAL_RANGE = 64 * 1024;
+
+async function fetchRange(url, start, end) {
+  const response = await fetch(url, { headers: { Range: `bytes=${start}-${end - 1}` } });
+  if (!response.ok) {
+    throw new Error(`Failed to load story bundle: ${response.status} ${response.statusText}`);
+  }
+  return response;
+}
+
+/**
+ * Open a story bundle with a single ranged request.
+ * Returns the story header and helpers that fetch individual assets as
+ * ranged slices. If the server ignores Range and sends the whole file,
+ * assets are sliced from that download instead.
+ */
+export async function openStoryBundle(url) {
+  const response = await fetchRange(url, 0, INITIAL_RANGE);
+  let head = new Uint8Array(await response.arrayBuffer());
+  const wholeFile = response.status === 200 ? head : null;
+
+  const magic = String.fromCharCode(...head.subarray(0, 4));
+  if (magic !== 'BSTB') {
+    throw new Error(`${url} is not a story bundle`);
+  }
+  const prelude = new DataView(head.buffer, head.byteOffset, PRELUDE_SIZE);
+  const headerLength = prelude.getUint32(8, true);
+  const dataStart = Number(prelude.getBigUint64(12, true));
+
+  if (head.length < PRELUDE_SIZE + headerLength) {
+    const rest = await fetchRange(url, 0, PRELUDE_SIZE + headerLength);
+    head = new Uint8Array(await rest.arrayBuffer());
+  }
+  const header = JSON.parse(
+    new TextDecoder().decode(head.subarray(PRELUDE_SIZE, PRELUDE_SIZE + headerLength))
+  );
+  const entries = Object.fromEntries(header.entries.map(entry => [entry.name, entry]));
+
+  const fetchEntry = async (name) => {
+    const entry = entries[name];
+    if (!entry) {
+      throw new Error(`Story bundle has no entry named ${name}`);
+    }
+    const start = dataStart + entry.offset;
+    const end = start + entry.length;
+    if (wholeFile) {
+      return new Blob([wholeFile.subarray(start, end)], { type: entry.type });
+    }
+    const slice = await fetchRange(url, start, end);
+    return new Blob([await slice.arrayBuffer()], { type: entry.type });
+  };
+
+  return {
+    title: header.title,
+    segments: header.segments,
+    entries,
+    fetchEntry,
+    // Object URL usable as <img src> or <audio src>; revoke it when done
+    entryUrl: async (name) => URL.createObjectURL(await fetchEntry(name)),
+  };
+}
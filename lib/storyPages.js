@@ -0,0 +1,62 @@
+import { NextResponse } from 'next/server';
+import fs from 'fs';
+import path from 'path';
+
+// Paginated listing files written by story_pages.py
+const pagesDir = path.join(process.cwd(), 'public', 'stories');
+const manifestPath = path.join(pagesDir, 'manifest.json');
+
+// The manifest is tiny; keep it parsed until story_pages.py rewrites it
+let cachedManifest = null;
+let cachedManifestMtime = 0;
+
+function readManifest() {
+  try {
+    const { mtimeMs } = fs.statSync(manifestPath);
+    if (!cachedManifest || mtimeMs !== cachedManifestMtime) {
+      cachedManifest = JSON.parse(fs.readFileSync(manifestPath, 'utf8'));
+      cachedManifestMtime = mtimeMs;
+    }
+    return cachedManifest;
+  } catch (error) {
+    // No export yet: callers fall back to stories.json
+    return null;
+  }
+}
+
+/**
+ * Serve one precomputed listing page, or return null when no export exists.
+ * Pages are served as stored, with the ETag recorded in the manifest, so
+ * repeat requests are answered with 304 Not Modified.
+ */
+export function storyPageResponse(request) {
+  const manifest = readManifest();
+  if (!manifest) {
+    return null;
+  }
+
+  const { searchParams } = new URL(request.url);
+  const pageNumber = parseInt(searchParams.get('page') || '1', 10);
+  const page = Number.isInteger(pageNumber) ? manifest.pages[pageNumber - 1] : undefined;
+  if (!page) {
+    return NextResponse.json({ error: 'Page not found', pages: manifest.pages.length }, { status: 404 });
+  }
+
+  const headers = {
+    'ETag': page.etag,
+    'Cache-Control': 'public, max-age=60, stale-while-revalidate=600',
+  };
+  if (request.headers.get('if-none-match') === page.etag) {
+    return new NextResponse(null, { status: 304, headers });
+  }
+
+  const body = fs.readFileSync(path.join(pagesDir, page.file));
+  return new NextResponse(body, {
+    status: 200,
+    headers: {
+      ...headers,
+      'Content-Type': 'application/json',
+      'Content-Length': body.length.toString(),
+    },
+  });
+}
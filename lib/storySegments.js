@@ -0,0 +1,44 @@
+// Reader for story_segments.json in every shape story_segments.py writes or
+// still accepts: the compact version 2 document (default image names and
+// evenly spaced or contiguous timings left out), the version 1 object with
+// every field spelled out, and the legacy bare segment list.
+
+export const SCHEMA_VERSION = 2;
+
+export function defaultImage(index) {
+  return `image_${index + 1}.png`;
+}
+
+// Returns { title, segments } with image, start and end on every segment
+export function expandStorySegments(data) {
+  const document = Array.isArray(data) ? { title: null, segments: data } : data || {};
+  if (!Array.isArray(document.segments)) {
+    throw new Error("story_segments.json has no 'segments' list");
+  }
+  const version = document.version || 1;
+  if (version > SCHEMA_VERSION) {
+    throw new Error(`Unsupported story_segments.json version ${version}`);
+  }
+
+  const { boundaries, segmentDuration } = document;
+  const segments = document.segments.map((segment, i) => {
+    const expanded = { ...segment, image: segment.image || defaultImage(i) };
+    if (version >= 2 && Array.isArray(boundaries)) {
+      expanded.start = boundaries[i];
+      expanded.end = boundaries[i + 1];
+    } else if (version >= 2 && typeof segmentDuration === 'number') {
+      expanded.start = i * segmentDuration;
+      expanded.end = (i + 1) * segmentDuration;
+    }
+    return expanded;
+  });
+  return { title: document.title || null, segments };
+}
+
+export async function fetchStorySegments(url) {
+  const response = await fetch(url);
+  if (!response.ok) {
+    throw new Error(`Failed to load story segments: ${response.status} ${response.statusText}`);
+  }
+  return expandStorySegments(await response.json());
+}
@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""
+Story Media Server
+
+A small HTTP server for the story library, for development and as a local
+origin behind a CDN. Unlike the Next.js media route, which reads each file
+into memory and always returns all of it, it:
+
+- answers Range requests (206 Partial Content), so scrubbing the narration
+  only fetches the bytes the player asks for;
+- sends a strong ETag (a SHA-256 prefix of the content) and Last-Modified,
+  and answers If-None-Match / If-Modified-Since with 304 Not Modified;
+- marks content-hashed names (for example the-owl-3f9a1c2e.bundle) as
+  immutable for a year, and everything else as cacheable but revalidated;
+- hands the bytes to the kernel with sendfile, never copying them through
+  Python;
+- serves stored .br/.gz copies of JSON files to clients that accept them.
+
+Files are served from the library root at /<story>/<file> and, for the
+player's existing URLs, at /api/media/<story>/<file>. Dot-files and
+"_"-prefixed folders are never served.
+
+Usage:
+    python media_server.py                          # serve public/output on :8780
+    python media_server.py --root output --port 9000
+    curl -r 0-1023 -o /dev/null -w '%{http_code}' localhost:8780/the-curious-cloud/story_audio.mp3
+"""
+
+import os
+import re
+import sys
+import hashlib
+import logging
+import argparse
+import mimetypes
+import threading
+from pathlib import Path
+from email.utils import formatdate, parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+from urllib.parse import unquote
+
+logger = logging.getLogger(__name__)
+
+# Constants
+OUTPUT_DIR = Path("public/output")
+DEFAULT_PORT = 8780
+URL_PREFIX = "/api/media/"  # the player's media route, served here too
+ETAG_LENGTH = 32  # hex digits of the SHA-256 used as the ETag
+HASH_CHUNK_SIZE = 1024 * 1024
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "public, max-age=0, must-revalidate"
+CONTENT_HASHED_NAME = re.compile(r"[.-][0-9a-f]{8,}\.[A-Za-z0-9]+$")
+PRECOMPRESSED = (("br", ".br"), ("gzip", ".gz"))
+CONTENT_TYPES = {".mp3": "audio/mpeg", ".json": "application/json", ".bundle": "application/octet-stream"}
+RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class ETagCache:
+    """Content hashes of served files, recomputed only when a file changes."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries: Dict[str, Tuple[Tuple[int, int, int], str]] = {}
+
+    def etag(self, path: Path, f, stat: os.stat_result) -> str:
+        """Return the ETag of path, hashing the already open file f if it changed."""
+        key = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        with self.lock:
+            cached = self.entries.get(str(path))
+        if cached and cached[0] == key:
+            return cached[1]
+        # Hash the open file, not the path, so an atomic replace mid-request can't mix versions
+        digest = hashlib.sha256()
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+        f.seek(0)
+        etag = f'"{digest.hexdigest()[:ETAG_LENGTH]}"'
+        with self.lock:
+            self.entries[str(path)] = (key, etag)
+        return etag
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Return the (start, end) byte range, inclusive, that header asks for.
+
+    Returns None for a header this server ignores (multiple or malformed
+    ranges, which get the whole file) and raises ValueError if the range
+    lies entirely outside the file.
+    """
+    match = RANGE_PATTERN.match(header.strip())
+    if not match or match.groups() == ("", ""):
+        return None
+    first, last = match.groups()
+    if first == "":
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            raise ValueError("empty suffix range")
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError(f"range starts beyond {size} bytes")
+    return start, end
+
+
+def etag_matches(header: str, etag: str) -> bool:
+    """Weak comparison, as If-None-Match requires."""
+    if header.strip() == "*":
+        return True
+    tags = (tag.strip() for tag in header.split(","))
+    return any((tag[2:] if tag.startswith("W/") else tag) == etag for tag in tags)
+
+
+class MediaHandler(BaseHTTPRequestHandler):
+    server_version = "StoryMedia/1.0"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        logger.debug("media: " + format % args)
+
+    def _resolve(self) -> Optional[Path]:
+        """Map the request path to a file inside the library, or None."""
+        path = unquote(self.path.split("?", 1)[0])
+        if path.startswith(URL_PREFIX):
+            path = path[len(URL_PREFIX):]
+        parts = [part for part in path.split("/") if part]
+        if not parts or any(part.startswith((".", "_")) or "\\" in part for part in parts):
+            return None
+        full_path = self.server.root.joinpath(*parts)
+        # Symlinks out of the library are not followed
+        if self.server.root not in full_path.resolve().parents:
+            return None
+        return full_path if full_path.is_file() else None
+
+    def _send_empty(self, status: int, headers: Dict[str, str]) -> None:
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        if status != 304:
+            self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def _serve(self, head: bool) -> None:
+        full_path = self._resolve()
+        if full_path is None:
+            self.send_error(404, "File not found")
+            return
+
+        headers = {
+            "Content-Type": CONTENT_TYPES.get(full_path.suffix.lower())
+            or mimetypes.guess_type(full_path.name)[0] or "application/octet-stream",
+            "Cache-Control": IMMUTABLE_CACHE_CONTROL if CONTENT_HASHED_NAME.search(full_path.name)
+            else REVALIDATE_CACHE_CONTROL,
+            "Access-Control-Allow-Origin": "*",
+        }
+        if full_path.suffix.lower() == ".json":
+            # JSON compresses well; serve a stored .br/.gz copy when the client accepts it
+            headers["Vary"] = "Accept-Encoding"
+            accepted = self.headers.get("Accept-Encoding", "").lower()
+            for encoding, suffix in PRECOMPRESSED:
+                compressed = full_path.with_name(full_path.name + suffix)
+                if encoding in accepted and compressed.is_file():
+                    headers["Content-Encoding"] = encoding
+                    full_path = compressed
+                    break
+
+        try:
+            f = open(full_path, "rb")
+        except OSError:
+            self.send_error(404, "File not found")
+            return
+        with f:
+            stat = os.fstat(f.fileno())
+            size = stat.st_size
+            etag = self.server.etags.etag(full_path, f, stat)
+            headers["ETag"] = etag
+            headers["Last-Modified"] = formatdate(stat.st_mtime, usegmt=True)
+            headers["Accept-Ranges"] = "bytes"
+
+            if self._not_modified(etag, stat.st_mtime):
+                self._send_empty(304, {k: v for k, v in headers.items() if k not in ("Content-Type", "Content-Encoding")})
+                return
+
+            status, start, end = 200, 0, size - 1
+            range_header = self.headers.get("Range")
+            if_range = self.headers.get("If-Range")
+            # A stale If-Range means the client's partial copy is outdated: send it all
+            if range_header and (not if_range or if_range.strip() == etag):
+                try:
+                    requested = parse_range(range_header, size)
+                except ValueError:
+                    headers["Content-Range"] = f"bytes */{size}"
+                    self._send_empty(416, headers)
+                    return
+                if requested:
+                    status, (start, end) = 206, requested
+                    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+
+            length = max(0, end - start + 1)
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", str(length))
+            self.end_headers()
+            if head or not length:
+                return
+            # socket.sendfile uses os.sendfile where available: the kernel copies the bytes
+            self.connection.sendfile(f, start, length)
+
+    def _not_modified(self, etag: str, mtime: float) -> bool:
+        if_none_match = self.headers.get("If-None-Match")
+        if if_none_match is not None:
+            return etag_matches(if_none_match, etag)
+        if_modified_since = self.headers.get("If-Modified-Since")
+        if if_modified_since:
+            try:
+                return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def do_GET(self):
+        self._serve(head=False)
+
+    def do_HEAD(self):
+        self._serve(head=True)
+
+    def do_OPTIONS(self):
+        self._send_empty(204, {
+            "Access-Control-Allow-Origin": "*",
+            "Access-Control-Allow-Methods": "GET, HEAD, OPTIONS",
+            "Access-Control-Allow-Headers": "Range, If-None-Match, If-Range",
+            "Access-Control-Max-Age": "86400",
+        })
+
+
+class MediaServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, root: Path = OUTPUT_DIR, host: str = "127.0.0.1", port: int = DEFAULT_PORT):
+        super().__init__((host, port), MediaHandler)
+        self.root = Path(root).resolve()
+        self.etags = ETagCache()
+
+
+def main():
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+    parser = argparse.ArgumentParser(description="Serve the story library with Range, ETag and sendfile support")
+    parser.add_argument("--root", default=str(OUTPUT_DIR), help=f"Story library (default: {OUTPUT_DIR})")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"Port (default: {DEFAULT_PORT})")
+    parser.add_argument("--verbose", action="store_true", help="Log every request")
+    args = parser.parse_args()
+
+    if args.verbose:
+        logger.setLevel(logging.DEBUG)
+    root = Path(args.root)
+    if not root.is_dir():
+        logger.error(f"Library {root} does not exist")
+        return 1
+
+    server = MediaServer(root, args.host, args.port)
+    logger.info(f"Serving {root} on http://{args.host}:{server.server_address[1]}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Memory Budget
+
+Keeps long batches and multi-worker services in constant memory. Stages
+that hold a large payload, such as a downloaded or decoded image, first
+reserve its size from the shared budget. While the reservations in
+flight would exceed the limit, new ones wait, no matter how many workers
+are running:
+
+    with budget.reserve(IMAGE_MEMORY_BYTES, stage="image"):
+        download_to_file(url, tmp_path)
+        ...
+
+A reservation bigger than the whole budget is still admitted once nothing
+else is in flight, so an oversized item slows the run down but never
+deadlocks it. Large payloads are streamed to disk in CHUNK_SIZE pieces
+instead of being buffered whole (download_to_file).
+
+The budget defaults to DEFAULT_LIMIT_MB. Generators and the daemon accept
+--memory-budget MB. budget.stats() (in-flight, peak and waits) is added
+to the run summary next to peak RSS.
+"""
+
+import time
+import threading
+import contextlib
+from pathlib import Path
+from typing import Dict, Iterator
+
+import requests
+
+from instrumentation import recorder
+
+# Constants
+DEFAULT_LIMIT_MB = 64
+CHUNK_SIZE = 64 * 1024  # bytes per streamed read
+DOWNLOAD_TIMEOUT = 60  # seconds to wait for each read
+
+
+class MemoryBudget:
+    """A byte-counting semaphore shared by every stage that buffers payloads."""
+
+    def __init__(self, limit_bytes: int):
+        self.condition = threading.Condition()
+        self.limit = int(limit_bytes)
+        self.in_flight = 0
+        self.peak = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+
+    def configure(self, limit_bytes: int) -> None:
+        """Change the limit; waiting reservations are re-checked immediately."""
+        with self.condition:
+            self.limit = int(limit_bytes)
+            self.condition.notify_all()
+
+    @contextlib.contextmanager
+    def reserve(self, nbytes: int, stage: str = "") -> Iterator[None]:
+        """Hold nbytes of the budget for the duration of the block."""
+        nbytes = max(0, int(nbytes))
+        waited = None
+        with self.condition:
+            if self.in_flight and self.in_flight + nbytes > self.limit:
+                waited = time.perf_counter()
+                while self.in_flight and self.in_flight + nbytes > self.limit:
+                    self.condition.wait()
+                waited = time.perf_counter() - waited
+                self.waits += 1
+                self.wait_seconds += waited
+            self.in_flight += nbytes
+            self.peak = max(self.peak, self.in_flight)
+        if waited is not None:
+            recorder.count("memory_waits", stage=stage, seconds=round(waited, 3))
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.in_flight -= nbytes
+                self.condition.notify_all()
+
+    def stats(self) -> Dict:
+        with self.condition:
+            return {
+                "limit_bytes": self.limit,
+                "in_flight_bytes": self.in_flight,
+                "peak_in_flight_bytes": self.peak,
+                "waits": self.waits,
+                "wait_seconds": round(self.wait_seconds, 3),
+            }
+
+
+# Shared by every generator, worker thread and the daemon in this process
+budget = MemoryBudget(DEFAULT_LIMIT_MB * 1024 * 1024)
+
+
+def download_to_file(url: str, path: Path, chunk_size: int = CHUNK_SIZE) -> int:
+    """Stream url into path without buffering the body. Returns the byte count."""
+    size = 0
+    with requests.get(url, stream=True, timeout=DOWNLOAD_TIMEOUT) as response:
+        response.raise_for_status()
+        with open(path, "wb") as f:
+            for chunk in response.iter_content(chunk_size):
+                f.write(chunk)
+                size += len(chunk)
+    return size
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""
+Prometheus Metrics Exporter
+
+Optional live metrics for long-running generation workers. The exporter
+subscribes to the shared run recorder (instrumentation.py) and serves the
+Prometheus text exposition format over plain HTTP:
+
+    story_stage_duration_seconds{stage,model}   histogram of stage durations
+    story_stage_total{stage,model,outcome}      completed stages (ok / error)
+    story_stage_in_flight{stage}                stages running right now
+    story_stage_bytes_total{stage}              bytes downloaded, encoded or synthesized
+    story_tokens_total{model,kind}              prompt and completion tokens
+    story_images_total{model}                   images requested
+    story_tts_characters_total{model}           characters sent to TTS
+    story_estimated_cost_dollars_total{model}   estimated spend
+    story_events_total{name,stage}              retries, fallbacks and placeholders
+    story_regen_queue_jobs{status}              regeneration queue depth
+    story_daemon_queue_jobs{status}             story daemon job queue depth
+    story_process_peak_rss_bytes                peak resident memory
+    story_memory_budget_bytes{kind}             payload bytes in flight, their peak and the limit
+
+Start it from a worker with --metrics-port (bedtime_story_generator.py,
+story_daemon.py and `regen_queue.py work`), or in code:
+
+    from metrics import start_metrics_server
+    start_metrics_server(9464)
+
+Then scrape http://<host>:9464/metrics.
+"""
+
+import time
+import bisect
+import sqlite3
+import logging
+import threading
+from pathlib import Path
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Tuple
+
+from instrumentation import RunRecorder, peak_rss_mb, recorder
+from memory_budget import budget
+
+logger = logging.getLogger(__name__)
+
+# Constants
+DEFAULT_PORT = 9464
+# Stage durations span sub-second encodes to minute-long story generations
+DURATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, str]) -> LabelKey:
+    return tuple(sorted((name, str(value)) for name, value in labels.items() if value is not None))
+
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    escaped = []
+    for name, value in pairs:
+        value = value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        escaped.append(f'{name}="{value}"')
+    return "{" + ",".join(escaped) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class MetricsRegistry:
+    """Thread-safe counters, histograms and callback gauges keyed by label set."""
+
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.lock = threading.Lock()
+        self.help: Dict[str, Tuple[str, str]] = {}
+        self.counters: Dict[str, Dict[LabelKey, float]] = {}
+        self.histograms: Dict[str, Dict[LabelKey, Dict]] = {}
+        self.gauges: Dict[str, Callable[[], Dict[LabelKey, float]]] = {}
+
+    def describe(self, name: str, kind: str, text: str) -> None:
+        self.help[name] = (kind, text)
+
+    def inc(self, metric: str, amount: float = 1, **labels) -> None:
+        key = _label_key(labels)
+        with self.lock:
+            series = self.counters.setdefault(metric, {})
+            series[key] = series.get(key, 0) + amount
+
+    def observe(self, metric: str, value: float, **labels) -> None:
+        key = _label_key(labels)
+        with self.lock:
+            series = self.histograms.setdefault(metric, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                histogram["buckets"][index] += 1
+            histogram["sum"] += value
+            histogram["count"] += 1
+
+    def gauge(self, name: str, text: str, callback: Callable[[], Dict[LabelKey, float]]) -> None:
+        """Register a gauge whose samples are read from callback() at scrape time."""
+        self.describe(name, "gauge", text)
+        self.gauges[name] = callback
+
+    def render(self) -> str:
+        """Render every metric in the Prometheus text exposition format."""
+        lines: List[str] = []
+
+        def header(name: str, default_kind: str) -> None:
+            kind, text = self.help.get(name, (default_kind, name))
+            lines.append(f"# HELP {name} {text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        with self.lock:
+            counters = {name: dict(series) for name, series in self.counters.items()}
+            histograms = {
+                name: {key: {"buckets": list(h["buckets"]), "sum": h["sum"], "count": h["count"]} for key, h in series.items()}
+                for name, series in self.histograms.items()
+            }
+
+        for name in sorted(counters):
+            header(name, "counter")
+            for key, value in sorted(counters[name].items()):
+                lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+
+        for name in sorted(histograms):
+            header(name, "histogram")
+            for key, histogram in sorted(histograms[name].items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, histogram["buckets"]):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_format_labels(key, ('le', _format_value(float(bound))))} {cumulative}")
+                lines.append(f"{name}_bucket{_format_labels(key, ('le', '+Inf'))} {histogram['count']}")
+                lines.append(f"{name}_sum{_format_labels(key)} {_format_value(histogram['sum'])}")
+                lines.append(f"{name}_count{_format_labels(key)} {histogram['count']}")
+
+        for name in sorted(self.gauges):
+            try:
+                samples = self.gauges[name]()
+            except Exception as e:
+                logger.debug(f"Gauge {name} failed: {e}")
+                continue
+            header(name, "gauge")
+            for key, value in sorted(samples.items()):
+                lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+
+        return "\n".join(lines) + "\n"
+
+
+def _describe_pipeline_metrics(registry: MetricsRegistry) -> None:
+    registry.describe("story_stage_duration_seconds", "histogram", "Duration of pipeline stages and API calls")
+    registry.describe("story_stage_total", "counter", "Completed pipeline stages by outcome")
+    registry.describe("story_stage_bytes_total", "counter", "Bytes downloaded, encoded or synthesized per stage")
+    registry.describe("story_tokens_total", "counter", "Chat completion tokens by model and kind")
+    registry.describe("story_images_total", "counter", "Images requested by model")
+    registry.describe("story_tts_characters_total", "counter", "Characters sent to text-to-speech by model")
+    registry.describe("story_estimated_cost_dollars_total", "counter", "Estimated API spend in USD by model")
+    registry.describe("story_events_total", "counter", "Retries, fallbacks and placeholders")
+    registry.describe("story_runs_total", "counter", "Generation runs started")
+
+
+def observe_event(registry: MetricsRegistry, record: Dict) -> None:
+    """Translate one recorder event into metric updates."""
+    kind = record.get("event")
+    if kind == "stage":
+        stage = record["stage"]
+        model = record.get("model", "")
+        registry.observe("story_stage_duration_seconds", record.get("duration", 0.0), stage=stage, model=model)
+        registry.inc("story_stage_total", stage=stage, model=model, outcome="ok" if record.get("ok", True) else "error")
+        if record.get("bytes"):
+            registry.inc("story_stage_bytes_total", record["bytes"], stage=stage)
+        for token_kind in ("prompt", "completion"):
+            if record.get(f"{token_kind}_tokens"):
+                registry.inc("story_tokens_total", record[f"{token_kind}_tokens"], model=model, kind=token_kind)
+        if record.get("images") and record.get("ok", True):
+            registry.inc("story_images_total", record["images"], model=model)
+        if record.get("characters") and record.get("ok", True):
+            registry.inc("story_tts_characters_total", record["characters"], model=model)
+        if record.get("cost"):
+            registry.inc("story_estimated_cost_dollars_total", record["cost"], model=model)
+    elif kind == "count":
+        registry.inc("story_events_total", record.get("amount", 1), name=record["name"], stage=record.get("stage"))
+    elif kind == "run_start":
+        registry.inc("story_runs_total", name=record.get("name", ""))
+
+
+def _queue_depth(db_path: Path, count_by_status: Callable[[sqlite3.Connection], Dict[str, int]]) -> Callable[[], Dict[LabelKey, float]]:
+    """Gauge callback reading a queue's job counts through a read-only connection.
+
+    Scrapes never create the database, run its schema or change its journal mode.
+    """
+    def read() -> Dict[LabelKey, float]:
+        path = Path(db_path).resolve()
+        if not path.exists():
+            return {}
+        conn = sqlite3.connect(f"{path.as_uri()}?mode=ro", uri=True, timeout=5)
+        conn.row_factory = sqlite3.Row
+        try:
+            return {_label_key({"status": status}): count for status, count in count_by_status(conn).items()}
+        finally:
+            conn.close()
+    return read
+
+
+def _budget_samples(stats: Dict) -> Dict[LabelKey, float]:
+    return {
+        _label_key({"kind": "in_flight"}): stats["in_flight_bytes"],
+        _label_key({"kind": "peak"}): stats["peak_in_flight_bytes"],
+        _label_key({"kind": "limit"}): stats["limit_bytes"],
+    }
+
+
+def register_pipeline_metrics(registry: MetricsRegistry, run_recorder: RunRecorder = recorder,
+                              queue_db: Optional[Path] = None, jobs_db: Optional[Path] = None) -> MetricsRegistry:
+    """Subscribe registry to run_recorder and add in-flight, queue and process gauges."""
+    started = time.time()
+    _describe_pipeline_metrics(registry)
+    run_recorder.add_listener(lambda record: observe_event(registry, record))
+
+    def in_flight() -> Dict[LabelKey, float]:
+        with run_recorder.lock:
+            return {_label_key({"stage": stage}): count for stage, count in run_recorder.in_flight.items()}
+
+    registry.gauge("story_stage_in_flight", "Pipeline stages currently running", in_flight)
+    registry.gauge("story_process_peak_rss_bytes", "Peak resident set size of the worker",
+                   lambda: {(): peak_rss_mb() * 1024 * 1024})
+    registry.gauge("story_memory_budget_bytes", "Payload bytes held against the memory budget",
+                   lambda: _budget_samples(budget.stats()))
+    registry.gauge("story_process_uptime_seconds", "Seconds since the exporter started",
+                   lambda: {(): time.time() - started})
+    from regen_queue import QUEUE_DB, queue_status
+    from story_daemon import JOBS_DB, queue_depth
+
+    registry.gauge("story_regen_queue_jobs", "Regeneration queue jobs by status",
+                   _queue_depth(queue_db or QUEUE_DB, queue_status))
+    registry.gauge("story_daemon_queue_jobs", "Story daemon jobs by status",
+                   _queue_depth(jobs_db or JOBS_DB, queue_depth))
+    return registry
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    server_version = "StoryMetrics/1.0"
+
+    def log_message(self, format, *args):
+        logger.debug("metrics: " + format % args)
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = self.server.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class MetricsServer(ThreadingHTTPServer):
+    """Background HTTP server exposing a registry at /metrics."""
+
+    daemon_threads = True
+
+    def __init__(self, registry: MetricsRegistry, host: str = "0.0.0.0", port: int = DEFAULT_PORT):
+        super().__init__((host, port), MetricsHandler)
+        self.registry = registry
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    def start(self) -> "MetricsServer":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+
+def start_metrics_server(port: int = DEFAULT_PORT, host: str = "0.0.0.0", queue_db: Optional[Path] = None,
+                         jobs_db: Optional[Path] = None) -> MetricsServer:
+    """Export the shared recorder's metrics on http://host:port/metrics from a daemon thread."""
+    registry = register_pipeline_metrics(MetricsRegistry(), recorder, queue_db, jobs_db)
+    server = MetricsServer(registry, host, port).start()
+    logger.info(f"Serving metrics on http://{host}:{server.server_address[1]}/metrics")
+    return server
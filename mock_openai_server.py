@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+"""
+Mock OpenAI Server
+
+A local stand-in for the OpenAI endpoints the generators use, so the pipeline
+can be exercised and benchmarked without an API key or any spend:
+
+    POST /v1/chat/completions     story ideas (numbered list) or story JSON
+    POST /v1/images/generations   a URL served by this server
+    GET  /files/image-N.png       a 1024x1024 noise PNG (real-image sized)
+    POST /v1/audio/speech         silent MP3 frames, ~150 words per minute
+    GET  /v1/models               the models the generators need
+    GET  /stats                   request counts per endpoint and status
+
+Latency, error rate and 429 rate are configurable per endpoint, and
+--slow-rate makes that share of requests --slow-factor times slower, a
+latency tail for testing hedged requests. Point the OpenAI client at it with:
+
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=mock
+
+Usage:
+    python mock_openai_server.py --port 8765 --latency images=2.0,speech=1.0 --rate-limit 0.05
+"""
+
+import io
+import os
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+
+# Constants
+DEFAULT_PORT = 8765
+ENDPOINTS = ("chat", "images", "speech", "files", "models")
+MODELS = ["gpt-4", "dall-e-3", "tts-1"]
+WORDS_PER_MINUTE = 150
+# MPEG-1 Layer III, 128 kbps, 44.1 kHz, no padding, no CRC: 417-byte frames of 1152 samples
+MP3_FRAME = b"\xff\xfb\x90\x00" + bytes(413)
+MP3_FRAME_SECONDS = 1152 / 44100
+
+
+def parse_endpoint_values(text: Optional[str], default: float = 0.0) -> Dict[str, float]:
+    """Parse "images=2,speech=0.5" (or a single number for all endpoints)."""
+    values = {endpoint: default for endpoint in ENDPOINTS}
+    if not text:
+        return values
+    for part in text.split(","):
+        if "=" in part:
+            name, value = part.split("=", 1)
+            if name.strip() not in values:
+                raise ValueError(f"Unknown endpoint {name!r}; expected one of {', '.join(ENDPOINTS)}")
+            values[name.strip()] = float(value)
+        else:
+            values = {endpoint: float(part) for endpoint in ENDPOINTS}
+    return values
+
+
+def make_noise_png(size: int = 1024) -> bytes:
+    """Build a noise PNG that compresses like a real illustration."""
+    from PIL import Image
+
+    image = Image.frombytes("RGB", (size, size), os.urandom(size * size * 3))
+    buffer = io.BytesIO()
+    image.save(buffer, "PNG", compress_level=1)
+    return buffer.getvalue()
+
+
+def make_silent_mp3(seconds: float) -> bytes:
+    """Build a valid MP3 stream of silent frames lasting about `seconds`."""
+    frames = max(1, int(seconds / MP3_FRAME_SECONDS))
+    return MP3_FRAME * frames
+
+
+class MockConfig:
+    """Behaviour of the mock server; all rates are probabilities per request."""
+
+    def __init__(self, latency=None, jitter=0.0, error_rate=0.0, rate_limit=0.0, image_size=1024, seed=None,
+                 slow_rate=0.0, slow_factor=10.0):
+        self.latency = latency or parse_endpoint_values(None)
+        self.jitter = jitter
+        self.slow_rate = slow_rate
+        self.slow_factor = slow_factor
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.image_size = image_size
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def roll(self) -> float:
+        with self.lock:
+            return self.random.random()
+
+    def delay(self, endpoint: str) -> float:
+        base = self.latency.get(endpoint, 0.0)
+        if base <= 0:
+            return 0.0
+        with self.lock:
+            delay = max(0.0, self.random.gauss(base, base * self.jitter))
+            # A long tail: a few requests take many times the usual latency
+            if self.random.random() < self.slow_rate:
+                delay *= self.slow_factor
+            return delay
+
+
+class MockStats:
+    """Thread-safe request counters, keyed by endpoint and HTTP status."""
+
+    def __init__(self):
+        self.counts: Dict[str, Dict[str, int]] = {}
+        self.lock = threading.Lock()
+
+    def record(self, endpoint: str, status: int) -> None:
+        with self.lock:
+            by_status = self.counts.setdefault(endpoint, {})
+            by_status[str(status)] = by_status.get(str(status), 0) + 1
+
+    def snapshot(self) -> Dict[str, Dict[str, int]]:
+        with self.lock:
+            return {endpoint: dict(by_status) for endpoint, by_status in self.counts.items()}
+
+
+def _ideas_reply(prompt: str) -> str:
+    match = re.search(r"Generate (\d+)", prompt)
+    count = int(match.group(1)) if match else 10
+    return "\n".join(
+        f'{i}. "The Mock Adventure Number {i}": A sleepy creature goes on gentle adventure number {i}.'
+        for i in range(1, count + 1)
+    )
+
+
+def _story_reply(prompt: str) -> str:
+    title_match = re.search(r'titled "([^"]+)"', prompt)
+    count_match = re.search(r"exactly (\d+) segments", prompt)
+    title = title_match.group(1) if title_match else "A Mock Story"
+    count = int(count_match.group(1)) if count_match else 10
+    sentence = "The little fox yawned softly as the moon rose over the quiet meadow and the stars blinked hello."
+    segments = [{"text": f"Part {i} of {title}. {sentence} {sentence}"} for i in range(1, count + 1)]
+    return json.dumps({"title": title, "segments": segments})
+
+
+class MockOpenAIHandler(BaseHTTPRequestHandler):
+    server_version = "MockOpenAI/1.0"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send(self, status: int, body: bytes, content_type: str = "application/json", headers=None) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status: int, payload: Dict, headers=None) -> None:
+        self._send(status, json.dumps(payload).encode("utf-8"), headers=headers)
+
+    def _read_json(self) -> Dict:
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _inject_faults(self, endpoint: str) -> bool:
+        """Sleep for the configured latency and maybe fail. Returns True if a fault was sent."""
+        config = self.server.config
+        time.sleep(config.delay(endpoint))
+        if endpoint in ("files", "models"):
+            return False
+        roll = config.roll()
+        if roll < config.rate_limit:
+            self.server.stats.record(endpoint, 429)
+            self._send_json(
+                429,
+                {"error": {"message": "Rate limit reached (mock)", "type": "requests", "code": "rate_limit_exceeded"}},
+                headers={"Retry-After": "0"},
+            )
+            return True
+        if roll < config.rate_limit + config.error_rate:
+            self.server.stats.record(endpoint, 500)
+            self._send_json(500, {"error": {"message": "Internal error (mock)", "type": "server_error"}})
+            return True
+        return False
+
+    def do_GET(self):
+        if self.path.startswith("/files/"):
+            if self._inject_faults("files"):
+                return
+            self.server.stats.record("files", 200)
+            self._send(200, self.server.image_bytes(), "image/png")
+        elif self.path.rstrip("/").endswith("/models"):
+            if self._inject_faults("models"):
+                return
+            self.server.stats.record("models", 200)
+            self._send_json(200, {
+                "object": "list",
+                "data": [{"id": model, "object": "model", "created": 0, "owned_by": "mock"} for model in MODELS],
+            })
+        elif self.path == "/stats":
+            self._send_json(200, self.server.stats.snapshot())
+        else:
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    def do_POST(self):
+        try:
+            body = self._read_json()
+        except ValueError:
+            self._send_json(400, {"error": {"message": "Invalid JSON body"}})
+            return
+
+        if self.path.endswith("/chat/completions"):
+            if self._inject_faults("chat"):
+                return
+            prompt = " ".join(str(m.get("content", "")) for m in body.get("messages", []))
+            is_story = (body.get("response_format") or {}).get("type") == "json_object"
+            content = _story_reply(prompt) if is_story else _ideas_reply(prompt)
+            prompt_tokens = len(prompt.split())
+            completion_tokens = len(content.split())
+            self.server.stats.record("chat", 200)
+            self._send_json(200, {
+                "id": f"chatcmpl-mock-{time.time_ns()}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model", "gpt-4"),
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop",
+                }],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens,
+                },
+            })
+        elif self.path.endswith("/images/generations"):
+            if self._inject_faults("images"):
+                return
+            self.server.stats.record("images", 200)
+            host, port = self.server.server_address[:2]
+            self._send_json(200, {
+                "created": int(time.time()),
+                "data": [{"url": f"http://{host}:{port}/files/image-{time.time_ns()}.png",
+                          "revised_prompt": body.get("prompt", "")}],
+            })
+        elif self.path.endswith("/audio/speech"):
+            if self._inject_faults("speech"):
+                return
+            words = len(str(body.get("input", "")).split())
+            self.server.stats.record("speech", 200)
+            self._send(200, make_silent_mp3(words / WORDS_PER_MINUTE * 60), "audio/mpeg")
+        else:
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+
+class MockOpenAIServer(ThreadingHTTPServer):
+    """Threaded mock server that can also run in the background of another script."""
+
+    daemon_threads = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = DEFAULT_PORT, config: Optional[MockConfig] = None, verbose: bool = False):
+        super().__init__((host, port), MockOpenAIHandler)
+        self.config = config or MockConfig()
+        self.stats = MockStats()
+        self.verbose = verbose
+        self._image_bytes = None
+        self._image_lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def image_bytes(self) -> bytes:
+        with self._image_lock:
+            if self._image_bytes is None:
+                self._image_bytes = make_noise_png(self.config.image_size)
+            return self._image_bytes
+
+    def start(self) -> "MockOpenAIServer":
+        """Serve from a background thread."""
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local mock of the OpenAI chat, image and speech endpoints")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--latency", help="Seconds per endpoint, e.g. 'chat=1,images=3,speech=2' or one number for all")
+    parser.add_argument("--jitter", type=float, default=0.3, help="Latency standard deviation as a fraction of the mean (default: 0.3)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Probability of a 500 response")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="Probability of a 429 response")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="Probability that a request is a slow outlier")
+    parser.add_argument("--slow-factor", type=float, default=10.0, help="Latency multiplier for slow outliers (default: 10)")
+    parser.add_argument("--seed", type=int, help="Random seed for reproducible fault injection")
+    parser.add_argument("--verbose", action="store_true", help="Log every request")
+    args = parser.parse_args()
+
+    config = MockConfig(
+        latency=parse_endpoint_values(args.latency),
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        rate_limit=args.rate_limit,
+        seed=args.seed,
+        slow_rate=args.slow_rate,
+        slow_factor=args.slow_factor,
+    )
+    server = MockOpenAIServer(args.host, args.port, config, args.verbose)
+    print(f"Mock OpenAI server listening on {server.base_url}")
+    print(f"Use: OPENAI_BASE_URL={server.base_url} OPENAI_API_KEY=mock")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nStopping mock server")
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+Narration Aligner
+
+Sets each segment's start and end in story_segments.json from the
+narration itself, instead of the fixed SEGMENT_DURATION grid or a
+words-per-minute estimate. The generators send TTS the title and the
+segments separated by blank lines, and the voice pauses at every break.
+The aligner finds those pauses offline, with no API calls:
+
+1. Loudness envelope. Every MPEG Layer III granule (576 or 1152 samples)
+   carries a global_gain, the quantizer step size the encoder chose for
+   it. The step follows the signal level in 1.5 dB increments, so the
+   gains form a short-time energy envelope of the narration. They are
+   read straight from the frame side info with NumPy, without decoding
+   the audio.
+2. Pauses. The envelope is smoothed, and runs of granules in its quietest
+   QUIET_PERCENTILE that last at least MIN_PAUSE seconds are pauses.
+3. Alignment. A story with N segments has N breaks: one after the title
+   and N-1 between segments. Sentence pauses can be nearly as long as
+   paragraph pauses, so the longest pauses are not taken blindly. Instead,
+   the narration is spread over the text by character count to estimate
+   where each break should fall. A dynamic program then picks one pause
+   per break, in order, favouring long pauses close to their estimate.
+
+The title stays part of the first segment, which starts at 0; every
+other boundary is the middle of its pause, and the last segment ends with
+the audio. The whole library is aligned in parallel across CPU cores.
+
+Usage:
+    python narration_aligner.py                                  # align every story in public/output
+    python narration_aligner.py public/output/the-curious-cloud --dry-run
+    python narration_aligner.py --workers 4 --root output
+"""
+
+import os
+import sys
+import logging
+import argparse
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from atomic_io import story_lock
+from story_segments import load_segments, write_segments
+from story_validator import _skip_id3, find_story_dirs, parse_mpeg_frame_header
+
+logger = logging.getLogger(__name__)
+
+# Constants
+OUTPUT_DIR = Path("public/output")
+AUDIO_NAME = "story_audio.mp3"
+DB_PER_GAIN_STEP = 1.5  # global_gain is a power of 2**(1/4) in amplitude
+SMOOTHING_SECONDS = 0.075  # moving-average window over the envelope
+QUIET_PERCENTILE = 20  # granules this quiet or quieter count as silence
+MIN_PAUSE = 0.25  # seconds of silence that make a pause
+POSITION_TOLERANCE = 0.04  # spread of the break estimate, as a share of the duration
+
+
+class AlignmentError(ValueError):
+    """Raised when a narration cannot be aligned to its segments."""
+
+
+def granule_gains(path: Path) -> Tuple[np.ndarray, float]:
+    """Return the loudness of every granule of an MP3 in dB, and the granule length in seconds.
+
+    Only MPEG Layer III carries global_gain; other layers raise AlignmentError.
+    """
+    data = np.fromfile(path, dtype=np.uint8)
+    raw = data.tobytes()
+    offset = _skip_id3(raw)
+    offsets, headers = [], []
+    while True:
+        frame = parse_mpeg_frame_header(raw, offset)
+        if frame is None or offset + frame[0] > len(raw):
+            break
+        offsets.append(offset)
+        headers.append(frame)
+        offset += frame[0]
+    if not offsets:
+        raise AlignmentError(f"{path.name} has no MPEG audio frames")
+
+    offsets = np.array(offsets)
+    b1, b3 = data[offsets + 1], data[offsets + 3]
+    if np.any((b1 >> 1) & 0x03 != 1):
+        raise AlignmentError(f"{path.name} is not MPEG Layer III")
+    mpeg1 = ((b1 >> 3) & 0x03) == 3
+    mono = (b3 >> 6) == 3
+    crc = (b1 & 0x01) == 0
+    channels = np.where(mono, 1, 2)
+    granules = np.where(mpeg1, 2, 1)
+
+    # Side info bit layout: header (32) [CRC (16)] main_data_begin, private
+    # bits, scfsi (MPEG-1 only), then one block per granule and channel
+    # with global_gain 21 bits into it
+    prefix = np.where(mpeg1, 9 + np.where(mono, 5, 3) + 4 * channels, 8 + np.where(mono, 1, 2))
+    block = np.where(mpeg1, 59, 63)
+    side_info = offsets * 8 + 32 + 16 * crc + prefix + 21
+
+    gains = []
+    for granule in range(2):
+        for channel in range(2):
+            present = (granule < granules) & (channel < channels)
+            bit = side_info + (granule * channels + channel) * block
+            word = (data[bit // 8].astype(np.uint16) << 8) | data[np.minimum(bit // 8 + 1, len(data) - 1)]
+            gain = ((word >> (8 - bit % 8)) & 0xFF).astype(float)
+            gains.append(np.where(present, gain, np.nan))
+    # Granule-major order; the loudest channel stands for the granule
+    per_granule = np.stack([np.fmax(gains[0], gains[1]), np.fmax(gains[2], gains[3])], axis=1)
+    loudness = per_granule.reshape(-1)
+    loudness = loudness[~np.isnan(loudness)] * DB_PER_GAIN_STEP
+
+    _, samples, sample_rate = headers[0]
+    return loudness, samples / int(granules[0]) / sample_rate
+
+
+def find_pauses(loudness: np.ndarray, granule_seconds: float, min_pause: float = MIN_PAUSE) -> Tuple[np.ndarray, np.ndarray]:
+    """Return the midpoints and durations, in seconds, of the pauses in a loudness envelope."""
+    window = max(1, round(SMOOTHING_SECONDS / granule_seconds))
+    envelope = np.convolve(loudness, np.ones(window) / window, mode="same")
+    quiet = envelope <= np.percentile(envelope, QUIET_PERCENTILE)
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], quiet.astype(np.int8), [0]))))
+    starts, ends = edges[::2], edges[1::2]
+    durations = (ends - starts) * granule_seconds
+    keep = durations >= min_pause
+    midpoints = (starts + ends) / 2 * granule_seconds
+    return midpoints[keep], durations[keep]
+
+
+def pick_breaks(midpoints: np.ndarray, durations: np.ndarray, expected: np.ndarray, tolerance: float) -> np.ndarray:
+    """Choose one pause per expected break, in order, maximizing duration near the estimate."""
+    breaks, candidates = len(expected), len(midpoints)
+    if candidates < breaks:
+        raise AlignmentError(f"found {candidates} pauses for {breaks} breaks")
+    score = durations[None, :] * np.exp(-0.5 * ((midpoints[None, :] - expected[:, None]) / tolerance) ** 2)
+    best = np.full((breaks, candidates), -np.inf)
+    back = np.zeros((breaks, candidates), dtype=int)
+    best[0] = score[0]
+    index = np.arange(candidates)
+    for k in range(1, breaks):
+        # Best total for break k-1 using any pause before j: a running max and its argmax
+        running = np.maximum.accumulate(best[k - 1])
+        argmax = np.maximum.accumulate(np.where(best[k - 1] == running, index, 0))
+        best[k, 1:] = running[:-1] + score[k, 1:]
+        back[k, 1:] = argmax[:-1]
+    picks = [int(np.argmax(best[-1]))]
+    if not np.isfinite(best[-1, picks[0]]):
+        raise AlignmentError("pauses cannot be matched to the breaks in order")
+    for k in range(breaks - 1, 0, -1):
+        picks.append(int(back[k, picks[-1]]))
+    return midpoints[picks[::-1]]
+
+
+def align_narration(audio_path: Path, title: Optional[str], texts: List[str]) -> List[float]:
+    """Return the N+1 segment boundaries, in seconds, of a narration of title and texts."""
+    loudness, granule_seconds = granule_gains(audio_path)
+    duration = len(loudness) * granule_seconds
+    midpoints, durations = find_pauses(loudness, granule_seconds)
+
+    # Speech time tracks characters more closely than words
+    clips = ([title] if title else []) + texts
+    chars = np.array([len(text) for text in clips], dtype=float)
+    expected = np.cumsum(chars)[:-1] / chars.sum() * duration
+    if not len(expected):
+        return [0.0, round(duration, 3)]
+    breaks = pick_breaks(midpoints, durations, expected, POSITION_TOLERANCE * duration)
+    if title:
+        breaks = breaks[1:]  # the title stays in the first segment
+    return [0.0] + [round(float(t), 3) for t in breaks] + [round(duration, 3)]
+
+
+def align_story(story_dir: Path, dry_run: bool = False) -> Dict:
+    """Align one story's segments to its narration. Returns {"story", "ok", "boundaries" or "error"}."""
+    story_dir = Path(story_dir)
+    result = {"story": story_dir.name, "ok": False}
+    if not (story_dir / "story_segments.json").is_file():
+        result["error"] = "not a story folder (no story_segments.json)"
+        return result
+    try:
+        with story_lock(story_dir):
+            data = load_segments(story_dir / "story_segments.json")
+            segments = data["segments"]
+            audio_path = story_dir / AUDIO_NAME
+            if not segments or not audio_path.is_file() or not audio_path.stat().st_size:
+                raise AlignmentError("no segments or no narration")
+            boundaries = align_narration(audio_path, data.get("title"), [s.get("text") or "" for s in segments])
+            for i, segment in enumerate(segments):
+                segment["start"], segment["end"] = boundaries[i], boundaries[i + 1]
+            if not dry_run:
+                write_segments(story_dir / "story_segments.json", data)
+        result.update(ok=True, boundaries=boundaries)
+    except (OSError, ValueError) as e:
+        result["error"] = str(e)
+    return result
+
+
+def align_library(story_dirs: List[Path], workers: Optional[int] = None, dry_run: bool = False) -> List[Dict]:
+    """Align many stories in parallel worker processes."""
+    if len(story_dirs) <= 1 or workers == 1:
+        return [align_story(story_dir, dry_run) for story_dir in story_dirs]
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        return list(pool.map(align_story, story_dirs, [dry_run] * len(story_dirs)))
+
+
+def main():
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+    parser = argparse.ArgumentParser(description="Align story segments to the pauses in their narration")
+    parser.add_argument("stories", nargs="*", help="Story folders to align (default: every story under --root)")
+    parser.add_argument("--root", default=str(OUTPUT_DIR), help=f"Story library (default: {OUTPUT_DIR})")
+    parser.add_argument("--workers", type=int, help="Worker processes (default: one per CPU core)")
+    parser.add_argument("--dry-run", action="store_true", help="Print the boundaries without writing them")
+    args = parser.parse_args()
+
+    if args.stories:
+        story_dirs = [Path(story) for story in args.stories]
+    else:
+        story_dirs = [d for d in find_story_dirs(Path(args.root)) if (d / "story_segments.json").exists()]
+
+    failed = 0
+    for result in align_library(story_dirs, args.workers, args.dry_run):
+        if result["ok"]:
+            print(f"✓ {result['story']}: {' '.join(f'{t:.2f}' for t in result['boundaries'])}")
+        else:
+            failed += 1
+            print(f"× {result['story']}: {result['error']}")
+    print(f"\nAligned {len(story_dirs) - failed}/{len(story_dirs)} stories" + (" (dry run)" if args.dry_run else ""))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,12 +4,26 @@ const nextConfig = {
   swcMinify: true,
   // Add rewrites to redirect /output requests to /public/output
   async rewrites() {
-    return [
+    const rewrites = [
       {
         source: '/output/:path*',
         destination: '/public/output/:path*',
       },
     ];
+    // With MEDIA_ORIGIN set (e.g. http://127.0.0.1:8780 from media_server.py),
+    // media requests go to that server for Range and ETag support
+    if (!process.env.MEDIA_ORIGIN) {
+      return rewrites;
+    }
+    return {
+      beforeFiles: [
+        {
+          source: '/api/media/:path*',
+          destination: `${process.env.MEDIA_ORIGIN}/api/media/:path*`,
+        },
+      ],
+      afterFiles: rewrites,
+    };
   },
 }
 
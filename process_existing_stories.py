@@ -17,6 +17,10 @@ from dotenv import load_dotenv
 from openai import OpenAI
 import sys
 
+from atomic_io import atomic_path, story_lock, write_text_atomic
+from story_segments import load_segments
+from story_catalog import record_story
+
 # Load environment variables
 load_dotenv()
 
@@ -46,7 +50,8 @@ def generate_audio(story_text, output_path):
                 input=story_text
             )
             
-            response.stream_to_file(output_path)
+            with atomic_path(output_path) as tmp_path:
+                response.stream_to_file(tmp_path)
             print(f"✓ Saved audio narration to {output_path}")
             return True
             
@@ -75,48 +80,48 @@ def process_story_folder(folder_path):
         print(f"Error: story_segments.json not found in {folder_path}")
         return False
     
-    try:
-        with open(json_path, 'r') as f:
-            story_data = json.load(f)
-    except json.JSONDecodeError as e:
-        print(f"Error parsing JSON in {json_path}: {e}")
-        return False
-    except Exception as e:
-        print(f"Error reading {json_path}: {e}")
-        return False
+    with story_lock(folder_path):
+        try:
+            story_data = load_segments(json_path)
+        except json.JSONDecodeError as e:
+            print(f"Error parsing JSON in {json_path}: {e}")
+            return False
+        except Exception as e:
+            print(f"Error reading {json_path}: {e}")
+            return False
     
-    # 2. Concatenate segments into a full story
-    try:
-        story_title = story_data.get("title", folder_name)
-        segments = story_data.get("segments", [])
+        # 2. Concatenate segments into a full story
+        try:
+            story_title = story_data.get("title") or folder_name
+            segments = story_data.get("segments", [])
         
-        if not segments:
-            print(f"Error: No story segments found in {json_path}")
-            return False
+            if not segments:
+                print(f"Error: No story segments found in {json_path}")
+                return False
         
-        full_story = story_title + "\n\n"
-        full_story += "\n\n".join([segment.get("text", "") for segment in segments])
+            full_story = story_title + "\n\n"
+            full_story += "\n\n".join([segment.get("text", "") for segment in segments])
         
-        # 3. Save as story.txt
-        txt_path = folder_path / "story.txt"
-        with open(txt_path, 'w') as f:
-            f.write(full_story)
-        print(f"✓ Saved story text to {txt_path}")
+            # 3. Save as story.txt
+            txt_path = folder_path / "story.txt"
+            write_text_atomic(txt_path, full_story)
+            print(f"✓ Saved story text to {txt_path}")
         
-        # 4. Generate audio narration
-        audio_path = folder_path / "story_audio.mp3"
-        success = generate_audio(full_story, audio_path)
+            # 4. Generate audio narration
+            audio_path = folder_path / "story_audio.mp3"
+            success = generate_audio(full_story, audio_path)
         
-        if success:
-            print(f"✓ Completed processing story: {story_title}")
-            return True
-        else:
-            print(f"× Failed to generate audio for story: {story_title}")
-            return False
+            if success:
+                print(f"✓ Completed processing story: {story_title}")
+                record_story(folder_path)
+                return True
+            else:
+                print(f"× Failed to generate audio for story: {story_title}")
+                return False
         
-    except Exception as e:
-        print(f"Error processing story in {folder_path}: {e}")
-        return False
+        except Exception as e:
+            print(f"Error processing story in {folder_path}: {e}")
+            return False
 
 def main():
     # Check if output directory exists
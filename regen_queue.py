@@ -0,0 +1,398 @@
+#!/usr/bin/env python3
+"""
+Targeted Regeneration Queue
+
+A persistent SQLite work queue of story assets that need regenerating:
+1. The generators record every image/audio placeholder they write
+2. `scan` validates the library and queues broken or placeholder assets
+3. `work` drains the queue with a worker pool and a request rate limit,
+   regenerating only the queued assets and re-validating each result
+
+Usage:
+    python regen_queue.py scan [public/output]
+    python regen_queue.py work --concurrency 2 --rate 5
+    python regen_queue.py status
+"""
+
+import sys
+import json
+import time
+import sqlite3
+import logging
+import argparse
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from atomic_io import StoryLocked, sqlite_journal_mode, story_lock
+from instrumentation import recorder
+from story_catalog import record_story
+from story_publish import refresh_manifest
+from story_segments import load_segments
+from story_validator import validate_story_dir, validate_image, validate_audio, find_story_dirs
+
+logger = logging.getLogger(__name__)
+
+# Constants
+QUEUE_DB = Path("regen_queue.db")
+OUTPUT_DIR = Path("public/output")
+MAX_ATTEMPTS = 3
+AUDIO_ASSET = "story_audio.mp3"
+LOCK_TIMEOUT = 5  # seconds to wait for a story another tool is writing
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    story_dir TEXT NOT NULL,
+    asset TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    reason TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    stale INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    UNIQUE (story_dir, asset)
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id);
+"""
+
+# Columns added after the first release, for queues created before them
+MIGRATIONS = {
+    "stale": "ALTER TABLE jobs ADD COLUMN stale INTEGER NOT NULL DEFAULT 0",
+}
+
+
+def asset_kind(asset: str) -> Optional[str]:
+    """Return the regeneration kind for an asset name, or None if unsupported."""
+    if asset == AUDIO_ASSET:
+        return "audio"
+    if asset.startswith("image_") and asset.endswith(".png"):
+        return "image"
+    return None
+
+
+def connect(db_path: Path = QUEUE_DB) -> sqlite3.Connection:
+    """Open the queue database, creating the schema if needed."""
+    conn = sqlite3.connect(str(db_path), timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute(f"PRAGMA journal_mode={sqlite_journal_mode()}")
+    conn.executescript(SCHEMA)
+    columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+    for column, statement in MIGRATIONS.items():
+        if column not in columns:
+            conn.execute(statement)
+    return conn
+
+
+def enqueue(conn: sqlite3.Connection, story_dir: Path, asset: str, reason: str, stale: bool = False) -> bool:
+    """Queue an asset for regeneration.
+
+    Finished or failed jobs for the same asset are reopened; jobs that are
+    already pending or running are left alone, except that they become stale
+    when stale is set. A stale asset is regenerated even though it passes
+    validation, e.g. an image that no longer matches its segment's text.
+    Returns False for assets that cannot be regenerated on their own.
+    """
+    kind = asset_kind(asset)
+    if kind is None:
+        return False
+    now = time.time()
+    conn.execute(
+        """
+        INSERT INTO jobs (story_dir, asset, kind, reason, stale, created_at, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (story_dir, asset) DO UPDATE SET
+            reason = excluded.reason,
+            status = 'pending',
+            attempts = CASE WHEN jobs.status IN ('done', 'failed') THEN 0 ELSE jobs.attempts END,
+            stale = CASE WHEN jobs.status IN ('done', 'failed') THEN excluded.stale ELSE 1 END,
+            updated_at = excluded.updated_at
+        WHERE jobs.status IN ('done', 'failed') OR (excluded.stale AND jobs.stale = 0 AND jobs.status = 'pending')
+        """,
+        (str(Path(story_dir).resolve()), asset, kind, reason, int(stale), now, now),
+    )
+    return True
+
+
+def record_failure(story_dir: Path, asset: str, reason: str, db_path: Path = QUEUE_DB, stale: bool = False) -> None:
+    """Record a placeholder written at generation time, or with stale, an asset that is out of date.
+
+    Called from the generators' fallback paths, so queue errors are logged
+    and never interrupt generation.
+    """
+    try:
+        conn = connect(db_path)
+        try:
+            enqueue(conn, story_dir, asset, reason, stale)
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        logger.warning(f"Could not queue {asset} in {story_dir} for regeneration: {e}")
+
+
+def scan_library(conn: sqlite3.Connection, root: Path) -> Dict[str, int]:
+    """Validate every story under root and queue broken image/audio assets.
+
+    Pending jobs whose asset has since become healthy are closed, so the
+    worker never regenerates an asset that is already fine.
+    """
+    counts = {"stories": 0, "queued": 0, "resolved": 0, "skipped": 0}
+    for story_dir in find_story_dirs(root):
+        report = validate_story_dir(story_dir)
+        counts["stories"] += 1
+        resolved_dir = str(story_dir.resolve())
+
+        if report["assets"]["story_segments.json"]["placeholder"]:
+            # Images drawn from stub text are useless; the story needs full regeneration
+            logger.warning(f"{story_dir.name}: segments are fallback stub text, skipping asset regeneration")
+            counts["skipped"] += 1
+            continue
+
+        for asset, asset_report in report["assets"].items():
+            if asset_kind(asset) is None:
+                continue
+            if asset_report["ok"]:
+                cursor = conn.execute(
+                    "UPDATE jobs SET status = 'done', updated_at = ? "
+                    "WHERE story_dir = ? AND asset = ? AND status = 'pending' AND stale = 0",
+                    (time.time(), resolved_dir, asset),
+                )
+                counts["resolved"] += cursor.rowcount
+            elif enqueue(conn, story_dir, asset, "; ".join(asset_report["problems"])):
+                counts["queued"] += 1
+    return counts
+
+
+def claim_next(conn: sqlite3.Connection) -> Optional[sqlite3.Row]:
+    """Atomically take the oldest pending job and mark it running."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        job = conn.execute(
+            "SELECT * FROM jobs WHERE status = 'pending' ORDER BY id LIMIT 1"
+        ).fetchone()
+        if job is not None:
+            conn.execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                (time.time(), job["id"]),
+            )
+        conn.execute("COMMIT")
+        return job
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def finish_job(conn: sqlite3.Connection, job: sqlite3.Row, error: Optional[str] = None) -> str:
+    """Mark a claimed job done, or return it to the queue after a failure."""
+    if error is None:
+        status = "done"
+    elif job["attempts"] + 1 >= MAX_ATTEMPTS:
+        status = "failed"
+    else:
+        status = "pending"
+    conn.execute(
+        "UPDATE jobs SET status = ?, last_error = ?, updated_at = ? WHERE id = ?",
+        (status, error, time.time(), job["id"]),
+    )
+    return status
+
+
+def reset_running(conn: sqlite3.Connection) -> int:
+    """Return jobs left running by an interrupted worker to the queue."""
+    cursor = conn.execute(
+        "UPDATE jobs SET status = 'pending', updated_at = ? WHERE status = 'running'",
+        (time.time(),),
+    )
+    return cursor.rowcount
+
+
+def queue_status(conn: sqlite3.Connection) -> Dict[str, int]:
+    """Return the number of jobs in each state."""
+    rows = conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+    return {row["status"]: row["n"] for row in rows}
+
+
+class RateLimiter:
+    """Thread-safe limiter that spaces calls evenly at a maximum rate per minute."""
+
+    def __init__(self, per_minute: float):
+        self.interval = 60.0 / per_minute if per_minute > 0 else 0.0
+        self.next_slot = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self) -> None:
+        """Block until the next call is allowed."""
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def regenerate_asset(story_dir: Path, asset: str) -> Optional[str]:
+    """Regenerate one asset and re-validate it.
+
+    Returns None on success or an error message. The generator module is
+    imported lazily because it requires OPENAI_API_KEY at import time.
+    """
+    import bedtime_story_generator as generator
+
+    asset_path = story_dir / asset
+    if asset_kind(asset) == "audio":
+        story_path = story_dir / "story.txt"
+        if not story_path.exists() or not story_path.read_text().strip():
+            return "story.txt is missing or empty"
+        generator.generate_audio(story_path.read_text(), asset_path)
+        report = validate_audio(asset_path)
+    else:
+        story_data = load_segments(story_dir / "story_segments.json")
+        segments = story_data["segments"]
+        title = story_data.get("title") or story_dir.name
+        index = int(asset[len("image_"):-len(".png")])
+        if index > len(segments):
+            return f"no segment text for {asset}"
+        generator.generate_image_for_segment(title, segments[index - 1]["text"], index, asset_path)
+        report = validate_image(asset_path)
+
+    if report["ok"]:
+        return None
+    return "; ".join(report["problems"]) or "asset still invalid after regeneration"
+
+
+_done_lock = threading.Lock()
+
+
+def _worker_loop(db_path: Path, limiter: RateLimiter, stop: threading.Event, limit: Optional[int], done: List[int]) -> None:
+    """Claim and process jobs until the queue is empty or the limit is reached."""
+    conn = connect(db_path)
+    try:
+        while not stop.is_set():
+            with _done_lock:
+                if limit is not None and done[0] >= limit:
+                    return
+                done[0] += 1
+            job = claim_next(conn)
+            if job is None:
+                return
+
+            story_dir = Path(job["story_dir"])
+            asset = job["asset"]
+            try:
+                # Another tool is rewriting this story; put the job back and try it later
+                with story_lock(story_dir, timeout=LOCK_TIMEOUT):
+                    _regenerate_job(conn, job, story_dir, asset, limiter)
+            except StoryLocked:
+                logger.info(f"Deferring {story_dir.name}/{asset}: story is locked by another writer")
+                conn.execute("UPDATE jobs SET status = 'pending', attempts = attempts - 1, updated_at = ? WHERE id = ?",
+                             (time.time(), job["id"]))
+    finally:
+        conn.close()
+
+
+def _regenerate_job(conn: sqlite3.Connection, job: sqlite3.Row, story_dir: Path, asset: str, limiter: RateLimiter) -> None:
+    """Regenerate one claimed asset; the caller holds the story lock."""
+    if job["stale"]:
+        # Valid but out of date: the health check would wrongly skip it
+        healthy = False
+    elif job["kind"] == "image":
+        healthy = validate_image(story_dir / asset)["ok"]
+    else:
+        healthy = validate_audio(story_dir / asset)["ok"]
+    if healthy:
+        logger.info(f"Skipping {story_dir.name}/{asset}: already healthy")
+        finish_job(conn, job)
+        return
+
+    limiter.wait()
+    logger.info(f"Regenerating {story_dir.name}/{asset} (attempt {job['attempts'] + 1}/{MAX_ATTEMPTS})")
+    try:
+        with recorder.stage(f"regen.{job['kind']}", story=story_dir.name, asset=asset):
+            error = regenerate_asset(story_dir, asset)
+    except Exception as e:
+        error = str(e)
+    status = finish_job(conn, job, error)
+    if error is None:
+        logger.info(f"✓ Regenerated {story_dir.name}/{asset}")
+        record_story(story_dir)
+        refresh_manifest(story_dir)
+    else:
+        logger.error(f"× {story_dir.name}/{asset} ({status}): {error}")
+
+
+def drain_queue(db_path: Path = QUEUE_DB, concurrency: int = 2, per_minute: float = 5, limit: Optional[int] = None) -> Dict[str, int]:
+    """Process queued jobs with a worker pool, then return the queue status."""
+    conn = connect(db_path)
+    recovered = reset_running(conn)
+    if recovered:
+        logger.info(f"Recovered {recovered} jobs left running by a previous worker")
+    conn.close()
+
+    limiter = RateLimiter(per_minute)
+    stop = threading.Event()
+    done = [0]
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [pool.submit(_worker_loop, db_path, limiter, stop, limit, done) for _ in range(concurrency)]
+        try:
+            for future in futures:
+                future.result()
+        except KeyboardInterrupt:
+            logger.warning("Interrupted, waiting for in-flight jobs to finish...")
+            stop.set()
+
+    conn = connect(db_path)
+    try:
+        return queue_status(conn)
+    finally:
+        conn.close()
+
+
+def main():
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+    parser = argparse.ArgumentParser(description="Queue and regenerate broken or placeholder story assets")
+    parser.add_argument("--db", default=str(QUEUE_DB), help=f"Queue database (default: {QUEUE_DB})")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    scan_parser = subparsers.add_parser("scan", help="Validate the library and queue broken assets")
+    scan_parser.add_argument("root", nargs="?", default=str(OUTPUT_DIR), help=f"Story library (default: {OUTPUT_DIR})")
+
+    work_parser = subparsers.add_parser("work", help="Regenerate queued assets")
+    work_parser.add_argument("--concurrency", type=int, default=2, help="Parallel workers (default: 2)")
+    work_parser.add_argument("--rate", type=float, default=5, help="Maximum API requests per minute (default: 5)")
+    work_parser.add_argument("--limit", type=int, help="Stop after this many jobs")
+    work_parser.add_argument("--metrics-port", type=int, help="Serve Prometheus metrics on this port while working")
+
+    subparsers.add_parser("status", help="Show queue counts and failed jobs")
+    args = parser.parse_args()
+    db_path = Path(args.db)
+
+    if args.command == "scan":
+        conn = connect(db_path)
+        counts = scan_library(conn, Path(args.root))
+        conn.close()
+        print(f"Scanned {counts['stories']} stories: queued {counts['queued']} assets, "
+              f"closed {counts['resolved']} already-healthy jobs, skipped {counts['skipped']} stub stories")
+    elif args.command == "work":
+        if args.metrics_port:
+            from metrics import start_metrics_server
+            start_metrics_server(args.metrics_port, queue_db=db_path)
+        status = drain_queue(db_path, args.concurrency, args.rate, args.limit)
+        print(f"Queue status: {json.dumps(status)}")
+    else:
+        conn = connect(db_path)
+        print(f"Queue status: {json.dumps(queue_status(conn))}")
+        for job in conn.execute("SELECT * FROM jobs WHERE status = 'failed' ORDER BY id"):
+            print(f"  × {Path(job['story_dir']).name}/{job['asset']}: {job['last_error']}")
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
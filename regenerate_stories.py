@@ -8,18 +8,46 @@ This script recursively iterates through folders in the public/output directory:
 3. Overwrites story.txt with the generated content
 4. Creates new audio narration using OpenAI's Text-to-Speech API
 5. Preserves all other files (images, JSON structure)
+
+With --incremental the new text is re-segmented locally into the story's
+existing number of segments and diffed against the old segments, one by one:
+
+- Images are regenerated only for segments whose text changed materially
+  (word-level similarity below --threshold).
+- Narration is cached per clip (the title and each segment) in
+  .audio_segments/, keyed by a hash of the clip's text and voice. Only the
+  clips whose text changed are synthesized again; story_audio.mp3 is then
+  rebuilt by joining the cached clips' MP3 frames.
+- Segment timings come from the real clip durations.
+
+A story's first incremental run fills the clip cache, so it still pays for
+the full narration. After that an edit costs roughly what it changes.
+
+Usage:
+    python regenerate_stories.py                                     # full regeneration, every story
+    python regenerate_stories.py --incremental --from-text public/output/the-curious-cloud
+    python regenerate_stories.py --incremental --yes
 """
 
 import os
-import json
 import time
 import re
-import requests
+import hashlib
+import difflib
+import argparse
 from pathlib import Path
 from dotenv import load_dotenv
 from openai import OpenAI
 import sys
 
+from atomic_io import atomic_path, story_lock, write_text_atomic
+from regen_queue import record_failure
+from story_catalog import record_story
+from story_preflight import resplit
+from story_publish import refresh_manifest
+from story_segments import load_segments, write_segments
+from story_validator import _skip_id3, mp3_info, validate_image
+
 # Load environment variables
 load_dotenv()
 
@@ -38,6 +66,12 @@ OUTPUT_DIR = Path("public/output")
 MAX_RETRIES = 3
 RETRY_DELAY = 5  # seconds
 DELAY_BETWEEN_STORIES = 2  # seconds
+TTS_MODEL = "tts-1"
+VOICE = "nova"  # A soothing voice good for bedtime stories
+CLIP_CACHE_DIR = ".audio_segments"  # per-clip narration cache inside each story folder
+MATERIAL_SIMILARITY = 0.75  # segments less similar than this get a new image
+STAGED_SUFFIX = ".new"  # new images wait next to the old ones until the narration is done
+ID3V1_TAG_SIZE = 128
 
 def parse_title_from_folder_name(folder_name):
     """Convert folder name to a readable story title."""
@@ -98,13 +132,13 @@ def generate_audio(story_text, output_path):
     for attempt in range(MAX_RETRIES):
         try:
             print("Generating audio narration...")
-            response = client.audio.speech.create(
-                model="tts-1",
-                voice="nova",  # A soothing voice good for bedtime stories
+            with client.audio.speech.with_streaming_response.create(
+                model=TTS_MODEL,
+                voice=VOICE,
                 input=story_text
-            )
-            
-            response.stream_to_file(output_path)
+            ) as response:
+                with atomic_path(output_path) as tmp_path:
+                    response.stream_to_file(tmp_path)
             print(f"✓ Saved audio narration to {output_path}")
             return True
             
@@ -133,53 +167,221 @@ def process_story_folder(folder_path):
         print(f"Skipping folder {folder_name}: Not a story folder (missing story_segments.json)")
         return False
     
-    try:
-        # Parse title from folder name
-        story_title = parse_title_from_folder_name(folder_name)
-        print(f"Story title: \"{story_title}\"")
+    # Lock the folder: the title update below reads and rewrites story_segments.json
+    with story_lock(folder_path):
+        try:
+            # Parse title from folder name
+            story_title = parse_title_from_folder_name(folder_name)
+            print(f"Story title: \"{story_title}\"")
         
-        # Generate story
-        story_text = generate_story(story_title)
-        if not story_text:
-            print(f"× Failed to generate story for: {story_title}")
-            return False
+            # Generate story
+            story_text = generate_story(story_title)
+            if not story_text:
+                print(f"× Failed to generate story for: {story_title}")
+                return False
         
-        # Save story text
-        txt_path = folder_path / "story.txt"
-        with open(txt_path, 'w') as f:
-            f.write(story_text)
-        print(f"✓ Saved story text to {txt_path}")
+            # Save story text
+            txt_path = folder_path / "story.txt"
+            write_text_atomic(txt_path, story_text)
+            print(f"✓ Saved story text to {txt_path}")
         
-        # Generate audio narration
-        audio_path = folder_path / "story_audio.mp3"
-        success = generate_audio(story_text, audio_path)
+            # Generate audio narration
+            audio_path = folder_path / "story_audio.mp3"
+            success = generate_audio(story_text, audio_path)
         
-        if success:
-            print(f"✓ Completed processing story: {story_title}")
+            if success:
+                print(f"✓ Completed processing story: {story_title}")
             
-            # Optionally update the story_segments.json with the new story text
-            # We'll preserve the existing file structure but just update the "title" field
-            try:
-                with open(json_path, 'r') as f:
-                    segments_data = json.load(f)
+                # Optionally update the story_segments.json with the new story text
+                # We'll preserve the existing file structure but just update the "title" field
+                try:
+                    segments_data = load_segments(json_path)
                 
-                # Update title
-                segments_data["title"] = story_title
+                    # Update title
+                    segments_data["title"] = story_title
                 
-                with open(json_path, 'w') as f:
-                    json.dump(segments_data, f, indent=2)
-                print(f"✓ Updated title in story_segments.json")
-            except Exception as e:
-                print(f"Note: Could not update story_segments.json title: {e}")
+                    write_segments(json_path, segments_data)
+                    print(f"✓ Updated title in story_segments.json")
+                except Exception as e:
+                    print(f"Note: Could not update story_segments.json title: {e}")
             
-            return True
-        else:
-            print(f"× Failed to generate audio for story: {story_title}")
-            return False
+                record_story(folder_path)
+                return True
+            else:
+                print(f"× Failed to generate audio for story: {story_title}")
+                return False
         
-    except Exception as e:
-        print(f"Error processing story in {folder_path}: {e}")
-        return False
+        except Exception as e:
+            print(f"Error processing story in {folder_path}: {e}")
+            return False
+
+def strip_title_heading(story_text, title):
+    """Return the story body without a leading title line, if it has one."""
+    paragraphs = [p.strip() for p in re.split(r'\n\s*\n', story_text.strip()) if p.strip()]
+    if paragraphs:
+        heading = re.sub(r'^(#+|title:)\s*', '', paragraphs[0].strip('*"\' '), flags=re.IGNORECASE).strip('*"\' ')
+        if heading.lower() == title.lower() or ('\n' not in paragraphs[0] and len(heading.split()) <= 12
+                                                and not re.search(r'[.!?…]["\'”’]?$', heading)):
+            paragraphs = paragraphs[1:]
+    return "\n\n".join(paragraphs)
+
+def segment_similarity(old_text, new_text):
+    """Word-level similarity of two segment texts, from 0.0 to 1.0."""
+    return difflib.SequenceMatcher(None, (old_text or "").split(), (new_text or "").split()).ratio()
+
+def clip_name(text, voice=VOICE):
+    """Cache file name for one narration clip; identical text reuses the clip."""
+    digest = hashlib.sha1(f"{TTS_MODEL}\0{voice}\0{text}".encode("utf-8")).hexdigest()
+    return f"{digest[:20]}.mp3"
+
+def ensure_clips(cache_dir, texts):
+    """Synthesize the clips in texts that are not cached yet.
+
+    Returns (clip paths in order, number synthesized), or None if a clip fails.
+    """
+    cache_dir.mkdir(exist_ok=True)
+    clips = []
+    synthesized = 0
+    for text in texts:
+        clip_path = cache_dir / clip_name(text)
+        if not clip_path.exists() or not mp3_info(clip_path)["frames"]:
+            if not generate_audio(text, clip_path) or not mp3_info(clip_path)["frames"]:
+                print(f"× No usable narration for clip: {text[:40]!r}...")
+                return None
+            synthesized += 1
+        clips.append(clip_path)
+    return clips, synthesized
+
+def join_clips(clips, output_path):
+    """Concatenate the MP3 frames of clips into output_path, one clip in memory at a time."""
+    with atomic_path(output_path) as tmp_path:
+        with open(tmp_path, "wb") as out:
+            for clip_path in clips:
+                data = clip_path.read_bytes()
+                end = len(data)
+                if end >= ID3V1_TAG_SIZE and data[end - ID3V1_TAG_SIZE:end - ID3V1_TAG_SIZE + 3] == b"TAG":
+                    end -= ID3V1_TAG_SIZE
+                out.write(data[_skip_id3(data):end])
+
+def clip_boundaries(clips):
+    """Segment boundaries from clip durations: the title clip is part of the first segment."""
+    durations = [mp3_info(clip_path)["duration"] for clip_path in clips]
+    boundaries = [0.0]
+    elapsed = durations[0]
+    for duration in durations[1:]:
+        elapsed += duration
+        boundaries.append(round(elapsed, 3))
+    return boundaries
+
+def prune_clips(cache_dir, keep):
+    """Remove cached clips no longer used by the story."""
+    names = {clip_path.name for clip_path in keep}
+    for clip_path in cache_dir.glob("*.mp3"):
+        if clip_path.name not in names:
+            clip_path.unlink()
+
+def regenerate_incrementally(folder_path, from_text=False, threshold=MATERIAL_SIMILARITY):
+    """Update a story folder, regenerating only the images and narration its new text needs."""
+    # Imported lazily: the generator module needs OPENAI_API_KEY at import time
+    import bedtime_story_generator as generator
+
+    folder_name = folder_path.name
+    print(f"\nIncrementally regenerating: {folder_name}")
+    json_path = folder_path / "story_segments.json"
+    txt_path = folder_path / "story.txt"
+
+    with story_lock(folder_path):
+        try:
+            segments_data = load_segments(json_path)
+            old_segments = segments_data["segments"]
+            if not old_segments:
+                print(f"Skipping {folder_name}: no existing segments to diff against")
+                return False
+            story_title = segments_data.get("title") or parse_title_from_folder_name(folder_name)
+
+            if from_text:
+                if not txt_path.exists():
+                    print(f"× {txt_path} does not exist")
+                    return False
+                story_text = txt_path.read_text()
+            else:
+                story_text = generate_story(story_title)
+                if not story_text:
+                    print(f"× Failed to generate story for: {story_title}")
+                    return False
+
+            body = strip_title_heading(story_text, story_title)
+            if not body:
+                print(f"× No story text for: {story_title}")
+                return False
+            paragraphs = [p.strip() for p in re.split(r'\n\s*\n', body) if p.strip()]
+            if len(paragraphs) == len(old_segments):
+                # story.txt keeps one paragraph per segment, so an edit stays in its own segment
+                new_texts = [" ".join(p.split()) for p in paragraphs]
+            else:
+                new_texts = resplit([body], len(old_segments))
+
+            # Diff segment by segment; only material changes get a new image
+            changed = [i for i, segment in enumerate(old_segments) if segment.get("text") != new_texts[i]]
+            material = [i for i in changed if segment_similarity(old_segments[i].get("text"), new_texts[i]) < threshold]
+            print(f"{len(changed)}/{len(old_segments)} segments changed, {len(material)} materially")
+
+            # New images are staged, so nothing in the story changes unless the narration succeeds too
+            staged_paths = []
+            staged = []
+            failed = []
+            try:
+                for i in material:
+                    image_path = folder_path / (old_segments[i].get("image") or f"image_{i+1}.png")
+                    staged_path = image_path.with_name(image_path.name + STAGED_SUFFIX)
+                    staged_paths.append(staged_path)
+                    generator.generate_image_for_segment(story_title, new_texts[i], i + 1, staged_path)
+                    # On failure the generator leaves a placeholder, which must not replace a real image
+                    if staged_path.exists() and validate_image(staged_path)["ok"]:
+                        staged.append((staged_path, image_path))
+                    else:
+                        failed.append(image_path.name)
+
+                cache_dir = folder_path / CLIP_CACHE_DIR
+                result = ensure_clips(cache_dir, [story_title] + new_texts)
+                if result is None:
+                    print(f"× Narration failed for {folder_name}; story left unchanged")
+                    return False
+                clips, synthesized = result
+                print(f"Synthesized {synthesized}/{len(clips)} narration clips")
+
+                for staged_path, image_path in staged:
+                    os.replace(staged_path, image_path)
+                # Joining is local and cheap, and keeps the narration in step with the cache
+                join_clips(clips, folder_path / "story_audio.mp3")
+                boundaries = clip_boundaries(clips)
+
+                for i, segment in enumerate(old_segments):
+                    segment["text"] = new_texts[i]
+                    segment["start"], segment["end"] = boundaries[i], boundaries[i + 1]
+                segments_data["title"] = story_title
+                write_text_atomic(txt_path, story_title + "\n\n" + "\n\n".join(new_texts))
+                write_segments(json_path, segments_data)
+                prune_clips(cache_dir, clips)
+            finally:
+                for staged_path in staged_paths:
+                    if staged_path.exists():
+                        staged_path.unlink()
+        except Exception as e:
+            print(f"Error processing story in {folder_path}: {e}")
+            return False
+
+    # The old image stays, but it no longer matches its segment: queued as stale, so it is redrawn though valid
+    for image_name in failed:
+        record_failure(folder_path, image_name, "incremental regeneration failed; image shows the old text", stale=True)
+    record_story(folder_path)
+    refresh_manifest(folder_path)
+    if failed:
+        print(f"! Updated {folder_name}: {len(staged)}/{len(material)} images regenerated, kept old "
+              f"{', '.join(failed)} (queued for regen_queue.py); {synthesized} narration clips regenerated")
+    else:
+        print(f"✓ Updated {folder_name}: {len(material)} images and {synthesized} narration clips regenerated")
+    return True
 
 def process_all_folders(root_dir):
     """Recursively process all folders inside the root directory."""
@@ -199,32 +401,52 @@ def process_all_folders(root_dir):
     return all_folders
 
 def main():
-    # Check if output directory exists
-    if not OUTPUT_DIR.exists() or not OUTPUT_DIR.is_dir():
-        print(f"Error: Directory {OUTPUT_DIR} does not exist or is not a directory.")
-        return
+    parser = argparse.ArgumentParser(description="Regenerate story text and narration for existing story folders")
+    parser.add_argument("folders", nargs="*", help=f"Story folders to regenerate (default: every story in {OUTPUT_DIR})")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Regenerate only the images and narration clips whose segment text changed")
+    parser.add_argument("--from-text", action="store_true",
+                        help="With --incremental, use the existing (edited) story.txt instead of writing a new story")
+    parser.add_argument("--threshold", type=float, default=MATERIAL_SIMILARITY,
+                        help=f"Similarity below which a segment gets a new image (default: {MATERIAL_SIMILARITY})")
+    parser.add_argument("--yes", action="store_true", help="Do not ask for confirmation")
+    args = parser.parse_args()
+
+    if args.from_text and not args.incremental:
+        parser.error("--from-text requires --incremental")
+
+    if args.folders:
+        story_folders = [Path(folder) for folder in args.folders]
+    else:
+        # Check if output directory exists
+        if not OUTPUT_DIR.exists() or not OUTPUT_DIR.is_dir():
+            print(f"Error: Directory {OUTPUT_DIR} does not exist or is not a directory.")
+            return 1
+        # Get all story folders recursively
+        story_folders = process_all_folders(OUTPUT_DIR)
     
     print(f"Story Regeneration Script")
     print(f"========================")
     print(f"Root directory: {OUTPUT_DIR.absolute()}")
-    print(f"This will regenerate story.txt and story_audio.mp3 files for each folder.")
+    if args.incremental:
+        print(f"This will update changed segments' images and narration in each folder.")
+    else:
+        print(f"This will regenerate story.txt and story_audio.mp3 files for each folder.")
     print(f"IMPORTANT: Existing story files will be overwritten!")
     print(f"========================\n")
     
-    # Get all story folders recursively
-    story_folders = process_all_folders(OUTPUT_DIR)
-    
     if not story_folders:
         print(f"No story folders found in {OUTPUT_DIR}")
-        return
+        return 1
     
     print(f"Found {len(story_folders)} story folders to process.")
     
     # Check with user before proceeding
-    confirmation = input(f"Regenerate stories for {len(story_folders)} folders? (y/N): ")
-    if confirmation.lower() != 'y':
-        print("Operation cancelled.")
-        return
+    if not args.yes:
+        confirmation = input(f"Regenerate stories for {len(story_folders)} folders? (y/N): ")
+        if confirmation.lower() != 'y':
+            print("Operation cancelled.")
+            return 1
     
     # Track success/failure
     successful = 0
@@ -233,7 +455,11 @@ def main():
     # Process each story folder
     for i, folder in enumerate(story_folders):
         print(f"\n[{i+1}/{len(story_folders)}] Processing: {folder.name}")
-        if process_story_folder(folder):
+        if args.incremental:
+            ok = regenerate_incrementally(folder, from_text=args.from_text, threshold=args.threshold)
+        else:
+            ok = process_story_folder(folder)
+        if ok:
             successful += 1
         else:
             failed += 1
@@ -247,6 +473,7 @@ def main():
     print(f"\nProcessing complete!")
     print(f"Successfully processed: {successful} stories")
     print(f"Failed to process: {failed} stories")
+    return 0 if not failed else 1
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    sys.exit(main())
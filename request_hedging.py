@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Hedged Requests
+
+Cuts the latency tail of DALL-E and TTS calls. When a call has not finished
+by the configured percentile of its recent latencies, the hedger sends a
+duplicate and uses whichever attempt finishes first:
+
+    response = hedger.call("images.generate", lambda attempt: client.images.generate(...),
+                           cost=PRICES["dall-e-3"]["images"])
+
+The latency history is this run's own: every attempt that succeeds adds its
+duration to the last HISTORY_SIZE samples for its operation. No hedge is
+sent until MIN_SAMPLES have been seen. Each hedge is paid for, so hedges
+draw on a global spend cap in USD. Once the cap is used up, calls simply
+wait. The losing attempt cannot be cancelled mid-request. It finishes in
+the background, and its result is handed to discard() (for example to
+delete its temp file).
+
+Hedging is off until configure() gives it a percentile. The generators
+and the daemon take --hedge-percentile and --hedge-spend, and hedger.stats()
+is added to the run summary. Try it against the mock server with injected
+slow requests:
+
+    python benchmark_pipeline.py --stories 3 --latency images=1,speech=1 --slow-rate 0.1 --hedge-percentile 90
+"""
+
+import time
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Deque, Dict, Optional, TypeVar
+
+from instrumentation import percentile, recorder
+
+# Constants
+HISTORY_SIZE = 100  # recent successful latencies kept per operation
+MIN_SAMPLES = 5  # no hedging before an operation has this many samples
+DEFAULT_SPEND_CAP = 1.0  # USD of duplicate requests per run
+MAX_ATTEMPT_THREADS = 32
+
+T = TypeVar("T")
+
+
+class Hedger:
+    """Sends a backup request when a call outlives its recent latency percentile."""
+
+    def __init__(self, percentile: Optional[float] = None, spend_cap: float = DEFAULT_SPEND_CAP):
+        self.lock = threading.Lock()
+        self.percentile = percentile
+        self.spend_cap = spend_cap
+        self.history: Dict[str, Deque[float]] = {}
+        self.executor: Optional[ThreadPoolExecutor] = None
+        self.hedges = 0
+        self.wins = 0
+        self.spent = 0.0
+
+    def configure(self, percentile: Optional[float], spend_cap: float = DEFAULT_SPEND_CAP) -> None:
+        """Enable hedging at percentile (0-100) of recent latencies; None disables it."""
+        with self.lock:
+            self.percentile = percentile
+            self.spend_cap = spend_cap
+
+    def observe(self, operation: str, seconds: float) -> None:
+        with self.lock:
+            self.history.setdefault(operation, deque(maxlen=HISTORY_SIZE)).append(seconds)
+
+    def threshold(self, operation: str) -> Optional[float]:
+        """Seconds after which a call to operation is hedged, or None."""
+        with self.lock:
+            samples = list(self.history.get(operation, ()))
+            target = self.percentile
+        if target is None or len(samples) < MIN_SAMPLES:
+            return None
+        return percentile(samples, target / 100)
+
+    def _reserve(self, cost: float) -> bool:
+        with self.lock:
+            if self.spent + cost > self.spend_cap:
+                return False
+            self.spent += cost
+            self.hedges += 1
+            return True
+
+    def _timed(self, operation: str, attempt: Callable[[int], T], number: int) -> T:
+        started = time.perf_counter()
+        result = attempt(number)
+        self.observe(operation, time.perf_counter() - started)
+        return result
+
+    def call(self, operation: str, attempt: Callable[[int], T], cost: float = 0.0,
+             discard: Optional[Callable[[T], None]] = None) -> T:
+        """Run attempt(0), and attempt(1) as well if it is slow. Returns the first successful result.
+
+        If both attempts fail, the last error is raised. attempt receives its
+        number, so concurrent attempts can write to different temp files.
+        """
+        limit = self.threshold(operation)
+        if limit is None:
+            return self._timed(operation, attempt, 0)
+
+        with self.lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(MAX_ATTEMPT_THREADS, thread_name_prefix="hedge")
+            executor = self.executor
+        # Attempts run in the caller's context, so their stage events are attributed like inline calls
+        primary = executor.submit(contextvars.copy_context().run, self._timed, operation, attempt, 0)
+        done, _ = wait([primary], timeout=limit)
+        if done or not self._reserve(cost):
+            return primary.result()
+
+        recorder.count("hedges", stage=operation, after=round(limit, 3), cost=round(cost, 4))
+        backup = executor.submit(contextvars.copy_context().run, self._timed, operation, attempt, 1)
+        pending = {primary, backup}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    error = future.exception()
+                    continue
+                if future is backup:
+                    with self.lock:
+                        self.wins += 1
+                    recorder.count("hedge_wins", stage=operation)
+                for loser in pending:
+                    loser.add_done_callback(lambda f: self._discard(f, discard))
+                return future.result()
+        raise error
+
+    @staticmethod
+    def _discard(future, discard: Optional[Callable]) -> None:
+        if discard is not None and future.exception() is None:
+            try:
+                discard(future.result())
+            except Exception:
+                pass
+
+    def stats(self) -> Dict:
+        with self.lock:
+            return {
+                "percentile": self.percentile,
+                "spend_cap": self.spend_cap,
+                "hedges": self.hedges,
+                "wins": self.wins,
+                "spent": round(self.spent, 4),
+            }
+
+
+# Shared by every generator, worker thread and the daemon in this process
+hedger = Hedger()
@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+"""
+Run Budget and Admission Control
+
+Bounds what a batch may spend. A run gets a budget in dollars, per-model
+call caps, a deadline, or any mix of them. Before each story starts, the
+scheduler estimates what that story will cost, how many calls it will make
+and how long it will take, and admits it only if all of that still fits:
+
+    scheduler = RunScheduler(dollars=5.0, calls={"dall-e-3": 200}, deadline=parse_deadline("2h"))
+    ticket, reason = scheduler.admit(segments=10)
+    if ticket is None:
+        print(f"Stopping: {reason}")
+    ...
+    scheduler.release(ticket)
+
+Estimates come from the stage events of recent runs in run_logs/, refined
+by the events of the current run as it goes. A story costs a fixed part
+(story text, pre-flight, narration) plus a part per segment (images), and
+the same split is used for calls. Hedged duplicates count as both spend and
+calls. Wall time is the measured story duration, split the same way. Without
+enough history, conservative defaults priced from PRICES are used.
+
+Admitted stories hold a reservation until they finish, so concurrent
+workers cannot admit more than fits between them, and every estimate is
+padded by SAFETY_MARGIN. What a story has already spent comes out of its
+own reservation, so in-flight spend is not counted twice. Spend is
+attributed to the ticket admitted last in the thread (or context) that
+records it. A story that is admitted always runs to the end.
+Stopping halfway would leave a broken story and save little.
+
+When jobs differ in size, as in a shared queue, the smallest are started
+first (story_worker.py). That completes the most stories before the
+budget or the deadline runs out.
+
+Usage:
+    python run_budget.py --segments 10                                 # per-story estimate
+    python run_budget.py --segments 10 --stories 100 --budget 5 --deadline 06:00
+    python bedtime_story_generator.py --stories 100 --budget 5 --max-calls dall-e-3=200 --deadline 2h
+"""
+
+import re
+import sys
+import json
+import time
+import logging
+import argparse
+import threading
+import contextvars
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from instrumentation import LOG_DIR, PRICES, recorder
+
+logger = logging.getLogger(__name__)
+
+# Constants
+HISTORY_RUNS = 20  # most recent run logs used for estimates
+MIN_HISTORY_STORIES = 3  # fewer finished stories than this and the defaults are used
+SAFETY_MARGIN = 1.2  # estimates are padded by this factor before admission
+STAGE_MODELS = {"chat.ideas": "gpt-4", "chat.story": "gpt-4", "images.generate": "dall-e-3", "tts": "tts-1"}
+SEGMENT_STAGES = ("images.generate", "image.download", "image.encode")  # repeated once per segment
+# Used until the history has MIN_HISTORY_STORIES stories: a ~2,000-token story and ~300 narrated characters per segment
+DEFAULT_FIXED_COST = 0.5 * PRICES["gpt-4"]["prompt_tokens"] + 1.5 * PRICES["gpt-4"]["completion_tokens"]
+DEFAULT_SEGMENT_COST = PRICES["dall-e-3"]["images"] + 0.3 * PRICES["tts-1"]["characters"]
+DEFAULT_FIXED_SECONDS = 60.0
+DEFAULT_SEGMENT_SECONDS = 20.0
+DEFAULT_FIXED_CALLS = {"gpt-4": 1.0, "tts-1": 1.0}
+DEFAULT_SEGMENT_CALLS = {"dall-e-3": 1.0}
+DURATION_PATTERN = re.compile(r"^(\d+(?:\.\d+)?)\s*([smh]?)$")
+
+# The admitted story whose spend the current thread records
+_current_ticket = contextvars.ContextVar("run_budget_ticket", default=None)
+
+
+class StoryEstimate:
+    """Expected cost, calls and seconds of one story, as a fixed part plus a part per segment."""
+
+    def __init__(self, fixed_cost: float, segment_cost: float, fixed_seconds: float, segment_seconds: float,
+                 fixed_calls: Dict[str, float], segment_calls: Dict[str, float], stories: int = 0):
+        self.fixed_cost = fixed_cost
+        self.segment_cost = segment_cost
+        self.fixed_seconds = fixed_seconds
+        self.segment_seconds = segment_seconds
+        self.fixed_calls = fixed_calls
+        self.segment_calls = segment_calls
+        self.stories = stories  # stories the estimate was measured on; 0 for the defaults
+
+    @classmethod
+    def defaults(cls) -> "StoryEstimate":
+        return cls(DEFAULT_FIXED_COST, DEFAULT_SEGMENT_COST, DEFAULT_FIXED_SECONDS, DEFAULT_SEGMENT_SECONDS,
+                   dict(DEFAULT_FIXED_CALLS), dict(DEFAULT_SEGMENT_CALLS))
+
+    @classmethod
+    def from_events(cls, events: Iterable[Dict]) -> "StoryEstimate":
+        """Measure the estimate from recorder events; the defaults if too few stories finished."""
+        stories, story_seconds, segments, segment_seconds = 0, 0.0, 0, 0.0
+        run_segments: Dict[str, int] = {}
+        cost = {"fixed": 0.0, "segment": 0.0}
+        calls: Dict[str, Dict[str, float]] = {"fixed": {}, "segment": {}}
+        for event in events:
+            kind = event.get("event")
+            if kind == "run_start":
+                run_segments[event.get("run")] = event.get("segments") or 0
+            elif kind == "stage" and event.get("stage") == "story":
+                if event.get("ok", True):
+                    stories += 1
+                    story_seconds += event.get("duration", 0.0)
+                    segments += event.get("segments") or run_segments.get(event.get("run"), 0)
+            elif kind == "stage" or (kind == "count" and event.get("name") == "hedges"):
+                # A hedge is a duplicate call to its stage's model, with its own cost
+                stage = event.get("stage")
+                part = "segment" if stage in SEGMENT_STAGES else "fixed"
+                cost[part] += event.get("cost", 0.0)
+                if kind == "stage" and part == "segment":
+                    segment_seconds += event.get("duration", 0.0)
+                model = STAGE_MODELS.get(stage)
+                if model:
+                    calls[part][model] = calls[part].get(model, 0.0) + 1
+        if stories < MIN_HISTORY_STORIES or not segments:
+            return cls.defaults()
+
+        segment_seconds /= segments
+        # Story time beyond the per-segment stages (text, narration, pauses) is the fixed part
+        fixed_seconds = max(0.0, story_seconds / stories - segment_seconds * segments / stories)
+        return cls(
+            cost["fixed"] / stories, cost["segment"] / segments, fixed_seconds, segment_seconds,
+            {model: n / stories for model, n in calls["fixed"].items()},
+            {model: n / segments for model, n in calls["segment"].items()},
+            stories,
+        )
+
+    def for_story(self, segments: int) -> Tuple[float, float, Dict[str, float]]:
+        """Return (cost, seconds, calls per model) for a story with this many segments."""
+        calls = {model: n for model, n in self.fixed_calls.items()}
+        for model, n in self.segment_calls.items():
+            calls[model] = calls.get(model, 0.0) + n * segments
+        return (self.fixed_cost + self.segment_cost * segments,
+                self.fixed_seconds + self.segment_seconds * segments, calls)
+
+    def to_dict(self) -> Dict:
+        return {key: round(value, 4) if isinstance(value, float) else value for key, value in vars(self).items()}
+
+
+def load_history(log_dir: Path = LOG_DIR, runs: int = HISTORY_RUNS) -> List[Dict]:
+    """Return the events of the most recent run logs, oldest first."""
+    events = []
+    for path in sorted(Path(log_dir).glob("run-*.jsonl"))[-runs:]:
+        try:
+            with open(path, "r") as f:
+                for line in f:
+                    try:
+                        events.append(json.loads(line))
+                    except ValueError:
+                        continue  # a line cut short by a crash
+        except OSError as e:
+            logger.warning(f"Could not read {path}: {e}")
+    return events
+
+
+def parse_deadline(text: str, now: Optional[float] = None) -> float:
+    """Return the epoch time for a deadline given as "90m", "2h", "3600" (seconds) or a clock time "06:30"."""
+    now = time.time() if now is None else now
+    text = text.strip().lower()
+    if ":" in text:
+        hours, minutes = (int(part) for part in text.split(":", 1))
+        local = time.localtime(now)
+        deadline = time.mktime((local.tm_year, local.tm_mon, local.tm_mday, hours, minutes, 0, 0, 0, -1))
+        # A clock time already past today means tomorrow
+        return deadline if deadline > now else deadline + 24 * 3600
+    match = DURATION_PATTERN.match(text)
+    if not match:
+        raise ValueError(f"deadline must look like 90m, 2h, 3600 or 06:30, not {text!r}")
+    value, unit = float(match.group(1)), match.group(2)
+    return now + value * {"": 1, "s": 1, "m": 60, "h": 3600}[unit]
+
+
+def parse_call_caps(text: str) -> Dict[str, int]:
+    """Parse "dall-e-3=200,tts-1=20" into per-model call caps."""
+    caps = {}
+    for part in filter(None, (part.strip() for part in text.split(","))):
+        model, _, value = part.partition("=")
+        if model not in PRICES or not value.isdigit():
+            raise ValueError(f"call caps look like dall-e-3=200,tts-1=20 with models from {', '.join(PRICES)}")
+        caps[model] = int(value)
+    return caps
+
+
+class RunScheduler:
+    """Admits stories only while their estimated cost, calls and time fit the run's limits."""
+
+    def __init__(self, dollars: Optional[float] = None, calls: Optional[Dict[str, int]] = None,
+                 deadline: Optional[float] = None, history: Optional[List[Dict]] = None,
+                 margin: float = SAFETY_MARGIN):
+        self.lock = threading.Lock()
+        self.dollars = dollars
+        self.call_caps = dict(calls or {})
+        self.deadline = deadline
+        self.margin = margin
+        self.history = load_history() if history is None else history
+        self.live: List[Dict] = []
+        self.spent = 0.0
+        self.calls: Dict[str, int] = {}
+        self.reservations: Dict[int, Dict] = {}  # ticket -> reserved and so far used cost and calls
+        self.next_ticket = 1
+        self.admitted = 0
+        self.refused: Optional[str] = None
+        recorder.add_listener(self._observe)
+
+    @property
+    def limited(self) -> bool:
+        return self.dollars is not None or bool(self.call_caps) or self.deadline is not None
+
+    def _observe(self, event: Dict) -> None:
+        """Recorder listener: actual spend and calls of this run, and more data for the estimate."""
+        if event.get("event") not in ("run_start", "stage", "count"):
+            return
+        stage = event.get("stage")
+        with self.lock:
+            self.live.append(event)
+            if event["event"] == "stage" or (event["event"] == "count" and event.get("name") == "hedges"):
+                cost = event.get("cost", 0.0)
+                model = STAGE_MODELS.get(stage)
+                self.spent += cost
+                if model:
+                    self.calls[model] = self.calls.get(model, 0) + 1
+                reservation = self.reservations.get(_current_ticket.get())
+                if reservation is not None:
+                    reservation["spent"] += cost
+                    if model:
+                        reservation["used"][model] = reservation["used"].get(model, 0) + 1
+
+    def estimate(self, segments: int) -> Tuple[float, float, Dict[str, float]]:
+        with self.lock:
+            events = self.history + self.live
+        return StoryEstimate.from_events(events).for_story(segments)
+
+    def admit(self, segments: int, lead_seconds: float = 0.0) -> Tuple[Optional[int], Optional[str]]:
+        """Reserve room for a story. Returns (ticket, None), or (None, reason) if it does not fit.
+
+        Call it from the thread that then runs the story: spend recorded there
+        is charged to the ticket. lead_seconds is time the story waits before
+        it starts, such as a pacing delay.
+        """
+        cost, seconds, calls = self.estimate(segments)
+        with self.lock:
+            # Only the part of each reservation its story has not spent yet; the rest is in self.spent
+            reserved_cost = sum(max(0.0, r["cost"] - r["spent"]) for r in self.reservations.values())
+            reason = None
+            if self.deadline is not None and time.time() + lead_seconds + seconds * self.margin > self.deadline:
+                reason = f"a {segments}-segment story takes about {seconds:.0f}s and the deadline is {max(0, self.deadline - time.time()):.0f}s away"
+            elif self.dollars is not None and self.spent + reserved_cost + cost * self.margin > self.dollars:
+                reason = f"a story costs about ${cost:.2f} and ${max(0.0, self.dollars - self.spent - reserved_cost):.2f} of ${self.dollars:.2f} is left"
+            else:
+                for model, cap in self.call_caps.items():
+                    reserved = sum(max(0.0, r["calls"].get(model, 0.0) - r["used"].get(model, 0))
+                                   for r in self.reservations.values())
+                    if self.calls.get(model, 0) + reserved + calls.get(model, 0.0) * self.margin > cap:
+                        reason = f"a story makes about {calls.get(model, 0.0):.0f} {model} calls and {max(0, cap - self.calls.get(model, 0)):.0f} of {cap} are left"
+                        break
+            if reason is not None:
+                self.refused = reason
+                return None, reason
+            ticket = self.next_ticket
+            self.next_ticket += 1
+            self.reservations[ticket] = {
+                "cost": cost * self.margin,
+                "calls": {model: n * self.margin for model, n in calls.items()},
+                "spent": 0.0,
+                "used": {},
+            }
+            self.admitted += 1
+        _current_ticket.set(ticket)
+        recorder.count("admitted", segments=segments, cost=round(cost, 4), seconds=round(seconds, 1))
+        return ticket, None
+
+    def release(self, ticket: Optional[int]) -> None:
+        """End a story's reservation; what it actually spent is already counted."""
+        with self.lock:
+            self.reservations.pop(ticket, None)
+        if ticket is not None and _current_ticket.get() == ticket:
+            _current_ticket.set(None)
+
+    def stats(self) -> Dict:
+        with self.lock:
+            return {
+                "budget": self.dollars,
+                "call_caps": self.call_caps,
+                "deadline": self.deadline,
+                "spent": round(self.spent, 4),
+                "calls": dict(self.calls),
+                "admitted": self.admitted,
+                "refused": self.refused,
+            }
+
+
+def plan(estimate: StoryEstimate, segments: int, stories: int, dollars: Optional[float] = None,
+         calls: Optional[Dict[str, int]] = None, deadline: Optional[float] = None,
+         margin: float = SAFETY_MARGIN) -> Dict:
+    """How many of stories one sequential run can admit under the limits, and what bounds it."""
+    cost, seconds, story_calls = estimate.for_story(segments)
+    fits = {"stories": stories}
+    if dollars is not None:
+        fits["budget"] = int(dollars // (cost * margin)) if cost else stories
+    for model, cap in (calls or {}).items():
+        per_story = story_calls.get(model, 0.0) * margin
+        fits[model] = int(cap // per_story) if per_story else stories
+    if deadline is not None:
+        fits["deadline"] = int(max(0.0, deadline - time.time()) // (seconds * margin)) if seconds else stories
+    limit = min(fits, key=fits.get)
+    return {"cost": round(cost, 4), "seconds": round(seconds, 1), "calls": {m: round(n, 2) for m, n in story_calls.items()},
+            "admitted": fits[limit], "limited_by": limit, "fits": fits}
+
+
+def main():
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+    parser = argparse.ArgumentParser(description="Estimate story cost and time from run history, and how many stories fit a budget")
+    parser.add_argument("--segments", type=int, default=10, help="Segments per story (default: 10)")
+    parser.add_argument("--stories", type=int, default=100, help="Stories the run would ask for (default: 100)")
+    parser.add_argument("--budget", type=float, help="Run budget in USD")
+    parser.add_argument("--max-calls", default="", help="Per-model call caps, e.g. dall-e-3=200,tts-1=20")
+    parser.add_argument("--deadline", help="Finish by a clock time (06:30) or within a duration (90m, 2h)")
+    parser.add_argument("--log-dir", default=str(LOG_DIR), help=f"Run logs to learn from (default: {LOG_DIR})")
+    parser.add_argument("--json", action="store_true", help="Print JSON")
+    args = parser.parse_args()
+
+    try:
+        caps = parse_call_caps(args.max_calls)
+        deadline = parse_deadline(args.deadline) if args.deadline else None
+    except ValueError as e:
+        logger.error(str(e))
+        return 1
+    estimate = StoryEstimate.from_events(load_history(Path(args.log_dir)))
+    result = plan(estimate, args.segments, args.stories, args.budget, caps, deadline)
+    result["estimate"] = estimate.to_dict()
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return 0
+
+    source = f"{estimate.stories} stories in {args.log_dir}" if estimate.stories else "defaults (not enough run history)"
+    print(f"Per {args.segments}-segment story, from {source}:")
+    print(f"  cost ${result['cost']:.2f}, about {result['seconds']:.0f}s, calls: "
+          + ", ".join(f"{model} {n:g}" for model, n in sorted(result["calls"].items())))
+    if len(result["fits"]) > 1:
+        print(f"{result['admitted']} of {args.stories} stories fit (limited by {result['limited_by']}, "
+              f"with a {SAFETY_MARGIN:g}x margin)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+Story Bundle Packer and Reader
+
+Packs a story folder (segments, text, images and narration) into a single
+.bundle file so the player can open a story with one request, or with a few
+HTTP Range requests for individual assets.
+
+Bundle layout (all integers little-endian):
+
+    offset 0   magic      4 bytes   b"BSTB"
+    offset 4   version    uint16
+    offset 6   flags      uint16    (reserved, 0)
+    offset 8   header_len uint32    length of the JSON header
+    offset 12  data_start uint64    absolute offset of the payload section
+    offset 20  header     JSON (UTF-8): title, story text, segments with
+                          timings and image entry names, and the entry table
+    data_start payloads   each entry starts on a 4096-byte boundary
+
+Entry offsets in the header are relative to data_start. Because payloads are
+page-aligned, the reader can memory-map the file and hand out zero-copy
+slices, and a server can answer Range requests straight from the entry table.
+
+Usage:
+    python story_bundle.py pack [public/output] [--out public/bundles]
+    python story_bundle.py info public/bundles/the-curious-cloud.bundle
+    python story_bundle.py extract public/bundles/the-curious-cloud.bundle some/dir
+"""
+
+import sys
+import json
+import mmap
+import shutil
+import struct
+import logging
+import argparse
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from atomic_io import atomic_write, story_lock, write_bytes_atomic, write_text_atomic
+from story_segments import load_segments, write_segments
+from story_validator import find_story_dirs
+
+logger = logging.getLogger(__name__)
+
+# Constants
+OUTPUT_DIR = Path("public/output")
+BUNDLE_DIR = Path("public/bundles")
+BUNDLE_SUFFIX = ".bundle"
+MAGIC = b"BSTB"
+VERSION = 1
+ALIGNMENT = 4096
+PRELUDE = struct.Struct("<4sHHIQ")
+CONTENT_TYPES = {
+    ".png": "image/png",
+    ".jpg": "image/jpeg",
+    ".mp3": "audio/mpeg",
+}
+
+
+class BundleError(Exception):
+    """Raised when a file is not a valid story bundle."""
+
+
+def _align(offset: int) -> int:
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def _load_segments(story_dir: Path) -> Tuple[Optional[str], List[Dict]]:
+    """Return (title, segments) from story_segments.json in any schema version."""
+    data = load_segments(story_dir / "story_segments.json")
+    return data["title"], data["segments"]
+
+
+def pack_story(story_dir: Path, bundle_path: Path) -> Dict:
+    """Write story_dir into a single bundle file and return its header."""
+    story_dir = Path(story_dir)
+    title, segments = _load_segments(story_dir)
+    story_text_path = story_dir / "story.txt"
+    story_text = story_text_path.read_text() if story_text_path.exists() else None
+
+    # Payloads in playback order: images as the segments reference them, then audio
+    names = []
+    for i, segment in enumerate(segments):
+        name = segment.get("image") or f"image_{i+1}.png"
+        if name not in names and (story_dir / name).exists():
+            names.append(name)
+    if (story_dir / "story_audio.mp3").exists():
+        names.append("story_audio.mp3")
+
+    entries = []
+    offset = 0
+    for name in names:
+        size = (story_dir / name).stat().st_size
+        entries.append({
+            "name": name,
+            "type": CONTENT_TYPES.get(Path(name).suffix, "application/octet-stream"),
+            "offset": offset,
+            "length": size,
+        })
+        offset = _align(offset + size)
+
+    header = {
+        "id": story_dir.name,
+        "title": title or story_dir.name,
+        "text": story_text,
+        "segments": [
+            {
+                "text": segment.get("text", ""),
+                "start": segment.get("start"),
+                "end": segment.get("end"),
+                "image": segment.get("image") or f"image_{i+1}.png",
+            }
+            for i, segment in enumerate(segments)
+        ],
+        "entries": entries,
+    }
+    header_bytes = json.dumps(header, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    data_start = _align(PRELUDE.size + len(header_bytes))
+
+    bundle_path = Path(bundle_path)
+    bundle_path.parent.mkdir(parents=True, exist_ok=True)
+    with atomic_write(bundle_path, "wb") as out:
+        out.write(PRELUDE.pack(MAGIC, VERSION, 0, len(header_bytes), data_start))
+        out.write(header_bytes)
+        for entry in entries:
+            out.seek(data_start + entry["offset"])
+            with open(story_dir / entry["name"], "rb") as src:
+                shutil.copyfileobj(src, out, 1024 * 1024)
+    return header
+
+
+class StoryBundle:
+    """Read-only, memory-mapped view of a story bundle.
+
+    Asset payloads are returned as memoryview slices of the mapping, so
+    nothing is copied until the caller writes them somewhere.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._file = open(self.path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise BundleError(f"{self.path} is empty")
+        try:
+            if len(self._map) < PRELUDE.size:
+                raise BundleError(f"{self.path} is too short to be a story bundle")
+            magic, version, _flags, header_len, data_start = PRELUDE.unpack_from(self._map, 0)
+            if magic != MAGIC:
+                raise BundleError(f"{self.path} is not a story bundle")
+            if version > VERSION:
+                raise BundleError(f"{self.path} uses unsupported bundle version {version}")
+            self.version = version
+            self.data_start = data_start
+            self.header = json.loads(bytes(self._map[PRELUDE.size:PRELUDE.size + header_len]))
+            self.entries = {entry["name"]: entry for entry in self.header["entries"]}
+        except Exception:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self) -> None:
+        if getattr(self, "_map", None) is not None and not self._map.closed:
+            self._map.close()
+        self._file.close()
+
+    @property
+    def title(self) -> str:
+        return self.header["title"]
+
+    @property
+    def segments(self) -> List[Dict]:
+        return self.header["segments"]
+
+    def byte_range(self, name: str) -> Tuple[int, int]:
+        """Return the absolute (start, end_exclusive) byte range of an entry."""
+        entry = self.entries[name]
+        start = self.data_start + entry["offset"]
+        return start, start + entry["length"]
+
+    def read(self, name: str) -> memoryview:
+        """Return a zero-copy view of an entry's payload."""
+        start, end = self.byte_range(name)
+        return memoryview(self._map)[start:end]
+
+    def extract(self, target_dir: Path) -> None:
+        """Write the bundle back out as a regular story folder."""
+        target_dir = Path(target_dir)
+        target_dir.mkdir(parents=True, exist_ok=True)
+        with story_lock(target_dir):
+            for name in self.entries:
+                write_bytes_atomic(target_dir / name, self.read(name))
+            if self.header.get("text") is not None:
+                write_text_atomic(target_dir / "story.txt", self.header["text"])
+            write_segments(target_dir / "story_segments.json", {"title": self.title, "segments": self.segments})
+
+
+def pack_library(root: Path, bundle_dir: Path) -> int:
+    """Pack every story folder under root whose bundle is missing or stale."""
+    packed = 0
+    for story_dir in find_story_dirs(root):
+        if not (story_dir / "story_segments.json").exists():
+            continue
+        bundle_path = Path(bundle_dir) / f"{story_dir.name}{BUNDLE_SUFFIX}"
+        newest = max(p.stat().st_mtime for p in story_dir.iterdir() if p.is_file())
+        if bundle_path.exists() and bundle_path.stat().st_mtime >= newest:
+            continue
+        try:
+            pack_story(story_dir, bundle_path)
+            packed += 1
+            logger.info(f"Packed {story_dir.name} -> {bundle_path}")
+        except (OSError, ValueError) as e:
+            logger.error(f"Could not pack {story_dir.name}: {e}")
+    return packed
+
+
+def main():
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+    parser = argparse.ArgumentParser(description="Pack story folders into single-file bundles")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    pack_parser = subparsers.add_parser("pack", help="Pack stories into bundles")
+    pack_parser.add_argument("root", nargs="?", default=str(OUTPUT_DIR), help=f"Story library (default: {OUTPUT_DIR})")
+    pack_parser.add_argument("--out", default=str(BUNDLE_DIR), help=f"Bundle directory (default: {BUNDLE_DIR})")
+
+    info_parser = subparsers.add_parser("info", help="Show a bundle's header and entry table")
+    info_parser.add_argument("bundle")
+
+    extract_parser = subparsers.add_parser("extract", help="Unpack a bundle into a story folder")
+    extract_parser.add_argument("bundle")
+    extract_parser.add_argument("target")
+    args = parser.parse_args()
+
+    if args.command == "pack":
+        packed = pack_library(Path(args.root), Path(args.out))
+        print(f"Packed {packed} stories into {args.out}")
+    elif args.command == "info":
+        with StoryBundle(Path(args.bundle)) as bundle:
+            print(f"{bundle.title} (bundle v{bundle.version}, {len(bundle.segments)} segments)")
+            for name in bundle.entries:
+                start, end = bundle.byte_range(name)
+                print(f"  {name}: bytes {start}-{end - 1} ({end - start} bytes)")
+    else:
+        with StoryBundle(Path(args.bundle)) as bundle:
+            bundle.extract(Path(args.target))
+        print(f"Extracted {args.bundle} to {args.target}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
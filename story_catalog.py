@@ -0,0 +1,456 @@
+#!/usr/bin/env python3
+"""
+Story Catalog
+
+A local SQLite catalog (story_catalog.db) of the story library with indexed
+tables for stories, segments, assets and generation runs. The generators and
+repair scripts keep it up to date as they write story folders, so listing,
+searching and filtering stories is a query instead of a directory walk that
+parses every story_segments.json.
+
+Usage:
+    python story_catalog.py sync [public/output]
+    python story_catalog.py list [--status complete] [--limit 20] [--offset 0]
+    python story_catalog.py search "dragon"
+    python story_catalog.py runs
+"""
+
+import sys
+import time
+import sqlite3
+import hashlib
+import logging
+import argparse
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from atomic_io import sqlite_journal_mode
+from story_segments import load_segments
+from story_validator import NUM_IMAGES, validate_story_dir, find_story_dirs
+
+logger = logging.getLogger(__name__)
+
+# Constants
+CATALOG_DB = Path("story_catalog.db")
+OUTPUT_DIR = Path("public/output")
+HASH_CHUNK_SIZE = 1024 * 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS stories (
+    root TEXT NOT NULL,
+    slug TEXT NOT NULL,
+    title TEXT NOT NULL,
+    status TEXT NOT NULL,
+    segment_count INTEGER NOT NULL,
+    word_count INTEGER NOT NULL,
+    duration REAL,
+    cover TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (root, slug)
+);
+CREATE INDEX IF NOT EXISTS stories_title ON stories (title COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS stories_status ON stories (status, title COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS stories_updated ON stories (updated_at);
+CREATE INDEX IF NOT EXISTS stories_duration ON stories (duration);
+
+CREATE TABLE IF NOT EXISTS segments (
+    story_root TEXT NOT NULL,
+    story_slug TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    image TEXT,
+    start REAL,
+    "end" REAL,
+    PRIMARY KEY (story_root, story_slug, position),
+    FOREIGN KEY (story_root, story_slug) REFERENCES stories (root, slug) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS assets (
+    story_root TEXT NOT NULL,
+    story_slug TEXT NOT NULL,
+    name TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    sha256 TEXT,
+    mtime REAL,
+    duration REAL,
+    width INTEGER,
+    height INTEGER,
+    ok INTEGER NOT NULL,
+    placeholder INTEGER NOT NULL,
+    PRIMARY KEY (story_root, story_slug, name),
+    FOREIGN KEY (story_root, story_slug) REFERENCES stories (root, slug) ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS assets_sha256 ON assets (sha256);
+CREATE INDEX IF NOT EXISTS assets_problems ON assets (ok, placeholder, kind);
+
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    command TEXT NOT NULL,
+    started_at REAL NOT NULL,
+    finished_at REAL,
+    stories_requested INTEGER,
+    stories_completed INTEGER NOT NULL DEFAULT 0,
+    notes TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_started ON runs (started_at);
+"""
+
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS story_search USING fts5 (root UNINDEXED, slug UNINDEXED, title, body);
+"""
+
+# Catalogs from before stories were keyed on (root, slug): the same slug in
+# two libraries shared one row. Existing rows already carry their root.
+MIGRATE_ROOT_KEY = """
+ALTER TABLE stories RENAME TO stories_old;
+ALTER TABLE segments RENAME TO segments_old;
+ALTER TABLE assets RENAME TO assets_old;
+{schema}
+INSERT INTO stories (root, slug, title, status, segment_count, word_count, duration, cover, created_at, updated_at)
+    SELECT root, slug, title, status, segment_count, word_count, duration, cover, created_at, updated_at FROM stories_old;
+INSERT INTO segments (story_root, story_slug, position, text, image, start, "end")
+    SELECT stories_old.root, segments_old.story_slug, position, text, image, start, "end"
+    FROM segments_old JOIN stories_old ON stories_old.slug = segments_old.story_slug;
+INSERT INTO assets (story_root, story_slug, name, kind, size, sha256, mtime, duration, width, height, ok, placeholder)
+    SELECT stories_old.root, assets_old.story_slug, name, kind, size, sha256, mtime, assets_old.duration, width, height, ok, placeholder
+    FROM assets_old JOIN stories_old ON stories_old.slug = assets_old.story_slug;
+DROP TABLE assets_old;
+DROP TABLE segments_old;
+DROP TABLE stories_old;
+DROP TABLE IF EXISTS story_search;
+"""
+
+
+def connect(db_path: Path = CATALOG_DB) -> sqlite3.Connection:
+    """Open the catalog database, creating the schema if needed."""
+    conn = sqlite3.connect(str(db_path), timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute(f"PRAGMA journal_mode={sqlite_journal_mode()}")
+    _migrate(conn)
+    conn.execute("PRAGMA foreign_keys=ON")
+    conn.executescript(SCHEMA)
+    try:
+        conn.executescript(FTS_SCHEMA)
+    except sqlite3.OperationalError:
+        # SQLite built without FTS5: search falls back to LIKE queries
+        pass
+    else:
+        if not conn.execute("SELECT 1 FROM story_search LIMIT 1").fetchone():
+            _fill_search(conn)
+    return conn
+
+
+def _migrate(conn: sqlite3.Connection) -> None:
+    """Re-key a catalog created before stories were keyed on (root, slug)."""
+    columns = {row["name"] for row in conn.execute("PRAGMA table_info(segments)")}
+    if not columns or "story_root" in columns:
+        return
+    # The old indexes move with the renamed tables and would block the new ones
+    indexes = [row["name"] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL "
+        "AND tbl_name IN ('stories', 'segments', 'assets')"
+    )]
+    drops = "".join(f"DROP INDEX {name};\n" for name in indexes)
+    conn.executescript("BEGIN;\n" + drops + MIGRATE_ROOT_KEY.format(schema=SCHEMA) + "COMMIT;")
+    logger.info("Migrated story catalog to per-library story keys")
+
+
+def _fill_search(conn: sqlite3.Connection) -> None:
+    """Rebuild the full-text index from the stories and segments tables."""
+    with conn:
+        for story in conn.execute("SELECT root, slug, title FROM stories").fetchall():
+            texts = conn.execute(
+                "SELECT text FROM segments WHERE story_root = ? AND story_slug = ? ORDER BY position",
+                (story["root"], story["slug"]),
+            )
+            conn.execute(
+                "INSERT INTO story_search (root, slug, title, body) VALUES (?, ?, ?, ?)",
+                (story["root"], story["slug"], story["title"], " ".join(row["text"] for row in texts)),
+            )
+
+
+def _has_fts(conn: sqlite3.Connection) -> bool:
+    row = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'story_search'").fetchone()
+    return row is not None
+
+
+def file_sha256(path: Path) -> str:
+    """Hash a file in chunks without loading it into memory."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _asset_kind(name: str) -> str:
+    if name.endswith(".png"):
+        return "image"
+    if name.endswith(".mp3"):
+        return "audio"
+    return "text"
+
+
+def _load_story_data(story_dir: Path) -> Dict:
+    """Read title and segments from story_segments.json in any schema version."""
+    try:
+        data = load_segments(story_dir / "story_segments.json")
+    except (OSError, ValueError):
+        return {"title": None, "segments": []}
+    return {"title": data["title"], "segments": data["segments"]}
+
+
+def index_story(conn: sqlite3.Connection, story_dir: Path) -> Dict:
+    """Insert or refresh one story folder in the catalog.
+
+    File hashes are only recomputed when an asset's size or mtime changed
+    since it was last indexed. Returns the validation report.
+    """
+    story_dir = Path(story_dir)
+    slug = story_dir.name
+    root = str(story_dir.parent.resolve())
+    story_data = _load_story_data(story_dir)
+    segments = [s for s in story_data["segments"] if isinstance(s, dict)]
+    report = validate_story_dir(story_dir, len(segments) or NUM_IMAGES)
+    title = story_data["title"] or slug
+    word_count = sum(len(str(s.get("text", "")).split()) for s in segments)
+    audio = report["assets"]["story_audio.mp3"]
+    now = time.time()
+
+    known = {
+        row["name"]: row
+        for row in conn.execute(
+            "SELECT name, size, mtime, sha256 FROM assets WHERE story_root = ? AND story_slug = ?", (root, slug)
+        )
+    }
+
+    with conn:
+        conn.execute(
+            """
+            INSERT INTO stories (root, slug, title, status, segment_count, word_count, duration, cover, created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (root, slug) DO UPDATE SET
+                title = excluded.title, status = excluded.status,
+                segment_count = excluded.segment_count, word_count = excluded.word_count,
+                duration = excluded.duration, cover = excluded.cover, updated_at = excluded.updated_at
+            """,
+            (
+                root, slug, title,
+                "complete" if report["ok"] else "incomplete",
+                len(segments), word_count, audio.get("duration"),
+                "image_1.png" if report["assets"]["image_1.png"]["size"] else None,
+                now, now,
+            ),
+        )
+
+        conn.execute("DELETE FROM segments WHERE story_root = ? AND story_slug = ?", (root, slug))
+        conn.executemany(
+            'INSERT INTO segments (story_root, story_slug, position, text, image, start, "end") VALUES (?, ?, ?, ?, ?, ?, ?)',
+            [
+                (root, slug, i + 1, str(s.get("text", "")), s.get("image"), s.get("start"), s.get("end"))
+                for i, s in enumerate(segments)
+            ],
+        )
+
+        conn.execute("DELETE FROM assets WHERE story_root = ? AND story_slug = ?", (root, slug))
+        for name, asset in report["assets"].items():
+            path = story_dir / name
+            if not path.exists():
+                continue
+            stat = path.stat()
+            previous = known.get(name)
+            if previous is not None and previous["size"] == stat.st_size and previous["mtime"] == stat.st_mtime:
+                sha256 = previous["sha256"]
+            else:
+                sha256 = file_sha256(path)
+            conn.execute(
+                """
+                INSERT INTO assets (story_root, story_slug, name, kind, size, sha256, mtime, duration, width, height, ok, placeholder)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    root, slug, name, _asset_kind(name), stat.st_size, sha256, stat.st_mtime,
+                    asset.get("duration"), asset.get("width"), asset.get("height"),
+                    int(asset["ok"]), int(asset["placeholder"]),
+                ),
+            )
+
+        if _has_fts(conn):
+            conn.execute("DELETE FROM story_search WHERE root = ? AND slug = ?", (root, slug))
+            conn.execute(
+                "INSERT INTO story_search (root, slug, title, body) VALUES (?, ?, ?, ?)",
+                (root, slug, title, " ".join(str(s.get("text", "")) for s in segments)),
+            )
+    return report
+
+
+def remove_story(conn: sqlite3.Connection, root: str, slug: str) -> None:
+    """Drop a story of the library at root and its segments and assets from the catalog."""
+    with conn:
+        conn.execute("DELETE FROM stories WHERE root = ? AND slug = ?", (root, slug))
+        if _has_fts(conn):
+            conn.execute("DELETE FROM story_search WHERE root = ? AND slug = ?", (root, slug))
+
+
+def sync_library(conn: sqlite3.Connection, root: Path) -> Dict[str, int]:
+    """Index every story under root and drop catalog entries whose folder is gone."""
+    root = Path(root)
+    story_dirs = find_story_dirs(root)
+    for story_dir in story_dirs:
+        index_story(conn, story_dir)
+
+    present = {d.name for d in story_dirs}
+    resolved = str(root.resolve())
+    stale = [
+        row["slug"]
+        for row in conn.execute("SELECT slug FROM stories WHERE root = ?", (resolved,))
+        if row["slug"] not in present
+    ]
+    for slug in stale:
+        remove_story(conn, resolved, slug)
+    return {"indexed": len(story_dirs), "removed": len(stale)}
+
+
+def record_story(story_dir: Path, db_path: Path = CATALOG_DB) -> None:
+    """Refresh a story in the catalog after a script has written it.
+
+    Catalog errors are logged and never interrupt generation or repairs.
+    """
+    try:
+        conn = connect(db_path)
+        try:
+            index_story(conn, story_dir)
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        logger.warning(f"Could not update story catalog for {Path(story_dir).name}: {e}")
+
+
+def start_run(command: str, stories_requested: Optional[int] = None, db_path: Path = CATALOG_DB) -> Optional[int]:
+    """Record the start of a generation run and return its id."""
+    try:
+        conn = connect(db_path)
+        try:
+            with conn:
+                cursor = conn.execute(
+                    "INSERT INTO runs (command, started_at, stories_requested) VALUES (?, ?, ?)",
+                    (command, time.time(), stories_requested),
+                )
+            return cursor.lastrowid
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        logger.warning(f"Could not record run in story catalog: {e}")
+        return None
+
+
+def finish_run(run_id: Optional[int], stories_completed: int, notes: Optional[str] = None, db_path: Path = CATALOG_DB) -> None:
+    """Record the end of a generation run."""
+    if run_id is None:
+        return
+    try:
+        conn = connect(db_path)
+        try:
+            with conn:
+                conn.execute(
+                    "UPDATE runs SET finished_at = ?, stories_completed = ?, notes = ? WHERE id = ?",
+                    (time.time(), stories_completed, notes, run_id),
+                )
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        logger.warning(f"Could not record run in story catalog: {e}")
+
+
+def list_stories(conn: sqlite3.Connection, status: Optional[str] = None, limit: int = 50, offset: int = 0) -> List[sqlite3.Row]:
+    """Return a page of stories ordered by title, optionally filtered by status."""
+    if status:
+        return conn.execute(
+            "SELECT * FROM stories WHERE status = ? ORDER BY title COLLATE NOCASE LIMIT ? OFFSET ?",
+            (status, limit, offset),
+        ).fetchall()
+    return conn.execute(
+        "SELECT * FROM stories ORDER BY title COLLATE NOCASE LIMIT ? OFFSET ?",
+        (limit, offset),
+    ).fetchall()
+
+
+def search_stories(conn: sqlite3.Connection, query: str, limit: int = 50) -> List[sqlite3.Row]:
+    """Full-text search over titles and segment text."""
+    if _has_fts(conn):
+        return conn.execute(
+            """
+            SELECT stories.* FROM story_search
+            JOIN stories ON stories.root = story_search.root AND stories.slug = story_search.slug
+            WHERE story_search MATCH ? ORDER BY rank LIMIT ?
+            """,
+            ('"' + query.replace('"', '""') + '"', limit),
+        ).fetchall()
+    pattern = f"%{query}%"
+    return conn.execute(
+        """
+        SELECT DISTINCT stories.* FROM stories
+        LEFT JOIN segments ON segments.story_root = stories.root AND segments.story_slug = stories.slug
+        WHERE stories.title LIKE ? OR segments.text LIKE ?
+        ORDER BY stories.title COLLATE NOCASE LIMIT ?
+        """,
+        (pattern, pattern, limit),
+    ).fetchall()
+
+
+def _print_stories(rows: List[sqlite3.Row]) -> None:
+    for row in rows:
+        duration = f"{row['duration']:.0f}s" if row["duration"] else "no audio"
+        marker = "✓" if row["status"] == "complete" else "×"
+        print(f"{marker} {row['slug']}: {row['title']} ({row['segment_count']} segments, {duration})")
+
+
+def main():
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+    parser = argparse.ArgumentParser(description="Maintain and query the SQLite story catalog")
+    parser.add_argument("--db", default=str(CATALOG_DB), help=f"Catalog database (default: {CATALOG_DB})")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    sync_parser = subparsers.add_parser("sync", help="Index the story library")
+    sync_parser.add_argument("root", nargs="?", default=str(OUTPUT_DIR), help=f"Story library (default: {OUTPUT_DIR})")
+
+    list_parser = subparsers.add_parser("list", help="List stories")
+    list_parser.add_argument("--status", choices=["complete", "incomplete"], help="Filter by status")
+    list_parser.add_argument("--limit", type=int, default=50)
+    list_parser.add_argument("--offset", type=int, default=0)
+
+    search_parser = subparsers.add_parser("search", help="Search titles and story text")
+    search_parser.add_argument("query")
+    search_parser.add_argument("--limit", type=int, default=50)
+
+    subparsers.add_parser("runs", help="Show recent generation runs")
+    args = parser.parse_args()
+
+    conn = connect(Path(args.db))
+    try:
+        if args.command == "sync":
+            counts = sync_library(conn, Path(args.root))
+            print(f"Indexed {counts['indexed']} stories, removed {counts['removed']} stale entries")
+        elif args.command == "list":
+            _print_stories(list_stories(conn, args.status, args.limit, args.offset))
+        elif args.command == "search":
+            _print_stories(search_stories(conn, args.query, args.limit))
+        else:
+            for row in conn.execute("SELECT * FROM runs ORDER BY started_at DESC LIMIT 20"):
+                started = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(row["started_at"]))
+                finished = "running" if row["finished_at"] is None else f"{row['finished_at'] - row['started_at']:.0f}s"
+                print(f"#{row['id']} {started} {row['command']}: "
+                      f"{row['stories_completed']}/{row['stories_requested'] or '?'} stories ({finished})")
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
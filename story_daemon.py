@@ -0,0 +1,652 @@
+#!/usr/bin/env python3
+"""
+Story Generation Daemon
+
+A long-running worker service for on-demand stories. It keeps one OpenAI
+client warm and serves a small local HTTP/JSON API for submitting jobs:
+
+    POST   /jobs         {"title", "premise", "segments", "voice", "priority"}
+                         -> 202 {"id": 7, "status": "pending", ...}
+    GET    /jobs/<id>    job status, progress and the story folder when done
+    GET    /jobs         recent jobs (?status=pending|running|done|failed|cancelled)
+    DELETE /jobs/<id>    cancel a job that has not started yet
+    GET    /health       worker count, queue depth, memory use and hedging
+
+Jobs are stored in SQLite (story_jobs.db) and claimed highest priority first.
+Leave out title and premise to have the daemon take one from the idea pool
+(idea_pool.py).
+
+Workers claim a job with an expiring lease (LEASE_SECONDS) and renew it
+while they work, so several daemons or story_worker.py nodes can share one
+jobs database. A job whose lease runs out because its node died is claimed
+again by the next free worker, on any node.
+
+On SIGINT/SIGTERM the daemon stops accepting jobs. Workers checkpoint at the
+next step boundary: the story text and every finished image and narration
+stay on disk, and the job returns to the queue. After a restart the job
+resumes from its story folder and only generates the assets that are still
+missing or invalid.
+
+Usage:
+    python story_daemon.py --port 8770 --workers 2
+    curl -X POST localhost:8770/jobs -d '{"title": "The Sleepy Owl", "premise": "An owl who cannot sleep"}'
+    curl localhost:8770/jobs/1
+"""
+
+import os
+import sys
+import json
+import time
+import signal
+import socket
+import sqlite3
+import logging
+import argparse
+import threading
+from pathlib import Path
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+from atomic_io import sqlite_journal_mode, story_lock, write_text_atomic
+from idea_pool import finish_idea, seed_pool, take_idea
+from instrumentation import peak_rss_mb, recorder
+from memory_budget import DEFAULT_LIMIT_MB, budget
+from request_hedging import DEFAULT_SPEND_CAP, hedger
+from story_catalog import record_story
+from story_pages import export_listing
+from story_preflight import preflight_story
+from story_publish import publish_story, refresh_manifest
+from story_segments import load_segments, write_segments
+from story_validator import validate_image, validate_audio
+
+logger = logging.getLogger(__name__)
+
+# Constants
+JOBS_DB = Path("story_jobs.db")
+DEFAULT_PORT = 8770
+DEFAULT_WORKERS = 2
+MAX_SEGMENTS = 20
+MAX_ATTEMPTS = 3
+POLL_INTERVAL = 1.0  # seconds between queue polls when idle
+LEASE_SECONDS = 120  # a claimed job is reclaimable this long after its last heartbeat
+VOICES = ("alloy", "echo", "fable", "onyx", "nova", "shimmer")
+JOB_STATUSES = ("pending", "running", "done", "failed", "cancelled")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS story_jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    title TEXT,
+    premise TEXT,
+    segments INTEGER NOT NULL,
+    voice TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL DEFAULT 'pending',
+    progress TEXT,
+    story_dir TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    worker TEXT,
+    lease_expires REAL
+);
+CREATE INDEX IF NOT EXISTS story_jobs_queue ON story_jobs (status, priority DESC, id);
+"""
+
+# Columns added after the first release, for databases created before them
+MIGRATIONS = {
+    "worker": "ALTER TABLE story_jobs ADD COLUMN worker TEXT",
+    "lease_expires": "ALTER TABLE story_jobs ADD COLUMN lease_expires REAL",
+}
+
+
+class JobInterrupted(Exception):
+    """Raised inside a job when the daemon is shutting down."""
+
+
+class LeaseLost(Exception):
+    """Raised inside a job when its lease expired and another worker claimed it."""
+
+
+def connect(db_path: Path = JOBS_DB) -> sqlite3.Connection:
+    """Open the jobs database, creating the schema if needed."""
+    conn = sqlite3.connect(str(db_path), timeout=30, isolation_level=None, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute(f"PRAGMA journal_mode={sqlite_journal_mode()}")
+    conn.executescript(SCHEMA)
+    columns = {row["name"] for row in conn.execute("PRAGMA table_info(story_jobs)")}
+    for column, statement in MIGRATIONS.items():
+        if column not in columns:
+            conn.execute(statement)
+    return conn
+
+
+def default_node_id() -> str:
+    """Identifies this process in job leases: host name and process id."""
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def job_dict(row: sqlite3.Row) -> Dict:
+    job = dict(row)
+    if job["status"] == "pending" and job["progress"]:
+        job["resumable"] = True
+    return job
+
+
+def validate_request(payload: Dict, default_segments: int) -> Dict:
+    """Check a job submission and fill in defaults. Raises ValueError with a message for the client."""
+    if not isinstance(payload, dict):
+        raise ValueError("request body must be a JSON object")
+    title = (payload.get("title") or "").strip() or None
+    premise = (payload.get("premise") or "").strip() or None
+    if premise and not title:
+        raise ValueError("a premise needs a title")
+    segments = payload.get("segments", default_segments)
+    if not isinstance(segments, int) or not 1 <= segments <= MAX_SEGMENTS:
+        raise ValueError(f"segments must be an integer from 1 to {MAX_SEGMENTS}")
+    voice = payload.get("voice") or "nova"
+    if voice not in VOICES:
+        raise ValueError(f"voice must be one of {', '.join(VOICES)}")
+    priority = payload.get("priority", 0)
+    if not isinstance(priority, int):
+        raise ValueError("priority must be an integer")
+    return {"title": title, "premise": premise or title, "segments": segments, "voice": voice, "priority": priority}
+
+
+def submit_job(conn: sqlite3.Connection, request: Dict) -> int:
+    """Queue a validated job request and return its id."""
+    cursor = conn.execute(
+        "INSERT INTO story_jobs (title, premise, segments, voice, priority, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+        (request["title"], request["premise"], request["segments"], request["voice"], request["priority"], time.time()),
+    )
+    return cursor.lastrowid
+
+
+def get_job(conn: sqlite3.Connection, job_id: int) -> Optional[sqlite3.Row]:
+    return conn.execute("SELECT * FROM story_jobs WHERE id = ?", (job_id,)).fetchone()
+
+
+def list_jobs(conn: sqlite3.Connection, status: Optional[str] = None, limit: int = 50) -> List[sqlite3.Row]:
+    if status:
+        return conn.execute(
+            "SELECT * FROM story_jobs WHERE status = ? ORDER BY id DESC LIMIT ?", (status, limit)
+        ).fetchall()
+    return conn.execute("SELECT * FROM story_jobs ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+
+
+def cancel_job(conn: sqlite3.Connection, job_id: int) -> bool:
+    """Cancel a pending job. Running jobs are not interrupted."""
+    cursor = conn.execute(
+        "UPDATE story_jobs SET status = 'cancelled', finished_at = ? WHERE id = ? AND status = 'pending'",
+        (time.time(), job_id),
+    )
+    return cursor.rowcount > 0
+
+
+def claim_next(conn: sqlite3.Connection, worker: Optional[str] = None, lease: float = LEASE_SECONDS,
+               shortest_first: bool = False, max_segments: Optional[int] = None) -> Optional[sqlite3.Row]:
+    """Atomically take the highest-priority pending job and mark it running under worker's lease.
+
+    A running job whose lease has expired was abandoned by a dead worker and
+    is claimed like a pending one; it resumes from its checkpoint. One that
+    has already used up MAX_ATTEMPTS fails instead. With shortest_first, the
+    job with the fewest segments goes first within a priority, which
+    finishes the most stories under a budget or deadline. With max_segments,
+    only jobs with fewer segments than that are considered.
+    """
+    order = "priority DESC, segments, id" if shortest_first else "priority DESC, id"
+    size_filter = "" if max_segments is None else f"AND segments < {int(max_segments)} "
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute(
+            "UPDATE story_jobs SET status = 'failed', last_error = 'lease expired on the last attempt', "
+            "worker = NULL, lease_expires = NULL, finished_at = ? "
+            "WHERE status = 'running' AND lease_expires < ? AND attempts >= ?",
+            (now, now, MAX_ATTEMPTS),
+        )
+        job = conn.execute(
+            "SELECT * FROM story_jobs WHERE (status = 'pending' OR (status = 'running' AND lease_expires < ?)) "
+            f"{size_filter}ORDER BY {order} LIMIT 1",
+            (now,),
+        ).fetchone()
+        if job is not None:
+            if job["status"] == "running":
+                logger.warning(f"Job {job['id']}: lease of {job['worker']} expired; reclaiming")
+            conn.execute(
+                "UPDATE story_jobs SET status = 'running', attempts = attempts + 1, worker = ?, lease_expires = ?, "
+                "started_at = COALESCE(started_at, ?) WHERE id = ?",
+                (worker, now + lease, now, job["id"]),
+            )
+        conn.execute("COMMIT")
+        return job
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def update_job(conn: sqlite3.Connection, job_id: int, owner: Optional[str] = None, **fields) -> bool:
+    """Set fields on a job. With owner, only while that worker still holds the job's lease."""
+    assignments = ", ".join(f"{name} = ?" for name in fields)
+    if owner is None:
+        cursor = conn.execute(f"UPDATE story_jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+    else:
+        cursor = conn.execute(
+            f"UPDATE story_jobs SET {assignments} WHERE id = ? AND worker = ? AND status = 'running'",
+            (*fields.values(), job_id, owner),
+        )
+    return cursor.rowcount > 0
+
+
+def renew_lease(conn: sqlite3.Connection, job_id: int, worker: str, lease: float = LEASE_SECONDS) -> bool:
+    """Extend worker's lease on a job. False if the job is no longer worker's."""
+    return update_job(conn, job_id, owner=worker, lease_expires=time.time() + lease)
+
+
+def _holder_gone(worker: Optional[str], node: Optional[str]) -> bool:
+    """True if worker belongs to node, or to a process on this host that is no longer running."""
+    holder = (worker or "").rsplit("/", 1)[0]
+    if node and holder == node:
+        return True
+    host, _, pid = holder.rpartition("-")
+    if host != socket.gethostname() or not pid.isdigit():
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except OSError:
+        pass  # exists, but belongs to another user
+    return False
+
+
+def reset_running(conn: sqlite3.Connection, node: Optional[str] = None) -> int:
+    """Return jobs left running by crashed workers to the queue, keeping their checkpoints.
+
+    A job is requeued if it has no lease, its lease has expired, or it was
+    held by node itself (a restart with the same --node-id) or by a process
+    on this host that has exited. Jobs under another live node's lease are
+    left alone.
+    """
+    now = time.time()
+    rows = conn.execute("SELECT id, worker, lease_expires FROM story_jobs WHERE status = 'running'").fetchall()
+    requeued = 0
+    for row in rows:
+        if row["lease_expires"] is None or row["lease_expires"] < now or _holder_gone(row["worker"], node):
+            requeued += conn.execute(
+                "UPDATE story_jobs SET status = 'pending', worker = NULL, lease_expires = NULL "
+                "WHERE id = ? AND status = 'running' AND worker IS ?",
+                (row["id"], row["worker"]),
+            ).rowcount
+    return requeued
+
+
+def queue_depth(conn: sqlite3.Connection) -> Dict[str, int]:
+    rows = conn.execute("SELECT status, COUNT(*) AS n FROM story_jobs GROUP BY status").fetchall()
+    return {row["status"]: row["n"] for row in rows}
+
+
+def run_story_job(generator, conn: sqlite3.Connection, job: sqlite3.Row, stop: threading.Event,
+                  worker: Optional[str] = None) -> Path:
+    """Generate (or resume) one story, checking for shutdown between steps.
+
+    Returns the story folder. Raises JobInterrupted at a step boundary when
+    the daemon is stopping, and LeaseLost if another worker has taken the
+    job over; everything finished so far stays on disk.
+    """
+    def save(**fields) -> None:
+        if not update_job(conn, job["id"], owner=worker, **fields) and worker is not None:
+            raise LeaseLost(f"job {job['id']} is no longer held by {worker}")
+
+    def checkpoint(progress: str) -> None:
+        save(progress=progress)
+        if stop.is_set():
+            raise JobInterrupted(progress)
+
+    story_dir = Path(job["story_dir"]) if job["story_dir"] else None
+    if story_dir is not None and (story_dir / "story_segments.json").exists():
+        # Resume: the story text was written before the checkpoint
+        story_data = load_segments(story_dir / "story_segments.json")
+        logger.info(f"Job {job['id']}: resuming '{story_data['title']}' from {story_dir}")
+    else:
+        title, premise = job["title"], job["premise"]
+        idea_id = None
+        if not title:
+            # Drawn from the de-duplicated pool so the daemon never repeats a story we already have
+            idea = take_idea(generator.generate_story_ideas)
+            if idea is None:
+                raise RuntimeError("the idea pool has no new ideas left")
+            idea_id, title, premise = idea
+            save(title=title, premise=premise)
+        story_data = preflight_story(generator.generate_story_with_segments, title, premise, job["segments"])
+        if story_data is None:
+            raise RuntimeError("story text failed the pre-flight checks")
+        story_dir = generator.create_output_directory(story_data["title"])
+        if idea_id is not None:
+            finish_idea(idea_id, story_dir)
+        full_story = story_data["title"] + "\n\n" + "\n\n".join(segment["text"] for segment in story_data["segments"])
+        with story_lock(story_dir):
+            write_text_atomic(story_dir / "story.txt", full_story)
+            write_segments(story_dir / "story_segments.json", generator.prepare_story_segments_json(story_data))
+        save(story_dir=str(story_dir.resolve()))
+    segments = story_data["segments"]
+    checkpoint(f"text 1/1, images 0/{len(segments)}")
+
+    for i, segment in enumerate(segments):
+        image_path = story_dir / f"image_{i+1}.png"
+        with story_lock(story_dir):
+            if not validate_image(image_path)["ok"]:
+                generator.generate_image_for_segment(story_data["title"], segment["text"], i + 1, image_path)
+        # On-demand stories are published as soon as the first picture is ready
+        if i == 0:
+            publish_story(story_dir)
+        else:
+            refresh_manifest(story_dir)
+        checkpoint(f"text 1/1, images {i+1}/{len(segments)}")
+
+    audio_path = story_dir / "story_audio.mp3"
+    with story_lock(story_dir):
+        if not validate_audio(audio_path)["ok"]:
+            generator.generate_audio((story_dir / "story.txt").read_text(), audio_path, job["voice"])
+    record_story(story_dir)
+    publish_story(story_dir, refresh_listing=False)
+    save(progress=f"text 1/1, images {len(segments)}/{len(segments)}, audio 1/1")
+    return story_dir
+
+
+class StoryDaemon:
+    """Owns the job database, the worker threads and the HTTP API server."""
+
+    def __init__(self, db_path: Path = JOBS_DB, workers: int = DEFAULT_WORKERS, default_segments: int = 10,
+                 node_id: Optional[str] = None, lease: float = LEASE_SECONDS, scheduler=None):
+        self.db_path = Path(db_path)
+        self.workers = workers
+        self.default_segments = default_segments
+        self.node_id = node_id or default_node_id()
+        self.lease = lease
+        self.scheduler = scheduler  # a run_budget.RunScheduler, or None for no run limits
+        self.stop = threading.Event()
+        self.closed = threading.Event()  # set once the scheduler fits no job that is left: no more claims
+        self.threads: List[threading.Thread] = []
+        self.busy = 0
+        self.held: Dict[str, int] = {}  # worker -> id of the job it holds a lease on
+        self.fits_below: Optional[int] = None  # segments of the smallest job the scheduler refused
+        self.busy_lock = threading.Lock()
+        self.db_lock = threading.Lock()
+        self.conn = connect(self.db_path)
+        recovered = reset_running(self.conn, self.node_id)
+        if recovered:
+            logger.info(f"Requeued {recovered} jobs left running by a previous daemon")
+
+    def start_workers(self) -> None:
+        # Imported once here: the generator builds its OpenAI client at import time
+        import bedtime_story_generator as generator
+
+        self.generator = generator
+        # Once per start: jobs drawing from the pool then skip re-indexing the library
+        try:
+            seeded = seed_pool()
+            if seeded:
+                logger.info(f"Indexed {seeded} library stories in the idea pool")
+        except sqlite3.Error as e:
+            logger.warning(f"Could not index the library in the idea pool: {e}")
+        for n in range(self.workers):
+            worker = f"{self.node_id}/{n+1}"
+            thread = threading.Thread(target=self._worker_loop, args=(worker,), name=f"story-worker-{n+1}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        heartbeat = threading.Thread(target=self._heartbeat_loop, name="lease-heartbeat", daemon=True)
+        heartbeat.start()
+        self.threads.append(heartbeat)
+        logger.info(f"Started {self.workers} story workers on node {self.node_id}")
+
+    def _worker_loop(self, worker: str) -> None:
+        conn = connect(self.db_path)
+        try:
+            while not self.stop.is_set() and not self.closed.is_set():
+                with self.busy_lock:
+                    fits_below = self.fits_below
+                job = claim_next(conn, worker, self.lease, shortest_first=self.scheduler is not None,
+                                 max_segments=fits_below)
+                if job is None:
+                    if fits_below is not None:
+                        # Every job left is at least as large as one the budget already refused
+                        if not self.closed.is_set():
+                            logger.info(f"Not starting more jobs: no pending job has fewer than {fits_below} segments")
+                        self.closed.set()
+                        break
+                    self.stop.wait(POLL_INTERVAL)
+                    continue
+                ticket = None
+                if self.scheduler is not None:
+                    ticket, reason = self.scheduler.admit(job["segments"])
+                    if ticket is None:
+                        # Jobs are claimed by priority first, so a smaller, lower-priority job may still fit
+                        update_job(conn, job["id"], owner=worker, status="pending", attempts=job["attempts"],
+                                   worker=None, lease_expires=None)
+                        logger.info(f"Job {job['id']} ({job['segments']} segments) does not fit: {reason}")
+                        with self.busy_lock:
+                            if self.fits_below is None or job["segments"] < self.fits_below:
+                                self.fits_below = job["segments"]
+                        continue
+                with self.busy_lock:
+                    self.busy += 1
+                    self.held[worker] = job["id"]
+                try:
+                    self._run_job(conn, job, worker)
+                finally:
+                    if self.scheduler is not None:
+                        self.scheduler.release(ticket)
+                    with self.busy_lock:
+                        self.busy -= 1
+                        self.held.pop(worker, None)
+        finally:
+            conn.close()
+
+    def _heartbeat_loop(self) -> None:
+        """Renew the lease on every held job several times per lease period, until the workers are done."""
+        conn = connect(self.db_path)
+        next_renewal = time.monotonic() + self.lease / 4
+        try:
+            while True:
+                with self.busy_lock:
+                    held = list(self.held.items())
+                if self.stop.is_set() and not held:
+                    return
+                if time.monotonic() >= next_renewal:
+                    next_renewal = time.monotonic() + self.lease / 4
+                    for worker, job_id in held:
+                        if not renew_lease(conn, job_id, worker, self.lease):
+                            logger.warning(f"Job {job_id}: {worker} lost its lease")
+                time.sleep(min(POLL_INTERVAL, self.lease / 4))
+        finally:
+            conn.close()
+
+    def _run_job(self, conn: sqlite3.Connection, job: sqlite3.Row, worker: str) -> None:
+        logger.info(f"Job {job['id']}: {worker} starting '{job['title'] or '(new idea)'}' (priority {job['priority']})")
+        released = {"worker": None, "lease_expires": None}
+        try:
+            with recorder.stage("story", job=job["id"], segments=job["segments"]):
+                story_dir = run_story_job(self.generator, conn, job, self.stop, worker)
+        except JobInterrupted as e:
+            update_job(conn, job["id"], owner=worker, status="pending", attempts=job["attempts"], **released)
+            logger.info(f"Job {job['id']}: checkpointed at {e} for the next start")
+            return
+        except LeaseLost as e:
+            logger.warning(f"Job {job['id']}: abandoned, {e}")
+            return
+        except Exception as e:
+            status = "failed" if job["attempts"] + 1 >= MAX_ATTEMPTS else "pending"
+            update_job(conn, job["id"], owner=worker, status=status, last_error=str(e), **released)
+            logger.error(f"Job {job['id']} ({status}): {e}")
+            return
+        if not update_job(conn, job["id"], owner=worker, status="done", last_error=None,
+                          finished_at=time.time(), **released):
+            logger.warning(f"Job {job['id']}: finished after {worker} lost its lease")
+            return
+        logger.info(f"Job {job['id']}: ✓ saved to {story_dir}")
+        export_listing()
+
+    def health(self) -> Dict:
+        with self.db_lock:
+            depth = queue_depth(self.conn)
+        with self.busy_lock:
+            busy = self.busy
+        return {"node": self.node_id, "workers": self.workers, "busy": busy, "stopping": self.stop.is_set(), "jobs": depth,
+                "memory": dict(budget.stats(), peak_rss_mb=round(peak_rss_mb(), 1)), "hedging": hedger.stats()}
+
+    def shutdown(self, timeout: Optional[float] = None) -> None:
+        """Stop claiming jobs and wait for workers to reach a checkpoint."""
+        self.stop.set()
+        for thread in self.threads:
+            thread.join(timeout)
+        self.conn.close()
+
+
+class DaemonHandler(BaseHTTPRequestHandler):
+    server_version = "StoryDaemon/1.0"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        logger.debug("api: " + format % args)
+
+    def _send_json(self, status: int, payload) -> None:
+        body = json.dumps(payload, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _job_id(self) -> Optional[int]:
+        parts = self.path.split("?", 1)[0].strip("/").split("/")
+        if len(parts) == 2 and parts[0] == "jobs" and parts[1].isdigit():
+            return int(parts[1])
+        return None
+
+    def do_GET(self):
+        daemon = self.server.story_daemon
+        path, _, query = self.path.partition("?")
+        if path.rstrip("/") == "/health":
+            self._send_json(200, daemon.health())
+        elif path.rstrip("/") == "/jobs":
+            params = dict(part.split("=", 1) for part in query.split("&") if "=" in part)
+            status = params.get("status")
+            if status and status not in JOB_STATUSES:
+                self._send_json(400, {"error": f"status must be one of {', '.join(JOB_STATUSES)}"})
+                return
+            with daemon.db_lock:
+                jobs = [job_dict(row) for row in list_jobs(daemon.conn, status)]
+            self._send_json(200, {"jobs": jobs})
+        elif self._job_id() is not None:
+            with daemon.db_lock:
+                row = get_job(daemon.conn, self._job_id())
+            if row is None:
+                self._send_json(404, {"error": "job not found"})
+            else:
+                self._send_json(200, job_dict(row))
+        else:
+            self._send_json(404, {"error": f"unknown path {path}"})
+
+    def do_POST(self):
+        daemon = self.server.story_daemon
+        if self.path.split("?", 1)[0].rstrip("/") != "/jobs":
+            self._send_json(404, {"error": f"unknown path {self.path}"})
+            return
+        if daemon.stop.is_set():
+            self._send_json(503, {"error": "daemon is shutting down"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            request = validate_request(json.loads(self.rfile.read(length) or b"{}"), daemon.default_segments)
+        except ValueError as e:
+            self._send_json(400, {"error": str(e)})
+            return
+        with daemon.db_lock:
+            job_id = submit_job(daemon.conn, request)
+            row = get_job(daemon.conn, job_id)
+        logger.info(f"Job {job_id}: queued '{request['title'] or '(new idea)'}'")
+        self._send_json(202, job_dict(row))
+
+    def do_DELETE(self):
+        daemon = self.server.story_daemon
+        job_id = self._job_id()
+        if job_id is None:
+            self._send_json(404, {"error": f"unknown path {self.path}"})
+            return
+        with daemon.db_lock:
+            cancelled = cancel_job(daemon.conn, job_id)
+            row = get_job(daemon.conn, job_id)
+        if row is None:
+            self._send_json(404, {"error": "job not found"})
+        elif not cancelled:
+            self._send_json(409, {"error": f"job is {row['status']} and cannot be cancelled", "job": job_dict(row)})
+        else:
+            self._send_json(200, job_dict(row))
+
+
+class DaemonServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, daemon: StoryDaemon, host: str = "127.0.0.1", port: int = DEFAULT_PORT):
+        super().__init__((host, port), DaemonHandler)
+        self.story_daemon = daemon
+
+
+def main():
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+    parser = argparse.ArgumentParser(description="Run the story generation daemon with a local job API")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"API port (default: {DEFAULT_PORT})")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help=f"Concurrent story workers (default: {DEFAULT_WORKERS})")
+    parser.add_argument("--segments", type=int, default=10, help="Default segments per story (default: 10)")
+    parser.add_argument("--db", default=str(JOBS_DB), help=f"Jobs database (default: {JOBS_DB})")
+    parser.add_argument("--node-id", help="Name of this daemon in job leases (default: host name and process id)")
+    parser.add_argument("--lease", type=float, default=LEASE_SECONDS,
+                        help=f"Seconds before an unrenewed job can be reclaimed (default: {LEASE_SECONDS})")
+    parser.add_argument("--metrics-port", type=int, help="Serve Prometheus metrics on this port")
+    parser.add_argument("--memory-budget", type=int, default=DEFAULT_LIMIT_MB,
+                        help=f"MB of payloads all workers may hold in memory at once (default: {DEFAULT_LIMIT_MB})")
+    parser.add_argument("--hedge-percentile", type=float,
+                        help="Duplicate image and TTS requests still running past this percentile of recent latencies")
+    parser.add_argument("--hedge-spend", type=float, default=DEFAULT_SPEND_CAP,
+                        help=f"USD cap on duplicate requests while the daemon runs (default: {DEFAULT_SPEND_CAP})")
+    args = parser.parse_args()
+
+    budget.configure(args.memory_budget * 1024 * 1024)
+    hedger.configure(args.hedge_percentile, args.hedge_spend)
+
+    daemon = StoryDaemon(Path(args.db), args.workers, args.segments, args.node_id, args.lease)
+    daemon.start_workers()
+    if args.metrics_port:
+        from metrics import start_metrics_server
+        start_metrics_server(args.metrics_port, jobs_db=Path(args.db))
+
+    server = DaemonServer(daemon, args.host, args.port)
+    api_thread = threading.Thread(target=server.serve_forever, daemon=True)
+    api_thread.start()
+    logger.info(f"Accepting story jobs on http://{args.host}:{server.server_address[1]}/jobs")
+
+    def request_shutdown(signum, frame):
+        logger.info("Shutting down: finishing in-flight steps and checkpointing jobs...")
+        daemon.stop.set()
+
+    signal.signal(signal.SIGINT, request_shutdown)
+    signal.signal(signal.SIGTERM, request_shutdown)
+    while not daemon.stop.is_set():
+        daemon.stop.wait(1)
+
+    server.shutdown()
+    server.server_close()
+    daemon.shutdown()
+    logger.info("Daemon stopped")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+"""
+Incremental Library Deploys
+
+Publishes the story library to a deploy target by content hash, instead of
+pushing every image and narration file through git. A deploy:
+
+1. Hashes every file under the library (SHA-256). Hashes are cached in
+   <library>/.deploy_hashes.json by size and mtime, so unchanged files are
+   not read again.
+2. Reads the manifest last published to the target and diffs the two.
+3. Uploads only new and changed files, in parallel.
+4. Swaps the target's deploy_manifest.json in one atomic write, then deletes
+   the files that are gone from the library.
+
+Publishing one new story therefore transfers only that story's bytes.
+Dot-files (.lock, .*.tmp, .audio_segments/ and the hash cache) and
+"_"-prefixed folders are never published. The manifest looks like:
+
+    {
+      "version": 1,
+      "published": 1700000000.0,
+      "files": {
+        "the-sleepy-owl/image_1.png": {"sha256": "9f2c...", "size": 1534210},
+        ...
+      }
+    }
+
+Targets are pluggable. A plain path is a local directory, for example a
+mounted web root. s3://bucket/prefix is any S3-compatible store; it needs
+boto3, and --endpoint-url selects a non-AWS service. s3stub://dir is an
+S3-compatible stand-in that keeps its objects under dir, for trying deploys
+without a bucket.
+
+Usage:
+    python story_deploy.py /srv/www/output                  # deploy public/output
+    python story_deploy.py s3://stories/output --workers 16
+    python story_deploy.py s3stub:///tmp/bucket --dry-run    # show what would be uploaded
+    python story_deploy.py /srv/www/output --full            # ignore the remote manifest
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import logging
+import argparse
+import mimetypes
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from atomic_io import atomic_path, file_lock, write_json_atomic
+
+logger = logging.getLogger(__name__)
+
+# Constants
+OUTPUT_DIR = Path("public/output")
+MANIFEST_NAME = "deploy_manifest.json"
+MANIFEST_VERSION = 1
+HASH_CACHE_NAME = ".deploy_hashes.json"
+DEPLOY_LOCK_NAME = ".deploy.lock"
+DEFAULT_WORKERS = 8
+HASH_CHUNK_SIZE = 1024 * 1024  # bytes per read while hashing
+
+
+class DeployError(RuntimeError):
+    """Raised when a target cannot be read or written."""
+
+
+def library_files(root: Path) -> List[str]:
+    """Return the publishable files under root as sorted POSIX paths relative to root."""
+    root = Path(root)
+    files = []
+    for directory, dirnames, filenames in os.walk(root):
+        # Prune in place so hidden and staging folders are never walked
+        dirnames[:] = [d for d in dirnames if not d.startswith((".", "_"))]
+        for name in filenames:
+            if name.startswith(".") or name == MANIFEST_NAME:
+                continue
+            files.append((Path(directory) / name).relative_to(root).as_posix())
+    return sorted(files)
+
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def build_manifest(root: Path, workers: int = DEFAULT_WORKERS) -> Dict:
+    """Hash the library into a manifest, reusing cached hashes of unchanged files."""
+    root = Path(root)
+    cache_path = root / HASH_CACHE_NAME
+    try:
+        with open(cache_path, "r") as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        cache = {}
+
+    def entry(relpath: str) -> Dict:
+        stat = (root / relpath).stat()
+        cached = cache.get(relpath)
+        if cached and cached["size"] == stat.st_size and cached["mtime_ns"] == stat.st_mtime_ns:
+            sha256 = cached["sha256"]
+        else:
+            sha256 = file_sha256(root / relpath)
+        return {"sha256": sha256, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+    relpaths = library_files(root)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        entries = dict(zip(relpaths, pool.map(entry, relpaths)))
+
+    write_json_atomic(cache_path, entries, indent=None)
+    files = {relpath: {"sha256": e["sha256"], "size": e["size"]} for relpath, e in entries.items()}
+    return {"version": MANIFEST_VERSION, "files": files}
+
+
+def diff_manifests(local: Dict, remote: Optional[Dict]) -> Dict[str, List[str]]:
+    """Return {"upload", "delete", "unchanged"} lists of relative paths."""
+    remote_files = (remote or {}).get("files", {})
+    local_files = local["files"]
+    upload, unchanged = [], []
+    for relpath, entry in local_files.items():
+        if remote_files.get(relpath, {}).get("sha256") == entry["sha256"]:
+            unchanged.append(relpath)
+        else:
+            upload.append(relpath)
+    delete = sorted(p for p in remote_files if p not in local_files)
+    return {"upload": upload, "delete": delete, "unchanged": unchanged}
+
+
+class LocalTarget:
+    """Deploys into a directory, for example a web server's document root."""
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+
+    def __str__(self) -> str:
+        return str(self.root)
+
+    def read_manifest(self) -> Optional[Dict]:
+        try:
+            with open(self.root / MANIFEST_NAME, "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            raise DeployError(f"Could not read {MANIFEST_NAME} from {self.root}: {e}")
+
+    def upload(self, source: Path, relpath: str) -> None:
+        destination = self.root / relpath
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        # Each file appears whole, so a reader never sees a half-copied image
+        with atomic_path(destination) as tmp_path:
+            shutil.copyfile(source, tmp_path)
+
+    def write_manifest(self, manifest: Dict) -> None:
+        self.root.mkdir(parents=True, exist_ok=True)
+        write_json_atomic(self.root / MANIFEST_NAME, manifest)
+
+    def delete(self, relpath: str) -> None:
+        path = self.root / relpath
+        path.unlink(missing_ok=True)
+        # Remove folders the deleted story leaves empty
+        for parent in path.parents:
+            if parent == self.root or any(parent.iterdir()):
+                break
+            parent.rmdir()
+
+
+class S3Target:
+    """Deploys into an S3-compatible bucket under a key prefix.
+
+    client is anything with boto3's put_object, get_object, upload_file and
+    delete_object methods.
+    """
+
+    def __init__(self, client, bucket: str, prefix: str = ""):
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix.strip("/") + "/" if prefix.strip("/") else ""
+
+    def __str__(self) -> str:
+        return f"s3://{self.bucket}/{self.prefix}"
+
+    def read_manifest(self) -> Optional[Dict]:
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=self.prefix + MANIFEST_NAME)
+        except Exception as e:
+            code = getattr(e, "response", {}).get("Error", {}).get("Code")
+            if code in ("NoSuchKey", "404"):
+                return None
+            raise DeployError(f"Could not read {MANIFEST_NAME} from {self}: {e}")
+        return json.loads(response["Body"].read())
+
+    def upload(self, source: Path, relpath: str) -> None:
+        content_type = mimetypes.guess_type(relpath)[0] or "application/octet-stream"
+        # upload_file streams from disk (multipart for large files)
+        self.client.upload_file(str(source), self.bucket, self.prefix + relpath,
+                                ExtraArgs={"ContentType": content_type})
+
+    def write_manifest(self, manifest: Dict) -> None:
+        # A single PUT replaces the object atomically
+        self.client.put_object(Bucket=self.bucket, Key=self.prefix + MANIFEST_NAME,
+                               Body=json.dumps(manifest, indent=2).encode("utf-8"),
+                               ContentType="application/json")
+
+    def delete(self, relpath: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=self.prefix + relpath)
+
+
+class _StubNoSuchKey(Exception):
+    response = {"Error": {"Code": "NoSuchKey"}}
+
+
+class StubS3Client:
+    """The slice of the boto3 S3 client that S3Target uses, backed by a local directory.
+
+    Objects live at <root>/<bucket>/<key>, so a stub bucket outlives the
+    process and successive deploys diff against each other like a real one.
+    """
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+
+    def _path(self, bucket: str, key: str) -> Path:
+        return self.root / bucket / key
+
+    def get_object(self, Bucket: str, Key: str) -> Dict:
+        path = self._path(Bucket, Key)
+        if not path.is_file():
+            raise _StubNoSuchKey(Key)
+        return {"Body": io.BytesIO(path.read_bytes()), "ContentLength": path.stat().st_size}
+
+    def put_object(self, Bucket: str, Key: str, Body: bytes, **kwargs) -> None:
+        path = self._path(Bucket, Key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with atomic_path(path) as tmp_path:
+            tmp_path.write_bytes(Body)
+
+    def upload_file(self, Filename: str, Bucket: str, Key: str, ExtraArgs: Optional[Dict] = None) -> None:
+        path = self._path(Bucket, Key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with atomic_path(path) as tmp_path:
+            shutil.copyfile(Filename, tmp_path)
+
+    def delete_object(self, Bucket: str, Key: str) -> None:
+        self._path(Bucket, Key).unlink(missing_ok=True)
+
+
+def open_target(spec: str, endpoint_url: Optional[str] = None):
+    """Return the target for a path, s3://bucket/prefix or s3stub://dir."""
+    if spec.startswith("s3://"):
+        # Imported lazily: boto3 is only needed for S3 deploys
+        try:
+            import boto3
+        except ImportError:
+            raise DeployError("S3 targets need boto3 (pip install boto3)")
+        bucket, _, prefix = spec[len("s3://"):].partition("/")
+        client = boto3.client("s3", endpoint_url=endpoint_url or os.getenv("AWS_ENDPOINT_URL"))
+        return S3Target(client, bucket, prefix)
+    if spec.startswith("s3stub://"):
+        return S3Target(StubS3Client(Path(spec[len("s3stub://"):])), "stories")
+    return LocalTarget(Path(spec))
+
+
+def deploy_library(root: Path, target, workers: int = DEFAULT_WORKERS, full: bool = False,
+                   dry_run: bool = False, delete: bool = True) -> Dict:
+    """Publish the changed files under root to target. Returns the deploy stats."""
+    root = Path(root)
+    started = time.perf_counter()
+    # One deploy per library at a time: two would race on the manifest swap
+    with file_lock(root / DEPLOY_LOCK_NAME):
+        local = build_manifest(root, workers)
+        remote = None if full else target.read_manifest()
+        changes = diff_manifests(local, remote)
+        upload_bytes = sum(local["files"][p]["size"] for p in changes["upload"])
+        stats = {
+            "files": len(local["files"]),
+            "uploaded": len(changes["upload"]),
+            "uploaded_bytes": upload_bytes,
+            "deleted": len(changes["delete"]) if delete else 0,
+            "unchanged": len(changes["unchanged"]),
+            "library_bytes": sum(e["size"] for e in local["files"].values()),
+        }
+        if dry_run:
+            for relpath in changes["upload"]:
+                print(f"upload  {relpath}")
+            for relpath in changes["delete"] if delete else []:
+                print(f"delete  {relpath}")
+            return stats
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            # list() re-raises the first failed upload before the manifest is touched
+            list(pool.map(lambda relpath: target.upload(root / relpath, relpath), changes["upload"]))
+
+        local["published"] = round(time.time(), 3)
+        target.write_manifest(local)
+
+        # Removed files go only after the new manifest is live
+        if delete:
+            for relpath in changes["delete"]:
+                try:
+                    target.delete(relpath)
+                except Exception as e:
+                    logger.warning(f"Could not delete {relpath} from {target}: {e}")
+    stats["seconds"] = round(time.perf_counter() - started, 3)
+    return stats
+
+
+def main():
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+    parser = argparse.ArgumentParser(description="Upload only the changed files of the story library to a deploy target")
+    parser.add_argument("target", help="Local directory, s3://bucket/prefix or s3stub://dir")
+    parser.add_argument("--root", default=str(OUTPUT_DIR), help=f"Story library (default: {OUTPUT_DIR})")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help=f"Parallel uploads (default: {DEFAULT_WORKERS})")
+    parser.add_argument("--endpoint-url", help="S3-compatible endpoint (default: AWS_ENDPOINT_URL or AWS)")
+    parser.add_argument("--full", action="store_true", help="Ignore the published manifest and upload everything")
+    parser.add_argument("--keep-deleted", action="store_true", help="Leave files removed from the library on the target")
+    parser.add_argument("--dry-run", action="store_true", help="List the uploads and deletions without making them")
+    args = parser.parse_args()
+
+    root = Path(args.root)
+    if not root.is_dir():
+        logger.error(f"Library {root} does not exist")
+        return 1
+    try:
+        target = open_target(args.target, args.endpoint_url)
+        stats = deploy_library(root, target, workers=args.workers, full=args.full,
+                               dry_run=args.dry_run, delete=not args.keep_deleted)
+    except DeployError as e:
+        logger.error(str(e))
+        return 1
+
+    verb = "Would upload" if args.dry_run else "Uploaded"
+    print(f"{verb} {stats['uploaded']}/{stats['files']} files "
+          f"({stats['uploaded_bytes'] / 1e6:.1f} of {stats['library_bytes'] / 1e6:.1f} MB), "
+          f"{stats['deleted']} deleted, {stats['unchanged']} unchanged")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,12 +5,17 @@ import random
 from pathlib import Path
 from dotenv import load_dotenv
 from openai import OpenAI
-import requests
 from PIL import Image
-import io
 import re
 import base64
 
+from atomic_io import atomic_path, story_lock, write_text_atomic
+from memory_budget import CHUNK_SIZE, budget, download_to_file
+from story_catalog import record_story
+from story_preflight import preflight_story
+from story_segments import write_segments
+from story_slugs import allocate_story_dir
+
 # Load environment variables
 load_dotenv()
 
@@ -25,17 +30,12 @@ OUTPUT_DIR = Path("output")
 NUM_STORIES = 10
 NUM_SEGMENTS = 10
 SEGMENT_DURATION = 5  # seconds per segment
+IMAGE_MEMORY_BYTES = 1024 * 1024 * 4  # one decoded 1024x1024 RGBA image
 
 def create_output_directory(story_title):
-    """Create output directory for a story with a safe name."""
-    # Create safe folder name (slugify)
-    safe_title = re.sub(r'[^\w\s-]', '', story_title.lower())
-    safe_title = re.sub(r'[\s]+', '-', safe_title)
-    
-    # Create directory
-    story_dir = OUTPUT_DIR / safe_title
-    story_dir.mkdir(parents=True, exist_ok=True)
-    return story_dir
+    """Reserve a new output directory for a story with a safe, unique name."""
+    # Same slugs as bedtime_story_generator.py; collisions get a suffix
+    return allocate_story_dir(story_title, OUTPUT_DIR)
 
 def generate_story_ideas(num_ideas=10):
     """Generate unique bedtime story ideas using GPT-4."""
@@ -139,10 +139,15 @@ def generate_image_for_segment(story_title, segment_text, index, output_path, re
             
             image_url = response.data[0].url
             
-            # Download and save the image
-            image_response = requests.get(image_url)
-            image = Image.open(io.BytesIO(image_response.content))
-            image.save(output_path)
+            # Stream the download to disk and convert it to PNG only if needed
+            with budget.reserve(IMAGE_MEMORY_BYTES, stage="image"), atomic_path(output_path) as tmp_path:
+                download_to_file(image_url, tmp_path)
+                with Image.open(tmp_path) as image:
+                    if image.format == "PNG":
+                        image.verify()
+                    else:
+                        image.load()
+                        image.save(tmp_path, "PNG")
             
             # Sleep briefly to avoid rate limits
             time.sleep(1)
@@ -162,13 +167,13 @@ def generate_audio(story_text, output_path, retries=2):
     for attempt in range(retries + 1):
         try:
             print("Generating audio narration...")
-            response = client.audio.speech.create(
+            with client.audio.speech.with_streaming_response.create(
                 model="tts-1",
                 voice="nova",  # A soothing voice good for bedtime stories
                 input=story_text
-            )
-            
-            response.stream_to_file(output_path)
+            ) as response:
+                with atomic_path(output_path) as tmp_path:
+                    response.stream_to_file(tmp_path, chunk_size=CHUNK_SIZE)
             return True
             
         except Exception as e:
@@ -203,41 +208,43 @@ def main():
     for i, (title, premise) in enumerate(story_ideas):
         print(f"\n[{i+1}/{NUM_STORIES}] Processing story: '{title}'")
         
-        # Generate story with segments
-        story_data = generate_story_with_segments(title, premise, NUM_SEGMENTS)
+        # Generate story with segments, checked before any image or audio is paid for
+        story_data = preflight_story(generate_story_with_segments, title, premise, NUM_SEGMENTS)
+        if story_data is None:
+            continue
         
         # Create output directory for this story
         story_dir = create_output_directory(story_data["title"])
         
-        # Create the full story text
-        full_story = story_data["title"] + "\n\n"
-        full_story += "\n\n".join([segment["text"] for segment in story_data["segments"]])
+        with story_lock(story_dir):
+            # Create the full story text
+            full_story = story_data["title"] + "\n\n"
+            full_story += "\n\n".join([segment["text"] for segment in story_data["segments"]])
         
-        # Save the full story as text
-        with open(story_dir / "story.txt", "w") as f:
-            f.write(full_story)
+            # Save the full story as text
+            write_text_atomic(story_dir / "story.txt", full_story)
         
-        # Prepare and save story_segments.json
-        segments_data = prepare_story_segments_json(story_data)
-        with open(story_dir / "story_segments.json", "w") as f:
-            json.dump(segments_data, f, indent=2)
+            # Prepare and save story_segments.json
+            segments_data = prepare_story_segments_json(story_data)
+            write_segments(story_dir / "story_segments.json", segments_data)
         
-        # Generate images for each segment
-        for j, segment in enumerate(story_data["segments"]):
-            image_path = story_dir / f"image_{j+1}.png"
-            success = generate_image_for_segment(
-                story_data["title"], 
-                segment["text"], 
-                j+1, 
-                image_path
-            )
+            # Generate images for each segment
+            for j, segment in enumerate(story_data["segments"]):
+                image_path = story_dir / f"image_{j+1}.png"
+                success = generate_image_for_segment(
+                    story_data["title"], 
+                    segment["text"], 
+                    j+1, 
+                    image_path
+                )
             
-            if not success:
-                print(f"Skipping image {j+1} due to generation failure.")
+                if not success:
+                    print(f"Skipping image {j+1} due to generation failure.")
         
-        # Generate audio for the full story
-        audio_path = story_dir / "story_audio.mp3"
-        generate_audio(full_story, audio_path)
+            # Generate audio for the full story
+            audio_path = story_dir / "story_audio.mp3"
+            generate_audio(full_story, audio_path)
+            record_story(story_dir)
         
         print(f"Completed story {i+1}/{NUM_STORIES}: '{story_data['title']}'")
         print(f"Saved to: {story_dir}")
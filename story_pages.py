@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Story Listing Export
+
+Writes the story list as small, precomputed, paginated JSON files that the
+stories API and the static host can serve directly:
+
+    public/stories/page-1.json, page-2.json, ...   one page of story entries each
+    public/stories/manifest.json                   page count, totals and an ETag per page
+    public/output/<story>/thumb.jpg                cover thumbnail for the listing
+
+Titles, durations and segment counts come from the story catalog, so nothing
+is derived from folder names at request time. Pages whose content did not
+change are not rewritten, which keeps their ETags and cache entries valid.
+
+Usage:
+    python story_pages.py [--sync] [--per-page 50]
+"""
+
+import sys
+import json
+import time
+import hashlib
+import logging
+import argparse
+from pathlib import Path
+from typing import Dict, List
+
+import story_catalog
+from atomic_io import save_image_atomic, write_bytes_atomic
+
+logger = logging.getLogger(__name__)
+
+# Constants
+OUTPUT_DIR = Path("public/output")
+PAGES_DIR = Path("public/stories")
+BASE_URL = "/output"
+PER_PAGE = 50
+THUMBNAIL_NAME = "thumb.jpg"
+THUMBNAIL_SIZE = (256, 256)
+MANIFEST_VERSION = 1
+
+
+def ensure_thumbnail(story_dir: Path) -> bool:
+    """Create or refresh the cover thumbnail from image_1.png."""
+    cover = story_dir / "image_1.png"
+    thumb = story_dir / THUMBNAIL_NAME
+    if not cover.exists():
+        return False
+    if thumb.exists() and thumb.stat().st_mtime >= cover.stat().st_mtime:
+        return True
+    try:
+        from PIL import Image
+
+        with Image.open(cover) as image:
+            image.draft("RGB", THUMBNAIL_SIZE)
+            image = image.convert("RGB")
+            image.thumbnail(THUMBNAIL_SIZE)
+            save_image_atomic(image, thumb, "JPEG", quality=80, optimize=True)
+        return True
+    except Exception as e:
+        logger.warning(f"Could not create thumbnail for {story_dir.name}: {e}")
+        return False
+
+
+def _listing_order(conn, output_dir: Path) -> List[str]:
+    """Order the library's stories as curated in stories.json, then the rest by title."""
+    slugs = [row["slug"] for row in conn.execute(
+        "SELECT slug FROM stories WHERE root = ? AND segment_count > 0 ORDER BY title COLLATE NOCASE",
+        (str(output_dir.resolve()),),
+    )]
+    curated = []
+    stories_json = output_dir / "stories.json"
+    if stories_json.exists():
+        try:
+            with open(stories_json, "r") as f:
+                curated = json.load(f).get("stories", [])
+        except (OSError, ValueError, AttributeError) as e:
+            logger.warning(f"Ignoring unreadable {stories_json}: {e}")
+    known = set(slugs)
+    ordered = [slug for slug in curated if slug in known]
+    listed = set(ordered)
+    return ordered + [slug for slug in slugs if slug not in listed]
+
+
+def build_entries(conn, output_dir: Path = OUTPUT_DIR, base_url: str = BASE_URL) -> List[Dict]:
+    """Build one listing entry per catalogued story in output_dir.
+
+    Stories the validator found incomplete (missing or placeholder assets)
+    are listed with valid set to false.
+    """
+    rows = {row["slug"]: row for row in conn.execute(
+        "SELECT * FROM stories WHERE root = ?", (str(output_dir.resolve()),)
+    )}
+    entries = []
+    for slug in _listing_order(conn, output_dir):
+        row = rows[slug]
+        story_dir = output_dir / slug
+        entry = {
+            "id": slug,
+            "title": row["title"],
+            "baseUrl": base_url,
+            "valid": row["status"] == "complete",
+            "isPublic": True,
+            "complete": row["status"] == "complete",
+            "segments": row["segment_count"],
+            "duration": round(row["duration"], 1) if row["duration"] else None,
+            "cover": f"{base_url}/{slug}/{row['cover']}" if row["cover"] else None,
+            "thumbnail": None,
+        }
+        if row["cover"] and ensure_thumbnail(story_dir):
+            entry["thumbnail"] = f"{base_url}/{slug}/{THUMBNAIL_NAME}"
+        entries.append(entry)
+    return entries
+
+
+def _write_if_changed(path: Path, payload: bytes) -> bool:
+    """Write payload unless the file already holds exactly these bytes."""
+    if path.exists() and path.read_bytes() == payload:
+        return False
+    write_bytes_atomic(path, payload)
+    return True
+
+
+def export_pages(conn, output_dir: Path = OUTPUT_DIR, pages_dir: Path = PAGES_DIR, per_page: int = PER_PAGE) -> Dict:
+    """Write the paginated listing files and the manifest. Returns the manifest."""
+    entries = build_entries(conn, output_dir)
+    pages_dir.mkdir(parents=True, exist_ok=True)
+    page_count = max(1, -(-len(entries) // per_page))
+
+    pages = []
+    written = 0
+    for number in range(1, page_count + 1):
+        chunk = entries[(number - 1) * per_page:number * per_page]
+        page = {
+            "page": number,
+            "pages": page_count,
+            "perPage": per_page,
+            "total": len(entries),
+            "stories": chunk,
+        }
+        payload = json.dumps(page, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+        name = f"page-{number}.json"
+        if _write_if_changed(pages_dir / name, payload):
+            written += 1
+        pages.append({
+            "file": name,
+            "etag": '"' + hashlib.sha256(payload).hexdigest()[:32] + '"',
+            "count": len(chunk),
+            "bytes": len(payload),
+        })
+
+    # Drop pages left over from a larger library
+    for stale in pages_dir.glob("page-*.json"):
+        if stale.name not in {page["file"] for page in pages}:
+            stale.unlink()
+
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "perPage": per_page,
+        "total": len(entries),
+        "pages": pages,
+    }
+    manifest_payload = json.dumps(manifest, separators=(",", ":")).encode("utf-8")
+    _write_if_changed(pages_dir / "manifest.json", manifest_payload)
+    logger.info(f"Exported {len(entries)} stories into {page_count} pages ({written} rewritten)")
+    return manifest
+
+
+def export_listing(db_path: Path = story_catalog.CATALOG_DB, output_dir: Path = OUTPUT_DIR, pages_dir: Path = PAGES_DIR) -> None:
+    """Refresh the listing export after a generation run.
+
+    Errors are logged and never fail the run that produced the stories.
+    """
+    try:
+        conn = story_catalog.connect(db_path)
+        try:
+            export_pages(conn, output_dir, pages_dir)
+        finally:
+            conn.close()
+    except Exception as e:
+        logger.warning(f"Could not export story listing pages: {e}")
+
+
+def main():
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+    parser = argparse.ArgumentParser(description="Export paginated story listing files for the stories API")
+    parser.add_argument("--db", default=str(story_catalog.CATALOG_DB), help="Story catalog database")
+    parser.add_argument("--root", default=str(OUTPUT_DIR), help=f"Story library (default: {OUTPUT_DIR})")
+    parser.add_argument("--out", default=str(PAGES_DIR), help=f"Listing directory (default: {PAGES_DIR})")
+    parser.add_argument("--per-page", type=int, default=PER_PAGE, help=f"Stories per page (default: {PER_PAGE})")
+    parser.add_argument("--sync", action="store_true", help="Re-index the library into the catalog first")
+    args = parser.parse_args()
+
+    start = time.time()
+    conn = story_catalog.connect(Path(args.db))
+    try:
+        if args.sync:
+            story_catalog.sync_library(conn, Path(args.root))
+        manifest = export_pages(conn, Path(args.root), Path(args.out), args.per_page)
+    finally:
+        conn.close()
+
+    print(f"Wrote {len(manifest['pages'])} pages for {manifest['total']} stories to {args.out} "
+          f"in {time.time() - start:.2f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
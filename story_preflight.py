@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Pre-flight Story Checks
+
+A cheap, local gate between story text and media generation. Images and
+narration cost far more than the GPT-4 call that produced the text, so a
+story is checked before any of that money is spent:
+
+1. The title is present.
+2. There is exactly the requested number of segments, and each one has text.
+3. Each segment is within MIN_SEGMENT_WORDS..MAX_SEGMENT_WORDS words.
+4. No segment is the generator's "Segment N for the story about ..." stub.
+
+Problems that only concern the layout are repaired locally, for free: a
+missing title, the wrong number of segments, empty or lopsided segments.
+The whole text is re-split at sentence boundaries into the requested number
+of parts. Stub text, or too little text overall, means the story is
+requested again. Once the attempts run out, the story is rejected and no
+image or TTS call is made for it.
+
+    story_data = preflight_story(generate_story_with_segments, title, premise, 10)
+    if story_data is None:
+        ...  # skip the story
+
+Usage:
+    python story_preflight.py public/output/the-curious-cloud/story_segments.json
+"""
+
+import re
+import sys
+import json
+import argparse
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from instrumentation import recorder
+from story_segments import load_segments
+from story_validator import STUB_SEGMENT_PATTERN
+
+# Constants
+MIN_SEGMENT_WORDS = 8
+MAX_SEGMENT_WORDS = 120
+PREFLIGHT_ATTEMPTS = 3  # story requests before the story is rejected
+
+SENTENCE_END = re.compile(r"(?<=[.!?…])[\"'”’)]*\s+")
+
+
+def _words(text) -> int:
+    return len(text.split()) if isinstance(text, str) else 0
+
+
+def check_story(story_data, num_segments: int) -> Dict:
+    """Check generated story text. Returns {"ok", "problems", "stub", "repairable", "words"}."""
+    report = {"ok": False, "problems": [], "stub": False, "repairable": False, "words": 0}
+    if not isinstance(story_data, dict) or not isinstance(story_data.get("segments"), list):
+        report["problems"].append("no segments list")
+        return report
+
+    segments = story_data["segments"]
+    texts = [segment.get("text") if isinstance(segment, dict) else None for segment in segments]
+    report["words"] = sum(_words(text) for text in texts)
+    if not isinstance(story_data.get("title"), str) or not story_data["title"].strip():
+        report["problems"].append("missing title")
+    if len(segments) != num_segments:
+        report["problems"].append(f"expected {num_segments} segments, found {len(segments)}")
+    for i, text in enumerate(texts):
+        words = _words(text)
+        if not words:
+            report["problems"].append(f"segment {i+1} has no text")
+        elif STUB_SEGMENT_PATTERN.match(text):
+            report["stub"] = True
+        elif words < MIN_SEGMENT_WORDS:
+            report["problems"].append(f"segment {i+1} is too short ({words} words)")
+        elif words > MAX_SEGMENT_WORDS:
+            report["problems"].append(f"segment {i+1} is too long ({words} words)")
+    if report["stub"]:
+        report["problems"].append("fallback stub text")
+
+    # Re-splitting fixes anything except stubs and a story that is too short overall
+    report["repairable"] = not report["stub"] and report["words"] >= MIN_SEGMENT_WORDS * num_segments
+    report["ok"] = not report["problems"]
+    return report
+
+
+def split_sentences(text: str) -> List[str]:
+    return [sentence.strip() for sentence in SENTENCE_END.split(text.strip()) if sentence.strip()]
+
+
+def resplit(texts: List[str], num_segments: int) -> List[str]:
+    """Redistribute text into num_segments parts of similar length, at sentence boundaries where possible."""
+    units = split_sentences(" ".join(t.strip() for t in texts if isinstance(t, str) and t.strip()))
+    if len(units) < num_segments:
+        # Too few sentences to go around: split between words instead
+        units = " ".join(units).split()
+    parts: List[str] = []
+    remaining = sum(_words(unit) for unit in units)
+    start = 0
+    for parts_left in range(num_segments, 0, -1):
+        if parts_left == 1:
+            parts.append(" ".join(units[start:]))
+            break
+        target = remaining / parts_left
+        end, count = start + 1, _words(units[start]) if start < len(units) else 0
+        # Grow the part while that brings it closer to its share, leaving a unit for every later part
+        while end < len(units) - (parts_left - 1) and abs(count + _words(units[end]) - target) <= abs(count - target):
+            count += _words(units[end])
+            end += 1
+        parts.append(" ".join(units[start:end]))
+        remaining -= count
+        start = end
+    return parts
+
+
+def repair_story(story_data, title: str, num_segments: int) -> Dict:
+    """Fix title and segmentation locally, without another API call."""
+    segments = story_data.get("segments", []) if isinstance(story_data, dict) else []
+    texts = [segment.get("text") if isinstance(segment, dict) else None for segment in segments]
+    story_title = story_data.get("title") if isinstance(story_data, dict) else None
+    if not isinstance(story_title, str) or not story_title.strip():
+        story_title = title
+    return {"title": story_title.strip(), "segments": [{"text": text} for text in resplit(texts, num_segments)]}
+
+
+def preflight_story(generate: Callable[[str, str, int], Dict], title: str, premise: str,
+                    num_segments: int, attempts: int = PREFLIGHT_ATTEMPTS) -> Optional[Dict]:
+    """Return story text that passes check_story, repairing or re-requesting it; None if it never does."""
+    for attempt in range(attempts):
+        story_data = generate(title, premise, num_segments)
+        with recorder.stage("preflight") as stage:
+            report = check_story(story_data, num_segments)
+            if not report["ok"] and report["repairable"]:
+                story_data = repair_story(story_data, title, num_segments)
+                repaired = check_story(story_data, num_segments)
+                if repaired["ok"]:
+                    recorder.count("preflight_repairs", problems="; ".join(report["problems"]))
+                    print(f"Repaired story text locally ({'; '.join(report['problems'])})")
+                report = repaired
+            stage["ok_text"] = report["ok"]
+        if report["ok"]:
+            return story_data
+        print(f"Story text failed pre-flight checks (attempt {attempt+1}/{attempts}): {'; '.join(report['problems'])}")
+        if attempt < attempts - 1:
+            recorder.count("retries", stage="preflight")
+    recorder.count("preflight_rejected", title=title)
+    print(f"Skipping '{title}': no image or audio will be generated for text that failed pre-flight checks")
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the pre-flight checks on a story_segments.json file")
+    parser.add_argument("path", help="story_segments.json to check")
+    parser.add_argument("--segments", type=int, help="Expected segment count (default: the file's own)")
+    parser.add_argument("--repair", action="store_true", help="Print the locally repaired segmentation")
+    args = parser.parse_args()
+
+    data = load_segments(Path(args.path))
+    num_segments = args.segments or len(data["segments"])
+    report = check_story(data, num_segments)
+    print(json.dumps(report, indent=2))
+    if args.repair and report["repairable"]:
+        print(json.dumps(repair_story(data, data.get("title") or "", num_segments), indent=2, ensure_ascii=False))
+    return 0 if report["ok"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
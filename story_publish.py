@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Progressive Story Publishing
+
+Publishes a story to the site while its assets are still being generated.
+Each story folder gets a story_manifest.json that lists every asset with a
+status, so the player can show what is ready and poll for the rest:
+
+    {
+      "version": 1,
+      "id": "the-sleepy-owl",
+      "title": "The Sleepy Owl",
+      "status": "partial",            # partial | complete | degraded
+      "assets": {
+        "story.txt": "ready",
+        "story_segments.json": "ready",
+        "image_1.png": "ready",
+        "image_2.png": "pending",
+        ...
+        "story_audio.mp3": "pending"
+      },
+      "updated": 1700000000.0
+    }
+
+A story is published (added to stories.json and the listing pages) as soon
+as its text and first image exist. After that the manifest is rewritten
+atomically as each asset lands. Assets whose generation fell back to a
+placeholder are marked "placeholder", and the story ends up "degraded".
+
+Usage:
+    python story_publish.py public/output/the-sleepy-owl     # refresh one manifest and publish
+    python story_publish.py --all                            # refresh every story's manifest
+"""
+
+import sys
+import json
+import time
+import logging
+import argparse
+from pathlib import Path
+from typing import Dict, List
+
+from atomic_io import file_lock, story_lock, write_json_atomic
+from story_segments import load_segments
+from story_validator import find_story_dirs, validate_image, validate_audio
+
+logger = logging.getLogger(__name__)
+
+# Constants
+OUTPUT_DIR = Path("public/output")
+MANIFEST_NAME = "story_manifest.json"
+MANIFEST_VERSION = 1
+AUDIO_ASSET = "story_audio.mp3"
+
+# stories.json is shared by every story, so its updates take a library-wide lock
+STORIES_LOCK_NAME = ".stories.lock"
+
+
+def _segment_images(story_dir: Path) -> List[str]:
+    segments = load_segments(story_dir / "story_segments.json")["segments"]
+    return [segment.get("image") or f"image_{i+1}.png" for i, segment in enumerate(segments)]
+
+
+def asset_status(path: Path) -> str:
+    """Return ready, pending (not written yet) or placeholder (written but not usable)."""
+    if not path.exists():
+        return "pending"
+    if path.name == AUDIO_ASSET:
+        return "ready" if validate_audio(path)["ok"] else "placeholder"
+    if path.suffix == ".png":
+        return "ready" if validate_image(path)["ok"] else "placeholder"
+    return "ready" if path.stat().st_size > 0 else "placeholder"
+
+
+def build_manifest(story_dir: Path) -> Dict:
+    """Describe the current state of every asset in a story folder."""
+    story_dir = Path(story_dir)
+    title = load_segments(story_dir / "story_segments.json").get("title")
+
+    names = ["story.txt", "story_segments.json"] + _segment_images(story_dir) + [AUDIO_ASSET]
+    assets = {name: asset_status(story_dir / name) for name in names}
+    if "pending" in assets.values():
+        status = "partial"
+    elif "placeholder" in assets.values():
+        status = "degraded"
+    else:
+        status = "complete"
+    return {
+        "version": MANIFEST_VERSION,
+        "id": story_dir.name,
+        "title": title or story_dir.name,
+        "status": status,
+        "assets": assets,
+        "updated": round(time.time(), 3),
+    }
+
+
+def update_manifest(story_dir: Path) -> Dict:
+    """Rewrite story_manifest.json from what is on disk now."""
+    with story_lock(story_dir):
+        manifest = build_manifest(story_dir)
+        write_json_atomic(Path(story_dir) / MANIFEST_NAME, manifest)
+    return manifest
+
+
+def add_to_stories_json(story_dir: Path) -> bool:
+    """Append the story to stories.json next to it. Returns False if it was already listed."""
+    story_dir = Path(story_dir)
+    stories_json = story_dir.parent / "stories.json"
+    with file_lock(story_dir.parent / STORIES_LOCK_NAME):
+        data = {"stories": []}
+        if stories_json.exists():
+            with open(stories_json, "r") as f:
+                data = json.load(f)
+        if story_dir.name in data.get("stories", []):
+            return False
+        data.setdefault("stories", []).append(story_dir.name)
+        write_json_atomic(stories_json, data)
+    return True
+
+
+def publish_story(story_dir: Path, refresh_listing: bool = True) -> Dict:
+    """Make a story visible on the site with its current manifest.
+
+    Safe to call repeatedly: the first call lists the story, later calls
+    refresh its manifest, catalog entry and listing page. Errors are logged
+    and never interrupt generation.
+    """
+    story_dir = Path(story_dir)
+    try:
+        manifest = update_manifest(story_dir)
+        if add_to_stories_json(story_dir):
+            logger.info(f"Published {story_dir.name} ({manifest['status']})")
+        if refresh_listing:
+            # Imported lazily: the listing exporter pulls in the catalog
+            from story_catalog import record_story
+            from story_pages import export_listing
+
+            record_story(story_dir)
+            export_listing(output_dir=story_dir.parent)
+        return manifest
+    except (OSError, ValueError) as e:
+        logger.warning(f"Could not publish {story_dir.name}: {e}")
+        return {}
+
+
+def refresh_manifest(story_dir: Path) -> None:
+    """Update an already published story's manifest after an asset lands."""
+    story_dir = Path(story_dir)
+    if not (story_dir / MANIFEST_NAME).exists():
+        return
+    try:
+        update_manifest(story_dir)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Could not update {MANIFEST_NAME} for {story_dir.name}: {e}")
+
+
+def main():
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+    parser = argparse.ArgumentParser(description="Publish stories and refresh their asset manifests")
+    parser.add_argument("story_dir", nargs="?", help="Story folder to publish")
+    parser.add_argument("--all", action="store_true", help="Refresh manifests for every story in the library")
+    parser.add_argument("--root", default=str(OUTPUT_DIR), help=f"Story library (default: {OUTPUT_DIR})")
+    args = parser.parse_args()
+
+    if args.all:
+        for story_dir in find_story_dirs(Path(args.root)):
+            if (story_dir / "story_segments.json").exists():
+                manifest = update_manifest(story_dir)
+                print(f"{story_dir.name}: {manifest['status']}")
+    elif args.story_dir:
+        manifest = publish_story(Path(args.story_dir))
+        print(json.dumps(manifest, indent=2))
+    else:
+        parser.error("give a story folder or --all")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+Story Segments Schema
+
+Reads and writes story_segments.json. Version 2 is a compact, minified
+encoding that leaves out everything that can be derived:
+
+    {"version":2,"title":"The Sleepy Owl","segmentDuration":5,
+     "segments":[{"text":"Once upon a time..."},{"text":"..."}]}
+
+- "image" is omitted when it is the default image_<N>.png for segment N.
+- Evenly spaced timings become one "segmentDuration" (starting at 0).
+  Contiguous timings that are not evenly spaced become a single
+  "boundaries" list of N+1 times. Anything else keeps per-segment
+  "start"/"end".
+- Other per-segment keys are kept as they are.
+
+Two legacy shapes are still read: a bare list of segments (the old root
+public/output/story_segments.json) and the version 1 object with every field
+spelled out. `load_segments()` accepts all three and returns the expanded
+version 1 shape that callers already use:
+
+    {"title": "...", "segments": [{"text", "image", "start", "end"}, ...]}
+
+`write_segments()` writes version 2 atomically. Optionally it also writes
+pre-compressed story_segments.json.gz and, if the brotli package is
+installed, .json.br copies for the media route to serve. `migrate` upgrades
+a whole library in one pass.
+
+Usage:
+    python story_segments.py migrate [public/output] [--compress] [--dry-run]
+    python story_segments.py show public/output/the-curious-cloud/story_segments.json
+"""
+
+import sys
+import json
+import gzip
+import logging
+import argparse
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from atomic_io import story_lock, write_bytes_atomic
+
+try:
+    import brotli
+except ImportError:  # optional: only needed for .br copies
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Constants
+OUTPUT_DIR = Path("public/output")
+SEGMENTS_NAME = "story_segments.json"
+SCHEMA_VERSION = 2
+TIME_PRECISION = 3  # decimal places kept for segment timings
+COMPRESSED_SUFFIXES = (".gz", ".br")
+
+
+class SegmentsError(ValueError):
+    """Raised when story_segments.json does not match any known schema."""
+
+
+def default_image(index: int) -> str:
+    """Image name for the zero-based segment index."""
+    return f"image_{index + 1}.png"
+
+
+def _number(value: float):
+    value = round(float(value), TIME_PRECISION)
+    return int(value) if value.is_integer() else value
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def expand(data) -> Dict:
+    """Turn any supported shape into {"title", "segments"} with every field present."""
+    if isinstance(data, list):
+        data = {"title": None, "segments": data}
+    if not isinstance(data, dict) or not isinstance(data.get("segments"), list):
+        raise SegmentsError("expected a segment list or an object with a 'segments' list")
+
+    version = data.get("version", 1)
+    if not isinstance(version, int) or version > SCHEMA_VERSION:
+        raise SegmentsError(f"unsupported story_segments.json version {version!r}")
+    segments = [dict(s) if isinstance(s, dict) else s for s in data["segments"]]
+    expanded = {key: value for key, value in data.items() if key not in ("version", "segmentDuration", "boundaries")}
+    expanded["segments"] = segments
+    expanded.setdefault("title", None)
+    for i, segment in enumerate(segments):
+        if isinstance(segment, dict):
+            segment.setdefault("image", default_image(i))
+    if version < 2:
+        return expanded
+
+    duration = data.get("segmentDuration")
+    boundaries = data.get("boundaries")
+    if boundaries is not None and (not isinstance(boundaries, list) or len(boundaries) != len(segments) + 1):
+        raise SegmentsError("'boundaries' must list one more time than there are segments")
+    for i, segment in enumerate(segments):
+        if not isinstance(segment, dict):
+            continue
+        if boundaries is not None:
+            segment["start"], segment["end"] = boundaries[i], boundaries[i + 1]
+        elif _is_number(duration):
+            segment["start"], segment["end"] = _number(i * duration), _number((i + 1) * duration)
+    return expanded
+
+
+def compact(data) -> Dict:
+    """Encode any supported shape as a version 2 document."""
+    expanded = expand(data)
+    segments = expanded["segments"]
+    document = {"version": SCHEMA_VERSION}
+    if expanded.get("title"):
+        document["title"] = expanded["title"]
+    document.update({key: value for key, value in expanded.items() if key not in ("title", "segments")})
+
+    timed = bool(segments) and all(
+        isinstance(s, dict) and _is_number(s.get("start")) and _is_number(s.get("end")) for s in segments
+    )
+    contiguous = timed and all(
+        abs(segments[i]["start"] - segments[i - 1]["end"]) < 1e-6 for i in range(1, len(segments))
+    )
+    if contiguous:
+        durations = [s["end"] - s["start"] for s in segments]
+        if abs(segments[0]["start"]) < 1e-6 and max(durations) - min(durations) < 1e-6:
+            document["segmentDuration"] = _number(durations[0])
+        else:
+            document["boundaries"] = [_number(segments[0]["start"])] + [_number(s["end"]) for s in segments]
+
+    encoded: List = []
+    for i, segment in enumerate(segments):
+        if not isinstance(segment, dict):
+            encoded.append(segment)
+            continue
+        item = {key: value for key, value in segment.items() if key not in ("image", "start", "end")}
+        if segment.get("image") not in (None, default_image(i)):
+            item["image"] = segment["image"]
+        if not contiguous:
+            for key in ("start", "end"):
+                if key in segment:
+                    item[key] = segment[key]
+        encoded.append(item)
+    document["segments"] = encoded
+    return document
+
+
+def dumps_compact(data) -> bytes:
+    """Minified UTF-8 encoding of the version 2 document."""
+    return json.dumps(compact(data), separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def loads(payload) -> Dict:
+    """Parse story_segments.json bytes or text in any supported shape."""
+    return expand(json.loads(payload))
+
+
+def load_segments(path: Path) -> Dict:
+    """Read story_segments.json in any supported shape, expanded."""
+    with open(path, "rb") as f:
+        return loads(f.read())
+
+
+def write_segments(path: Path, data, compressed: Optional[bool] = None) -> int:
+    """Write data as compact version 2 JSON, atomically. Returns the byte size.
+
+    compressed=True also writes .gz (and .br when brotli is available) copies;
+    False removes stale copies; None keeps copies only if they already exist.
+    """
+    path = Path(path)
+    payload = dumps_compact(data)
+    if compressed is None:
+        compressed = any(path.with_name(path.name + suffix).exists() for suffix in COMPRESSED_SUFFIXES)
+    write_bytes_atomic(path, payload)
+
+    gz_path = path.with_name(path.name + ".gz")
+    br_path = path.with_name(path.name + ".br")
+    if compressed:
+        write_bytes_atomic(gz_path, gzip.compress(payload, compresslevel=9, mtime=0))
+        if brotli is not None:
+            write_bytes_atomic(br_path, brotli.compress(payload, quality=11))
+    for copy_path in (gz_path, br_path):
+        stale = not compressed or (copy_path == br_path and brotli is None)
+        if stale and copy_path.exists():
+            copy_path.unlink()
+    return len(payload)
+
+
+def _segment_files(root: Path) -> List[Path]:
+    from story_validator import find_story_dirs
+
+    files = [root / SEGMENTS_NAME] if (root / SEGMENTS_NAME).exists() else []
+    files += [d / SEGMENTS_NAME for d in find_story_dirs(root) if (d / SEGMENTS_NAME).exists()]
+    return files
+
+
+def migrate_library(root: Path = OUTPUT_DIR, compressed: bool = False, dry_run: bool = False) -> Dict[str, int]:
+    """Upgrade every story_segments.json under root to version 2 in one pass."""
+    counts = {"files": 0, "upgraded": 0, "unchanged": 0, "failed": 0, "bytes_before": 0, "bytes_after": 0}
+    for path in _segment_files(Path(root)):
+        counts["files"] += 1
+        try:
+            with story_lock(path.parent):
+                before = path.read_bytes()
+                payload = dumps_compact(loads(before))
+                counts["bytes_before"] += len(before)
+                counts["bytes_after"] += len(payload)
+                if payload == before and not compressed:
+                    counts["unchanged"] += 1
+                    continue
+                if not dry_run:
+                    write_segments(path, loads(before), compressed)
+                counts["upgraded"] += 1
+        except (OSError, ValueError) as e:
+            logger.error(f"Could not migrate {path}: {e}")
+            counts["failed"] += 1
+    return counts
+
+
+def main():
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+    parser = argparse.ArgumentParser(description="Migrate and inspect story_segments.json files")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    migrate_parser = subparsers.add_parser("migrate", help="Upgrade every story_segments.json to the compact schema")
+    migrate_parser.add_argument("root", nargs="?", default=str(OUTPUT_DIR), help=f"Story library (default: {OUTPUT_DIR})")
+    migrate_parser.add_argument("--compress", action="store_true", help="Also write .gz (and .br) copies")
+    migrate_parser.add_argument("--dry-run", action="store_true", help="Report savings without writing")
+
+    show_parser = subparsers.add_parser("show", help="Print a story_segments.json file expanded")
+    show_parser.add_argument("path")
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        counts = migrate_library(Path(args.root), args.compress, args.dry_run)
+        saved = counts["bytes_before"] - counts["bytes_after"]
+        print(f"{'Would upgrade' if args.dry_run else 'Upgraded'} {counts['upgraded']} of {counts['files']} files "
+              f"({counts['unchanged']} already compact, {counts['failed']} failed); "
+              f"{counts['bytes_before']} -> {counts['bytes_after']} bytes ({saved} saved)")
+        return 1 if counts["failed"] else 0
+    print(json.dumps(load_segments(Path(args.path)), indent=2, ensure_ascii=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Story Slug Allocation
+
+One slug function and one directory allocator for every generator. The
+story folder is reserved with a plain mkdir. mkdir is atomic, so when two
+workers (threads, processes or nodes sharing the library) pick the same
+slug, exactly one of them wins it. The other moves on to a suffixed
+name, and a new story never writes into an existing story's folder.
+
+Collisions get a short, deterministic suffix taken from the title's hash.
+"The Owl!" and "The Owl?" therefore always end up as the-owl and
+the-owl-<hash>, whichever runs first. Allocating the same title again
+appends a counter: the-owl-<hash>-2, -3, ...
+
+Every allocation is recorded in slugs.json at the library root, which maps
+each slug to its title and creation time. Updates hold a library-wide lock
+(.slugs.lock).
+
+Usage:
+    python story_slugs.py                          # list slug -> title for public/output
+    python story_slugs.py --root output            # another library
+    python story_slugs.py --rebuild                # re-record existing story folders
+    python story_slugs.py --allocate "The Sleepy Owl" --dry-run
+"""
+
+import re
+import sys
+import json
+import time
+import hashlib
+import logging
+import argparse
+from pathlib import Path
+from typing import Dict, Optional
+
+from atomic_io import file_lock, write_json_atomic
+
+logger = logging.getLogger(__name__)
+
+# Constants
+OUTPUT_DIR = Path("public/output")
+INDEX_NAME = "slugs.json"
+INDEX_LOCK_NAME = ".slugs.lock"
+MAX_SLUG_LENGTH = 64
+SUFFIX_LENGTH = 6  # hex digits of the title hash used on collision
+FALLBACK_SLUG = "story"
+MAX_ATTEMPTS = 1000
+
+
+def slugify(text: str) -> str:
+    """Convert text to a URL and filesystem-friendly format."""
+    # Remove special characters and convert to lowercase
+    slug = re.sub(r'[^\w\s-]', '', text.lower())
+    # Replace spaces with hyphens, then collapse runs of hyphens
+    slug = re.sub(r'\s+', '-', slug)
+    slug = re.sub(r'-+', '-', slug).strip('-')
+    if len(slug) > MAX_SLUG_LENGTH:
+        # Cut at a word boundary when there is one
+        slug = slug[:MAX_SLUG_LENGTH].rsplit('-', 1)[0] or slug[:MAX_SLUG_LENGTH]
+    # Never start with "_": library scanners skip those names
+    return slug.lstrip('_') or FALLBACK_SLUG
+
+
+def title_suffix(title: str) -> str:
+    return hashlib.sha1(title.encode("utf-8")).hexdigest()[:SUFFIX_LENGTH]
+
+
+def candidate_slugs(title: str):
+    """Yield the slugs to try for title, in order."""
+    base = slugify(title)
+    yield base
+    suffixed = f"{base}-{title_suffix(title)}"
+    yield suffixed
+    for n in range(2, MAX_ATTEMPTS):
+        yield f"{suffixed}-{n}"
+
+
+def load_index(root: Path = OUTPUT_DIR) -> Dict[str, Dict]:
+    """Return {slug: {"title", "created"}} from root/slugs.json."""
+    path = Path(root) / INDEX_NAME
+    if not path.exists():
+        return {}
+    with open(path, "r") as f:
+        return json.load(f).get("slugs", {})
+
+
+def record_slug(root: Path, slug: str, title: str, created: Optional[float] = None) -> None:
+    """Add or update one slug -> title entry in root/slugs.json."""
+    root = Path(root)
+    with file_lock(root / INDEX_LOCK_NAME):
+        slugs = load_index(root)
+        slugs[slug] = {"title": title, "created": round(created or time.time(), 3)}
+        write_json_atomic(root / INDEX_NAME, {"slugs": dict(sorted(slugs.items()))})
+
+
+def allocate_story_dir(title: str, root: Path = OUTPUT_DIR) -> Path:
+    """Reserve a new, empty story folder for title and return it.
+
+    Raises FileExistsError if every candidate slug is taken.
+    """
+    root = Path(root)
+    root.mkdir(parents=True, exist_ok=True)
+    for slug in candidate_slugs(title):
+        story_dir = root / slug
+        try:
+            story_dir.mkdir()
+        except FileExistsError:
+            continue
+        if slug != slugify(title):
+            logger.info(f"Story folder {slugify(title)} is taken; using {slug} for '{title}'")
+        try:
+            record_slug(root, slug, title)
+        except (OSError, ValueError) as e:
+            # The folder is already ours; a stale index only affects lookups
+            logger.warning(f"Could not record slug {slug} in {INDEX_NAME}: {e}")
+        return story_dir
+    raise FileExistsError(f"No free story folder for '{title}' under {root}")
+
+
+def rebuild_index(root: Path = OUTPUT_DIR) -> int:
+    """Record every existing story folder under root, reading titles from story_segments.json."""
+    # Imported lazily: the validator and schema modules are only needed here
+    from story_segments import load_segments
+    from story_validator import find_story_dirs
+
+    root = Path(root)
+    count = 0
+    with file_lock(root / INDEX_LOCK_NAME):
+        slugs = load_index(root)
+        for story_dir in find_story_dirs(root):
+            try:
+                title = load_segments(story_dir / "story_segments.json").get("title")
+            except (OSError, ValueError):
+                title = None
+            entry = slugs.get(story_dir.name, {})
+            slugs[story_dir.name] = {
+                "title": title or entry.get("title") or story_dir.name,
+                "created": entry.get("created", round(story_dir.stat().st_mtime, 3)),
+            }
+            count += 1
+        write_json_atomic(root / INDEX_NAME, {"slugs": dict(sorted(slugs.items()))})
+    return count
+
+
+def main():
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+    parser = argparse.ArgumentParser(description="Allocate and list story folder slugs")
+    parser.add_argument("--root", default=str(OUTPUT_DIR), help=f"Story library (default: {OUTPUT_DIR})")
+    parser.add_argument("--rebuild", action="store_true", help=f"Record every existing story folder in {INDEX_NAME}")
+    parser.add_argument("--allocate", metavar="TITLE", help="Reserve a folder for TITLE and print its path")
+    parser.add_argument("--dry-run", action="store_true", help="With --allocate, print the folder without creating it")
+    args = parser.parse_args()
+
+    root = Path(args.root)
+    if args.allocate and args.dry_run:
+        slug = next(s for s in candidate_slugs(args.allocate) if not (root / s).exists())
+        print(root / slug)
+    elif args.allocate:
+        print(allocate_story_dir(args.allocate, root))
+    elif args.rebuild:
+        print(f"Recorded {rebuild_index(root)} story folders in {root / INDEX_NAME}")
+    else:
+        for slug, entry in load_index(root).items():
+            print(f"{slug:45} {entry['title']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
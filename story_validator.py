@@ -0,0 +1,390 @@
+#!/usr/bin/env python3
+"""
+Story Content Validator
+
+Checks that the files in a story folder contain real content, not just that
+they exist:
+1. PNG images: magic bytes, header-only dimension parsing and a bytes-per-pixel
+   heuristic that flags flat placeholder images (lightgray / midnight blue)
+2. story_audio.mp3: size, ID3 skipping, MPEG frame sync and duration from the
+   frame headers (no decoding)
+3. story_segments.json: schema checks on title, segment texts, image names and
+   timings, including the generator's "Segment N for the story about" stub
+4. story.txt: non-empty text
+
+Only headers are read for media files, so a full library scan stays fast.
+Assets reported as broken or placeholder are the ones that need regenerating.
+"""
+
+import re
+import sys
+import json
+import mmap
+import argparse
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from story_segments import SegmentsError, expand
+
+# Constants
+OUTPUT_DIR = Path("public/output")
+NUM_IMAGES = 10
+EXPECTED_IMAGE_SIZE = (1024, 1024)  # DALL-E 3 output size
+PLACEHOLDER_IMAGE_SIZES = {(800, 600)}  # create_placeholder_image / public/placeholder.png
+# Real illustrations compress to ~1.5 bytes per pixel, flat placeholders to ~0.01
+MIN_BYTES_PER_PIXEL = 0.05
+MIN_AUDIO_DURATION = 5.0  # seconds
+MIN_AUDIO_FRAMES = 3  # consecutive frames required to accept the MPEG sync
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+JPEG_SIGNATURE = b"\xff\xd8\xff"
+STUB_SEGMENT_PATTERN = re.compile(r"^Segment \d+ for the story about ")
+IMAGE_NAME_PATTERN = re.compile(r"^image_\d+\.png$")
+
+# MPEG audio header tables, indexed by [version][layer][bitrate_index] (kbps)
+_BITRATES = {
+    "1": {
+        1: [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+        2: [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+        3: [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    },
+    "2": {
+        1: [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+        2: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+        3: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    },
+}
+_SAMPLE_RATES = {
+    3: [44100, 48000, 32000],  # MPEG 1
+    2: [22050, 24000, 16000],  # MPEG 2
+    0: [11025, 12000, 8000],   # MPEG 2.5
+}
+
+
+def _report(name: str, size: int) -> Dict:
+    """Create an empty asset report."""
+    return {"name": name, "size": size, "ok": False, "placeholder": False, "problems": []}
+
+
+def read_png_header(path: Path) -> Optional[Tuple[int, int]]:
+    """Return (width, height) from the PNG IHDR chunk, or None if not a PNG."""
+    with open(path, "rb") as f:
+        header = f.read(24)
+    if len(header) < 24 or not header.startswith(PNG_SIGNATURE) or header[12:16] != b"IHDR":
+        return None
+    return int.from_bytes(header[16:20], "big"), int.from_bytes(header[20:24], "big")
+
+
+def validate_image(path: Path) -> Dict:
+    """Validate a story image using only its header and file size."""
+    path = Path(path)
+    if not path.exists():
+        report = _report(path.name, 0)
+        report["problems"].append("missing")
+        return report
+
+    report = _report(path.name, path.stat().st_size)
+    if report["size"] == 0:
+        report["problems"].append("empty file")
+        report["placeholder"] = True
+        return report
+
+    dimensions = read_png_header(path)
+    if dimensions is None:
+        with open(path, "rb") as f:
+            magic = f.read(3)
+        kind = "JPEG data" if magic == JPEG_SIGNATURE else "unrecognised data"
+        report["problems"].append(f"not a PNG ({kind})")
+        return report
+
+    width, height = dimensions
+    report["width"], report["height"] = width, height
+    if width == 0 or height == 0:
+        report["problems"].append("zero image dimensions")
+        return report
+
+    if (width, height) in PLACEHOLDER_IMAGE_SIZES:
+        report["placeholder"] = True
+        report["problems"].append(f"placeholder dimensions {width}x{height}")
+    elif (width, height) != EXPECTED_IMAGE_SIZE:
+        report["problems"].append(f"unexpected dimensions {width}x{height}")
+
+    if report["size"] / (width * height) < MIN_BYTES_PER_PIXEL:
+        report["placeholder"] = True
+        report["problems"].append("flat image (compresses like a solid-color placeholder)")
+
+    report["ok"] = not report["placeholder"]
+    return report
+
+
+def _skip_id3(data) -> int:
+    """Return the offset of the first byte after an ID3v2 tag, if any."""
+    if len(data) >= 10 and data[:3] == b"ID3":
+        size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+        footer = 10 if data[5] & 0x10 else 0
+        return 10 + size + footer
+    return 0
+
+
+def parse_mpeg_frame_header(data, offset: int) -> Optional[Tuple[int, int, int]]:
+    """Parse the MPEG audio frame header at offset.
+
+    Returns (frame_length, samples, sample_rate) or None if there is no valid
+    frame header at that position.
+    """
+    if offset + 4 > len(data):
+        return None
+    b1, b2, b3 = data[offset + 1], data[offset + 2], data[offset + 3]
+    if data[offset] != 0xFF or (b1 & 0xE0) != 0xE0:
+        return None
+
+    version = (b1 >> 3) & 0x03
+    layer_bits = (b1 >> 1) & 0x03
+    bitrate_index = b2 >> 4
+    rate_index = (b2 >> 2) & 0x03
+    if version == 1 or layer_bits == 0 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+
+    layer = 4 - layer_bits
+    bitrate = _BITRATES["1" if version == 3 else "2"][layer][bitrate_index] * 1000
+    sample_rate = _SAMPLE_RATES[version][rate_index]
+    padding = (b2 >> 1) & 0x01
+
+    if layer == 1:
+        samples = 384
+        length = (12 * bitrate // sample_rate + padding) * 4
+    else:
+        samples = 1152 if (layer == 2 or version == 3) else 576
+        length = samples // 8 * bitrate // sample_rate + padding
+    if length < 4:
+        return None
+    return length, samples, sample_rate
+
+
+def mp3_info(path: Path) -> Dict:
+    """Walk the MPEG frame headers of an MP3 file.
+
+    Returns a dict with the number of frames, the duration in seconds, the
+    sample rate, the number of unparsed trailing bytes and whether the last
+    frame was cut short.
+    """
+    info = {"frames": 0, "duration": 0.0, "sample_rate": None, "trailing_bytes": 0, "truncated": False}
+    with open(path, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            offset = _skip_id3(data)
+            total_samples = 0
+            while True:
+                frame = parse_mpeg_frame_header(data, offset)
+                if frame is None:
+                    break
+                length, samples, sample_rate = frame
+                if offset + length > len(data):
+                    info["truncated"] = True
+                    break
+                if info["sample_rate"] is None:
+                    info["sample_rate"] = sample_rate
+                info["frames"] += 1
+                total_samples += samples
+                offset += length
+
+            remaining = len(data) - offset
+            # An ID3v1 tag at the very end is expected, not junk
+            if remaining == 128 and data[offset:offset + 3] == b"TAG":
+                remaining = 0
+            info["trailing_bytes"] = remaining
+            if info["sample_rate"]:
+                info["duration"] = total_samples / info["sample_rate"]
+    return info
+
+
+def validate_audio(path: Path) -> Dict:
+    """Validate story narration by checking MPEG frame sync and duration."""
+    path = Path(path)
+    if not path.exists():
+        report = _report(path.name, 0)
+        report["problems"].append("missing")
+        return report
+
+    report = _report(path.name, path.stat().st_size)
+    if report["size"] == 0:
+        # generate_audio writes an empty file when TTS fails
+        report["placeholder"] = True
+        report["problems"].append("empty file (TTS failure placeholder)")
+        return report
+
+    info = mp3_info(path)
+    report["duration"] = round(info["duration"], 3)
+    if info["frames"] < MIN_AUDIO_FRAMES:
+        report["problems"].append("no MPEG frame sync found")
+        return report
+    if info["truncated"] or info["trailing_bytes"] > 0:
+        report["problems"].append(f"truncated or corrupt after {info['frames']} frames")
+        return report
+    if info["duration"] < MIN_AUDIO_DURATION:
+        report["problems"].append(f"audio too short ({info['duration']:.1f}s)")
+        return report
+
+    report["ok"] = True
+    return report
+
+
+def validate_segments_json(path: Path, num_segments: int = NUM_IMAGES) -> Dict:
+    """Validate the story_segments.json schema.
+
+    "parsed" is True when the file is readable JSON containing a segments
+    list; "timings_ok" is reported separately because bad timings can be
+    repaired locally without regenerating anything.
+    """
+    path = Path(path)
+    report = _report(path.name, path.stat().st_size if path.exists() else 0)
+    report["parsed"] = False
+    report["timings_ok"] = False
+    if not path.exists():
+        report["problems"].append("missing")
+        return report
+
+    try:
+        with open(path, "r") as f:
+            data = json.load(f)
+    except (ValueError, UnicodeDecodeError) as e:
+        report["problems"].append(f"invalid JSON: {e}")
+        return report
+
+    if isinstance(data, list):
+        report["problems"].append("legacy format: bare segment list without title")
+    elif isinstance(data, dict) and isinstance(data.get("segments"), list):
+        if not isinstance(data.get("title"), str) or not data["title"].strip():
+            report["problems"].append("missing title")
+    else:
+        report["problems"].append("missing 'segments' list")
+        return report
+    try:
+        # Fills in the images and timings that the compact schema leaves out
+        segments = expand(data)["segments"]
+    except SegmentsError as e:
+        report["problems"].append(str(e))
+        return report
+
+    report["parsed"] = True
+    report["segments"] = len(segments)
+    if len(segments) != num_segments:
+        report["problems"].append(f"expected {num_segments} segments, found {len(segments)}")
+
+    stub_segments = 0
+    timings_ok = bool(segments)
+    previous_end = 0
+    for i, segment in enumerate(segments):
+        if not isinstance(segment, dict):
+            report["problems"].append(f"segment {i+1} is not an object")
+            timings_ok = False
+            continue
+        text = segment.get("text")
+        if not isinstance(text, str) or not text.strip():
+            report["problems"].append(f"segment {i+1} has no text")
+        elif STUB_SEGMENT_PATTERN.match(text):
+            stub_segments += 1
+
+        image = segment.get("image")
+        if image is not None and not (isinstance(image, str) and IMAGE_NAME_PATTERN.match(image)):
+            report["problems"].append(f"segment {i+1} has an invalid image name {image!r}")
+
+        start, end = segment.get("start"), segment.get("end")
+        if not isinstance(start, (int, float)) or not isinstance(end, (int, float)):
+            timings_ok = False
+        elif end <= start or (i > 0 and start != previous_end):
+            timings_ok = False
+        else:
+            previous_end = end
+
+    if stub_segments:
+        report["placeholder"] = True
+        report["problems"].append(f"{stub_segments} segments are fallback stub text")
+    report["timings_ok"] = timings_ok
+    if not timings_ok:
+        report["problems"].append("segment timings missing or inconsistent")
+
+    report["ok"] = not report["problems"]
+    return report
+
+
+def validate_text(path: Path) -> Dict:
+    """Validate that story.txt exists and contains text."""
+    path = Path(path)
+    report = _report(path.name, path.stat().st_size if path.exists() else 0)
+    if not path.exists():
+        report["problems"].append("missing")
+    elif not path.read_text(errors="replace").strip():
+        report["problems"].append("empty text")
+    else:
+        report["ok"] = True
+    return report
+
+
+def validate_story_dir(story_dir: Path, num_images: int = NUM_IMAGES) -> Dict:
+    """Validate every asset in a story folder.
+
+    Returns a report with per-asset results and the list of asset names that
+    need regenerating ("broken"), so callers can redo only those.
+    """
+    story_dir = Path(story_dir)
+    assets = {
+        "story_segments.json": validate_segments_json(story_dir / "story_segments.json", num_images),
+        "story.txt": validate_text(story_dir / "story.txt"),
+        "story_audio.mp3": validate_audio(story_dir / "story_audio.mp3"),
+    }
+    for i in range(1, num_images + 1):
+        name = f"image_{i}.png"
+        assets[name] = validate_image(story_dir / name)
+
+    broken = [name for name, report in assets.items() if not report["ok"]]
+    placeholders = [name for name, report in assets.items() if report["placeholder"]]
+    return {
+        "story": story_dir.name,
+        "ok": not broken,
+        "assets": assets,
+        "broken": broken,
+        "placeholders": placeholders,
+    }
+
+
+def find_story_dirs(root: Path) -> List[Path]:
+    """Return story folders (directories containing story files) under root."""
+    root = Path(root)
+    if not root.is_dir():
+        return []
+    return sorted(d for d in root.iterdir() if d.is_dir() and not d.name.startswith((".", "_")))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Validate story assets by content, not just existence")
+    parser.add_argument("root", nargs="?", default=str(OUTPUT_DIR), help=f"Story library directory (default: {OUTPUT_DIR})")
+    parser.add_argument("--json", action="store_true", help="Print the full report as JSON")
+    args = parser.parse_args()
+
+    story_dirs = find_story_dirs(Path(args.root))
+    if not story_dirs:
+        print(f"No story folders found in {args.root}")
+        return 1
+
+    reports = [validate_story_dir(story_dir) for story_dir in story_dirs]
+
+    if args.json:
+        print(json.dumps(reports, indent=2))
+    else:
+        for report in reports:
+            if report["ok"]:
+                print(f"✓ {report['story']}")
+                continue
+            print(f"× {report['story']}")
+            for name in report["broken"]:
+                asset = report["assets"][name]
+                marker = " [placeholder]" if asset["placeholder"] else ""
+                print(f"    {name}{marker}: {'; '.join(asset['problems'])}")
+
+    broken = [r for r in reports if not r["ok"]]
+    print(f"\nValidated {len(reports)} stories: {len(reports) - len(broken)} healthy, {len(broken)} need attention")
+    return 1 if broken else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Sharded Story Workers
+
+Spreads a nightly batch over several machines, each with its own API key
+and rate limits. Every node runs story workers against one shared jobs
+database (story_jobs.db, the daemon's queue) and one shared library folder:
+
+    python story_worker.py enqueue --stories 60               # once, from any node
+    python story_worker.py run --workers 2 --until-empty      # on every node
+    python story_worker.py status
+
+Workers claim jobs with an expiring lease, and every node renews the leases
+of its jobs in the background. If a node dies, its jobs become claimable
+again when their leases run out (--lease, default 120 s). The next free
+worker on any node resumes them from their story folders, so only missing
+images and narration are generated again. A job whose lease expires on its
+last attempt is marked failed. Every write a worker makes to a job checks
+that it still holds the lease, so a node that stalls past its lease cannot
+overwrite the new holder's progress.
+
+Each node can be given a run budget (--budget, --max-calls, --deadline; see
+run_budget.py). It then claims the smallest jobs first within each
+priority, starts a job only while its estimated cost, calls and time still
+fit, and after a refusal tries smaller jobs before it stops. Budgets are
+per node.
+
+Across hosts, the working directory (library, catalog, idea pool and jobs
+database) must be on a shared filesystem with working POSIX locks, mounted
+at the same path everywhere. Set STORY_SHARED_FS=1 on every node: SQLite's
+WAL mode only works within one host, so the databases then use a rollback
+journal. Several processes on one machine need neither, which makes the
+setup easy to try locally against the mock server:
+
+    python mock_openai_server.py --port 8765 &
+    export OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=mock
+    python story_worker.py enqueue --stories 6 --segments 3 --no-idea-pool
+    for n in 1 2 3; do python story_worker.py run --node-id node$n --until-empty & done; wait
+
+Usage:
+    python story_worker.py enqueue --stories 100 --segments 10 --priority 0
+    STORY_SHARED_FS=1 python story_worker.py run --db /mnt/stories/story_jobs.db --workers 3
+    python story_worker.py status --json
+"""
+
+import sys
+import json
+import time
+import signal
+import logging
+import argparse
+from pathlib import Path
+from typing import Dict
+
+from instrumentation import recorder
+from memory_budget import DEFAULT_LIMIT_MB, budget
+from run_budget import RunScheduler, parse_call_caps, parse_deadline
+from story_daemon import (
+    JOBS_DB, LEASE_SECONDS, POLL_INTERVAL, StoryDaemon, connect, queue_depth, submit_job, validate_request
+)
+
+logger = logging.getLogger(__name__)
+
+# Constants
+DEFAULT_WORKERS = 2
+DRAIN_CHECK_INTERVAL = 5.0  # seconds between "is the queue empty?" checks with --until-empty
+
+
+def enqueue(db_path: Path, stories: int, segments: int, priority: int = 0, voice: str = "nova",
+            use_idea_pool: bool = True) -> int:
+    """Queue a batch of stories. Returns the number of jobs queued.
+
+    With the idea pool, each worker draws a de-duplicated idea when it starts
+    a job. Without it, GPT-4 is asked for all the ideas now.
+    """
+    payloads = [{}] * stories
+    if not use_idea_pool:
+        # Imported here: the generator builds its OpenAI client at import time
+        from bedtime_story_generator import iter_story_ideas
+        payloads = [{"title": title, "premise": premise} for title, premise in iter_story_ideas(stories)]
+    requests = [validate_request(dict(payload, segments=segments, priority=priority, voice=voice), segments)
+                for payload in payloads]
+    conn = connect(db_path)
+    try:
+        for request in requests:
+            submit_job(conn, request)
+    finally:
+        conn.close()
+    return len(requests)
+
+
+def queue_status(db_path: Path) -> Dict:
+    """Job counts by status and the leases currently held, per worker."""
+    conn = connect(db_path)
+    try:
+        now = time.time()
+        leases = [
+            {"job": row["id"], "worker": row["worker"], "progress": row["progress"],
+             "expires_in": round(row["lease_expires"] - now, 1) if row["lease_expires"] else None}
+            for row in conn.execute(
+                "SELECT id, worker, progress, lease_expires FROM story_jobs WHERE status = 'running' ORDER BY id"
+            )
+        ]
+        return {"jobs": queue_depth(conn), "leases": leases}
+    finally:
+        conn.close()
+
+
+def run_node(daemon: StoryDaemon, until_empty: bool = False) -> None:
+    """Run daemon's workers until stopped or, with until_empty, until no job is pending or running.
+
+    A node whose run budget fits none of the jobs left stops once its running jobs finish.
+    """
+    daemon.start_workers()
+    last_check = time.monotonic()
+    while not daemon.stop.wait(POLL_INTERVAL):
+        if daemon.closed.is_set():
+            with daemon.busy_lock:
+                busy = daemon.busy
+            if not busy:
+                logger.info("Run budget reached; stopping")
+                daemon.stop.set()
+            continue
+        if not until_empty or time.monotonic() - last_check < DRAIN_CHECK_INTERVAL:
+            continue
+        last_check = time.monotonic()
+        with daemon.db_lock:
+            depth = queue_depth(daemon.conn)
+        # Running jobs on other nodes count too: if one of them dies, its job needs a worker here
+        if not depth.get("pending") and not depth.get("running"):
+            logger.info("Queue is empty; stopping")
+            daemon.stop.set()
+
+
+def main():
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+    parser = argparse.ArgumentParser(description="Generate stories on several nodes from one shared job queue")
+    parser.add_argument("--db", default=str(JOBS_DB), help=f"Shared jobs database (default: {JOBS_DB})")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    enqueue_parser = commands.add_parser("enqueue", help="Queue a batch of stories")
+    enqueue_parser.add_argument("--stories", type=int, required=True, help="Stories to queue")
+    enqueue_parser.add_argument("--segments", type=int, default=10, help="Segments per story (default: 10)")
+    enqueue_parser.add_argument("--priority", type=int, default=0, help="Job priority (default: 0)")
+    enqueue_parser.add_argument("--voice", default="nova", help="TTS voice (default: nova)")
+    enqueue_parser.add_argument("--no-idea-pool", action="store_true", help="Ask GPT-4 for the ideas now instead of drawing them from idea_pool.db")
+
+    run_parser = commands.add_parser("run", help="Run story workers on this node")
+    run_parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help=f"Workers on this node (default: {DEFAULT_WORKERS})")
+    run_parser.add_argument("--node-id", help="Name of this node in job leases (default: host name and process id)")
+    run_parser.add_argument("--lease", type=float, default=LEASE_SECONDS,
+                            help=f"Seconds before a dead node's job is reclaimed (default: {LEASE_SECONDS})")
+    run_parser.add_argument("--until-empty", action="store_true", help="Exit once no job is pending or running")
+    run_parser.add_argument("--budget", type=float, help="This node's budget in USD; jobs start only while they fit")
+    run_parser.add_argument("--max-calls", default="", help="This node's per-model call caps, e.g. dall-e-3=200,tts-1=20")
+    run_parser.add_argument("--deadline", help="Start only jobs that can finish by a clock time (06:30) or within a duration (2h)")
+    run_parser.add_argument("--memory-budget", type=int, default=DEFAULT_LIMIT_MB,
+                            help=f"MB of payloads this node may hold in memory at once (default: {DEFAULT_LIMIT_MB})")
+
+    status_parser = commands.add_parser("status", help="Show the queue and the held leases")
+    status_parser.add_argument("--json", action="store_true", help="Print JSON")
+    args = parser.parse_args()
+    db_path = Path(args.db)
+
+    if args.command == "enqueue":
+        try:
+            queued = enqueue(db_path, args.stories, args.segments, args.priority, args.voice, not args.no_idea_pool)
+        except ValueError as e:
+            logger.error(str(e))
+            return 1
+        print(f"Queued {queued} stories in {db_path}")
+        return 0
+
+    if args.command == "status":
+        status = queue_status(db_path)
+        if args.json:
+            print(json.dumps(status, indent=2))
+            return 0
+        print(", ".join(f"{state}: {count}" for state, count in sorted(status["jobs"].items())) or "No jobs")
+        for lease in status["leases"]:
+            expiry = f"{lease['expires_in']:.0f}s" if lease["expires_in"] is not None else "no lease"
+            print(f"  job {lease['job']:>5}  {lease['worker'] or '-':<30} {expiry:>8}  {lease['progress'] or ''}")
+        return 0
+
+    try:
+        call_caps = parse_call_caps(args.max_calls)
+        deadline = parse_deadline(args.deadline) if args.deadline else None
+    except ValueError as e:
+        logger.error(str(e))
+        return 1
+    scheduler = RunScheduler(args.budget, call_caps, deadline) if args.budget is not None or call_caps or deadline else None
+
+    budget.configure(args.memory_budget * 1024 * 1024)
+    daemon = StoryDaemon(db_path, args.workers, node_id=args.node_id, lease=args.lease, scheduler=scheduler)
+
+    def request_shutdown(signum, frame):
+        logger.info("Shutting down: finishing in-flight steps and checkpointing jobs...")
+        daemon.stop.set()
+
+    signal.signal(signal.SIGINT, request_shutdown)
+    signal.signal(signal.SIGTERM, request_shutdown)
+    # Each node's events go to run_logs/ like a generator run, so run_budget.py learns from them too
+    recorder.start_run("story_worker", node=daemon.node_id, workers=args.workers)
+    run_node(daemon, args.until_empty)
+    daemon.shutdown()
+    recorder.finish_run(node=daemon.node_id, run_budget=scheduler.stats() if scheduler is not None else None)
+    if scheduler is not None:
+        stats = scheduler.stats()
+        logger.info(f"Run budget: {stats['admitted']} jobs admitted, ${stats['spent']:.2f} spent, calls {stats['calls']}")
+    logger.info(f"Node {daemon.node_id} stopped")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())